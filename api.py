@@ -0,0 +1,380 @@
+from typing import Callable, Iterator, Optional
+import json
+
+from flask import Blueprint, Response, g, jsonify, request, stream_with_context, url_for
+
+from base import Arena
+from equipment import Equipment, PAGE_SIZE
+from jobs import jobs, load_job_request, QueueFullError
+from matchups import get_matchup_table
+from metrics import registry as metrics_registry
+from policies import PLAYER_POLICIES, POLICY_HIT
+from sessions import backend, current_game, GameSession, MemoryStateBackend, StaleGameError
+from unit import BaseUnit
+from win_odds import battle_odds, LiveOdds
+
+
+api: Blueprint = Blueprint('api', __name__, url_prefix='/api')
+
+MAX_PAGE_SIZE: int = 500
+KEEPALIVE: float = 15
+RETRY_MS: int = 3000
+
+play_streams = metrics_registry.counter('sse_streams_total', 'Server-Sent Events streams opened.', kind='play')
+watch_streams = metrics_registry.counter('sse_streams_total', 'Server-Sent Events streams opened.', kind='watch')
+
+
+def _unit_state(unit: BaseUnit) -> dict[str, float]:
+    """
+    The _unit_state function returns the values of a character that change during the battle.
+    """
+    return {'health_points': unit.health_points, 'stamina_points': unit.stamina_points}
+
+
+def _unit_info(unit: BaseUnit) -> dict:
+    """
+    The _unit_info function returns all values of a character shown on the fight screen.
+    """
+    return {
+        'name': unit.name,
+        'unit_class': unit.unit_class.name,
+        'max_health': unit.unit_class.max_health,
+        'max_stamina': unit.unit_class.max_stamina,
+        'weapon': unit.weapon.name,
+        'armor': unit.armor.name,
+        **_unit_state(unit),
+    }
+
+
+def _odds(arena: Arena) -> Optional[dict[str, float]]:
+    """
+    The _odds function returns the chances of a win, a draw and a loss of the player in the running battle
+    with the number of the moves made before the state they were computed for and whether they are stale,
+    or None if they are not known yet.
+    """
+    odds: Optional[LiveOdds] = battle_odds(arena)
+    return odds._asdict() if odds is not None else None
+
+
+def _delta(arena: Arena, messages: list[str]) -> dict:
+    """
+    The _delta function returns the changes made by one move: health and stamina of both characters,
+    the messages of the move, the status of the game and the chances of the player.
+    """
+    if not arena.game_is_running and arena.battle_resault and arena.battle_resault not in messages:
+        messages.append(arena.battle_resault)
+    return {
+        'player': _unit_state(arena.player),
+        'enemy': _unit_state(arena.enemy),
+        'messages': messages,
+        'game_is_running': arena.game_is_running,
+        'battle_result': arena.battle_resault,
+        'odds': _odds(arena),
+    }
+
+
+def _not_ready() -> tuple[Response, int]:
+    return jsonify({'error': 'Герои не выбраны'}), 409
+
+
+def _move(action: Callable[[Arena], str]) -> tuple[Response, int]:
+    """
+    The _move function performs an action of the player in the arena of the current session, if the game
+    is running, and returns the changes made by it.
+    """
+    game: GameSession = current_game()
+    if not game.heroes_are_chosen or game.arena.player is ...:
+        return _not_ready()
+    arena = game.arena
+    with game.lock:
+        messages = []
+        if arena.game_is_running:
+            action(arena)
+            messages = list(arena.messages)
+        delta = _delta(arena, messages)
+    return jsonify(delta), 200
+
+
+def _sse(event: str, data: dict, event_id: Optional[int] = None) -> str:
+    """
+    The _sse function formats one event of a Server-Sent Events stream with the name, the data in JSON
+    and optionally the id, which the browser sends back in the Last-Event-ID header when it reconnects.
+    """
+    head = f"id: {event_id}\n" if event_id is not None else ''
+    return f"{head}event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _end(arena: Arena) -> str:
+    return _sse('end', {'game_is_running': arena.game_is_running, 'battle_result': arena.battle_resault})
+
+
+def _play_stream(game: GameSession, session_id: str, policy: str) -> Iterator[str]:
+    """
+    The _play_stream function is a generator of the events of a battle resolved by the policy of the player.
+    Every step of the generator makes one move of arena.play() under the lock of the game and yields it
+    as a "move" event with the messages, the records of the log and the state of both characters,
+    the last event is "end" with the result. The next move is made only when the server has sent
+    the previous event, so a slow client slows the battle down instead of filling a buffer.
+    The game is stored in the backend when the stream ends, also when the client disconnects, unless another
+    request has changed it in the meantime.
+    """
+    play_streams.inc()
+    arena = game.arena
+    moves = arena.play(policy)
+    try:
+        yield f"retry: {RETRY_MS}\n\n"
+        turn = 0
+        while True:
+            with game.lock:
+                start = len(arena.log)
+                result = next(moves, None)
+                if result is None:
+                    break
+                turn += 1
+                data = {
+                    'turn': turn,
+                    'messages': list(arena.messages),
+                    'events': [event._asdict() for event in arena.log.replay(start)],
+                    'game_is_running': arena.game_is_running,
+                    'player': _unit_state(arena.player),
+                    'enemy': _unit_state(arena.enemy),
+                }
+                records = len(arena.log)
+            yield _sse('move', data, records)
+        yield _end(arena)
+    finally:
+        moves.close()
+        try:
+            backend.save(session_id, game)
+        except StaleGameError:
+            pass
+
+
+def _event_stream(events: Iterator[str]) -> Response:
+    """
+    The _event_stream function returns the response that sends the events of the generator one by one.
+    The buffering of the response by a proxy is disabled, so every event reaches the client as it is made.
+    """
+    response = Response(stream_with_context(events), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def _find_game(session_id: str) -> Optional[GameSession]:
+    """
+    The _find_game function returns the game of the session for the spectators without creating a new one,
+    or None if there is no such game.
+    """
+    if isinstance(backend, MemoryStateBackend):
+        return backend.games.get(session_id)
+    return backend.load(session_id)
+
+
+def _watch_stream(game: GameSession) -> Iterator[str]:
+    """
+    The _watch_stream function is a generator of the events of a battle for a spectator. It yields the records
+    of the log of the arena already made as "turn" events, then waits on the log for the next records
+    and yields them as they are made, until the battle ends. All spectators read the same log of the battle
+    and only keep the number of the records they have sent and the generation of the log. The log is read
+    under the lock of the game, so a move is seen whole, and the waiting does not poll the game,
+    a comment is sent every KEEPALIVE seconds without moves to keep the connection open.
+    A new battle started in the same arena changes the generation of the log and is announced
+    with the "reset" event.
+    When the games are kept in SQLite, the spectator gets the state stored by the last request.
+    """
+    watch_streams.inc()
+    arena = game.arena
+    live = isinstance(backend, MemoryStateBackend)
+    sent = 0
+    generation = arena.log.generation
+    yield f"retry: {RETRY_MS}\n\n"
+    while True:
+        with game.lock:
+            log = arena.log
+            restarted = log.generation != generation
+            generation = log.generation
+            events = [event._asdict() for event in log.replay(0 if restarted else sent)]
+            finished = not live or (not arena.game_is_running and arena.battle_resault is not None)
+            end = _end(arena) if finished else None
+        if restarted:
+            sent = 0
+            yield _sse('reset', {})
+        for event in events:
+            sent += 1
+            yield _sse('turn', event)
+        if end is not None:
+            yield end
+            return
+        if not log.wait(sent, generation, KEEPALIVE):
+            yield ": keepalive\n\n"
+
+
+@api.route("/fight/", methods=['post'])
+def start_fight() -> tuple[Response, int]:
+    """
+    The view processes POST requests at "/api/fight/", starts the battle of the chosen heroes like "/fight/"
+    and returns the full information about both characters once and the address of the stream for spectators.
+    """
+    game = current_game()
+    if not game.heroes_are_chosen:
+        return _not_ready()
+    with game.lock:
+        game.arena.start_game(player=game.heroes['player'], enemy=game.heroes['enemy'])
+        info = {
+            'player': _unit_info(game.arena.player),
+            'enemy': _unit_info(game.arena.enemy),
+            'messages': [],
+            'game_is_running': True,
+            'battle_result': None,
+            'odds': _odds(game.arena),
+            'watch_url': url_for('api.watch_fight', game_id=g.game_id),
+        }
+    return jsonify(info), 200
+
+
+@api.route("/fight/hit", methods=['post'])
+def hit() -> tuple[Response, int]:
+    """
+    The view processes POST requests at "/api/fight/hit", calls arena.player_hit() and returns the changes.
+    """
+    return _move(Arena.player_hit)
+
+
+@api.route("/fight/use-skill", methods=['post'])
+def use_skill() -> tuple[Response, int]:
+    """
+    The view processes POST requests at "/api/fight/use-skill", calls arena.player_use_skill()
+    and returns the changes.
+    """
+    return _move(Arena.player_use_skill)
+
+
+@api.route("/fight/pass-turn", methods=['post'])
+def pass_turn() -> tuple[Response, int]:
+    """
+    The view processes POST requests at "/api/fight/pass-turn", calls arena.player_pass_turn()
+    and returns the changes.
+    """
+    return _move(Arena.player_pass_turn)
+
+
+@api.route("/fight/auto", methods=['post'])
+def auto_battle() -> tuple[Response, int]:
+    """
+    The view processes POST requests at "/api/fight/auto", takes the policy of the player in JSON,
+    starts a new battle of the chosen heroes unless one is running, resolves it with arena.auto_battle()
+    and returns the final state of both characters and the full log of the battle.
+    """
+    game = current_game()
+    if not game.heroes_are_chosen:
+        return _not_ready()
+    policy = (request.get_json(silent=True) or {}).get('policy', POLICY_HIT)
+    if policy not in PLAYER_POLICIES:
+        return jsonify({'error': {'policy': [f'Must be one of: {", ".join(PLAYER_POLICIES)}.']}}), 400
+    arena = game.arena
+    with game.lock:
+        if not arena.game_is_running:
+            arena.start_game(player=game.heroes['player'], enemy=game.heroes['enemy'])
+        turns = arena.auto_battle(policy)
+        result = {
+            'player': _unit_info(arena.player),
+            'enemy': _unit_info(arena.enemy),
+            'turns': turns,
+            'log': [event._asdict() for event in arena.log.replay()],
+            'game_is_running': arena.game_is_running,
+            'battle_result': arena.battle_resault,
+        }
+    return jsonify(result), 200
+
+
+@api.route("/fight/stream")
+def stream_battle() -> tuple[Response, int]:
+    """
+    The view processes GET requests at "/api/fight/stream", takes the policy of the player in the query string,
+    starts a new battle of the chosen heroes unless one is running and streams its moves as Server-Sent Events
+    while they are made, the first move is sent before the second one is made. A browser that reconnects
+    after a lost connection sends the Last-Event-ID header, then the battle is continued, and if it has ended
+    in the meantime, only its result is sent instead of starting a new one.
+    """
+    game = current_game()
+    if not game.heroes_are_chosen:
+        return _not_ready()
+    policy = request.args.get('policy', POLICY_HIT)
+    if policy not in PLAYER_POLICIES:
+        return jsonify({'error': {'policy': [f'Must be one of: {", ".join(PLAYER_POLICIES)}.']}}), 400
+    resumed = 'Last-Event-ID' in request.headers
+    with game.lock:
+        if not game.arena.game_is_running and not resumed:
+            game.arena.start_game(player=game.heroes['player'], enemy=game.heroes['enemy'])
+    return _event_stream(_play_stream(game, g.game_id, policy)), 200
+
+
+@api.route("/fight/<game_id>/watch")
+def watch_fight(game_id: str) -> tuple[Response, int]:
+    """
+    The view processes GET requests at "/api/fight/<game_id>/watch" and streams the moves of the battle
+    of the game to a spectator as Server-Sent Events while they are made.
+    """
+    game = _find_game(game_id)
+    if game is None or game.arena.player is ...:
+        return jsonify({'error': 'Бой не найден'}), 404
+    return _event_stream(_watch_stream(game)), 200
+
+
+@api.route("/equipment/<kind>")
+def search_equipment(kind: str) -> tuple[Response, int]:
+    """
+    The view processes GET requests at "/api/equipment/weapons" and "/api/equipment/armors", takes the beginning
+    of the name, the name after which the page starts and the size of the page in the query string
+    and returns the page of names and the value of "after" for the next page.
+    """
+    if kind not in ('weapons', 'armors'):
+        return jsonify({'error': 'Неизвестный вид снаряжения'}), 404
+    limit = min(request.args.get('limit', PAGE_SIZE, type=int), MAX_PAGE_SIZE)
+    search = Equipment().search_weapons if kind == 'weapons' else Equipment().search_armors
+    page = search(request.args.get('prefix', ''), request.args.get('after', ''), max(limit, 1))
+    return jsonify({'names': page.names, 'next_after': page.next_after}), 200
+
+
+@api.route("/matchups/")
+def get_matchup() -> tuple[Response, int]:
+    """
+    The view processes GET requests at "/api/matchups/", takes the names of the attacker class, its weapon,
+    the defender class and its armor in the query string and returns the precomputed preview of the matchup.
+    """
+    preview = get_matchup_table().get(request.args.get('attacker_class', ''), request.args.get('weapon', ''),
+                                       request.args.get('defender_class', ''), request.args.get('armor', ''))
+    if preview is None:
+        return jsonify({'error': 'Неизвестное сочетание'}), 404
+    return jsonify(preview.to_dict()), 200
+
+
+@api.route("/jobs/", methods=['post'])
+def create_job() -> tuple[Response, int]:
+    """
+    The view processes POST requests at "/api/jobs/", takes the setups of the player and the enemy
+    and the number of fights in JSON, queues the simulation and returns the id of the job at once.
+    Returns 429 if the queue of jobs is full.
+    """
+    try:
+        job_request = load_job_request(request.get_json(silent=True) or {})
+    except ValueError as error:
+        return jsonify({'error': error.args[0]}), 400
+    try:
+        job = jobs.submit(job_request)
+    except QueueFullError:
+        return jsonify({'error': 'Очередь заданий заполнена'}), 429
+    return jsonify({'job_id': job.id, 'status_url': url_for('api.get_job', job_id=job.id)}), 202
+
+
+@api.route("/jobs/<job_id>")
+def get_job(job_id: str) -> tuple[Response, int]:
+    """
+    The view processes GET requests at "/api/jobs/<job_id>" and returns the progress and the aggregated
+    results of the job.
+    """
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Задание не найдено'}), 404
+    return jsonify(job.to_dict()), 200
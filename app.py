@@ -1,22 +1,40 @@
+from time import perf_counter
+
+IMPORT_STARTED: float = perf_counter()
+
 from typing import Type, Optional, Union
+import os
 
 import werkzeug
-from flask import Flask, render_template, request, redirect, url_for, Response
+from flask import Blueprint, Flask, render_template, request, redirect, url_for, Response
 
-from base import Arena
+from api import api
+from battle_stats import stats_view
 from classes import unit_classes
-from equipment import Equipment
+from enemy_ai import SmartEnemyUnit
+from equipment import Equipment, get_catalog
+from http_cache import cached_page
+from matchups import get_matchup_table, classes_version
+from metrics import instrument_app, registry as metrics_registry, UNMONITORED
+from policies import PLAYER_POLICIES, POLICY_HIT
+from profiling import install_profiler
+from sessions import current_game, peek_game, save_current_game
 from unit import PlayerUnit, EnemyUnit, BaseUnit
+from win_odds import battle_odds
 
 
-app: Flask = Flask(__name__)
+IMPORT_DURATION: float = perf_counter() - IMPORT_STARTED
+WARM_UP_PAGES: tuple[str, ...] = ('/', '/choose-hero/')
+SECRET_KEY_PATH: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'secret_key')
+EQUIPMENT_PARAMS: tuple[str, ...] = ('weapon_prefix', 'armor_prefix', 'weapon_after', 'armor_after')
 
-heroes: dict[str, Union[PlayerUnit, EnemyUnit, ellipsis]] = {"player": ..., "enemy": ...}
+startup_timings: dict[str, float] = {}
 
-arena: Arena =  Arena()
+pages: Blueprint = Blueprint('pages', __name__)
 
 
-@app.route("/")
+@pages.route("/")
+@cached_page('index.html')
 def menu_page() -> str:
     """
     The view processes GET requests at the address '/' and loads the main menu of the application.
@@ -24,70 +42,143 @@ def menu_page() -> str:
     return render_template('index.html')
 
 
-@app.route("/fight/")
-def start_fight() -> str:
+@pages.route("/fight/")
+def start_fight() -> Union[str, Response]:
     """
     The view processes GET requests at "/fight/", executes the start_game function, and passes an instance
-    of the arena class the necessary arguments.
+    of the arena class of the current session the necessary arguments. If the heroes of the session
+    have not been chosen, navigates to the main menu.
     """
-    arena.start_game(player=heroes['player'], enemy=heroes['enemy'])
-    return render_template('fight.html', heroes=heroes)
+    game = current_game()
+    if not game.heroes_are_chosen:
+        return redirect(url_for('pages.menu_page'))
+    with game.lock:
+        game.arena.start_game(player=game.heroes['player'], enemy=game.heroes['enemy'])
+        return render_template('fight.html', heroes=game.heroes, odds=battle_odds(game.arena))
 
-@app.route("/fight/hit")
-def hit() -> str:
+@pages.route("/fight/hit")
+def hit() -> Union[str, Response]:
     """
     The view processes GET requests at the address "/fight/hit", represents a strike button, updates
     the fight screen (strike) (template fight.html ), if the game is running, the player.hit() method
     of the arena class instance is called, if the game is not running, it skips the method triggering
     (just render the template with the current data)
     """
-    if arena.game_is_running:
-        result = arena.player_hit()
-    if not arena.game_is_running:
-        result = arena.battle_resault
-    return render_template('fight.html', heroes=heroes, result=result)
+    game = current_game()
+    if not game.heroes_are_chosen:
+        return redirect(url_for('pages.menu_page'))
+    arena = game.arena
+    with game.lock:
+        if arena.game_is_running:
+            result = arena.player_hit()
+        if not arena.game_is_running:
+            result = arena.battle_resault
+        return render_template('fight.html', heroes=game.heroes, result=result, odds=battle_odds(arena))
 
 
-@app.route("/fight/use-skill")
-def use_skill() -> str:
+@pages.route("/fight/use-skill")
+def use_skill() -> Union[str, Response]:
     """
     The view processes GET requests at the address "/fight/use-skill", represents a skill use button,
     updates the battle screen (striking) (template fight.html ), if the game is running,
     the player.hit() method of the arena class instance is called, if the game is not running,
     it skips the method triggering (just render template with current data)
     """
-    if arena.game_is_running:
-        result = arena.player_use_skill()
-    if not arena.game_is_running:
-        result = arena.battle_resault
-    return render_template('fight.html', heroes=heroes, result=result)
+    game = current_game()
+    if not game.heroes_are_chosen:
+        return redirect(url_for('pages.menu_page'))
+    arena = game.arena
+    with game.lock:
+        if arena.game_is_running:
+            result = arena.player_use_skill()
+        if not arena.game_is_running:
+            result = arena.battle_resault
+        return render_template('fight.html', heroes=game.heroes, result=result, odds=battle_odds(arena))
 
 
-@app.route("/fight/pass-turn")
-def pass_turn() -> str:
+@pages.route("/fight/pass-turn")
+def pass_turn() -> Union[str, Response]:
     """
     The view processes GET requests at the address "/fight/pass-turn", represents the skip move button,
-    updates the fight screen (template fight.html ), if the game is going on - calls the next move function
-    (arena.next_turn()), if the game is not going on - skips triggering the method (just render
+    updates the fight screen (template fight.html ), if the game is going on - calls the skip move function
+    (arena.player_pass_turn()), if the game is not going on - skips triggering the method (just render
     the template with the current data).
     """
-    if arena.game_is_running:
-        result = arena.next_turn()
-    if not arena.game_is_running:
-        result = arena.battle_resault
-    return render_template('fight.html', heroes=heroes, result=result)
+    game = current_game()
+    if not game.heroes_are_chosen:
+        return redirect(url_for('pages.menu_page'))
+    arena = game.arena
+    with game.lock:
+        if arena.game_is_running:
+            result = arena.player_pass_turn()
+        if not arena.game_is_running:
+            result = arena.battle_resault
+        return render_template('fight.html', heroes=game.heroes, result=result, odds=battle_odds(arena))
 
 
-@app.route("/fight/end-fight")
+@pages.route("/fight/auto")
+def auto_battle() -> Union[str, Response]:
+    """
+    The view processes GET requests at the address "/fight/auto", represents the auto battle button,
+    resolves the running battle with the policy from the query string (arena.auto_battle())
+    and renders the fight screen (template fight.html) with the result of the battle.
+    """
+    game = current_game()
+    if not game.heroes_are_chosen:
+        return redirect(url_for('pages.menu_page'))
+    policy = request.args.get('policy', POLICY_HIT)
+    if policy not in PLAYER_POLICIES:
+        policy = POLICY_HIT
+    arena = game.arena
+    with game.lock:
+        if arena.game_is_running:
+            arena.auto_battle(policy)
+        return render_template('fight.html', heroes=game.heroes, result=arena.battle_resault)
+
+
+@pages.route("/fight/end-fight")
 def end_fight() -> str:
     """
     The view processes GET requests at the address "/fight/end-fight", represents the end game button,
     navigates to the main menu.
     """
-    return render_template("index.html", heroes=heroes)
+    return render_template("index.html", heroes=current_game().heroes)
+
+
+def _player_setup() -> Optional[tuple[str, str]]:
+    """
+    The _player_setup function returns the class and the weapon of the player of the session,
+    the previews on the page of selecting the enemy depend on them.
+    """
+    game = peek_game()
+    player = game.heroes['player'] if game is not None else None
+    if player is None:
+        return None
+    return player.unit_class.name, player.weapon.name if player.weapon is not None else None
+
+
+def _equipment_pages() -> dict[str, Union[str, list, None]]:
+    """
+    The _equipment_pages function returns the pages of the names of weapons and armors for the form
+    of selecting a character, with the search and the position of the page taken from the query string.
+    """
+    equipment = Equipment()
+    weapon_prefix = request.args.get('weapon_prefix', '')
+    armor_prefix = request.args.get('armor_prefix', '')
+    weapons = equipment.search_weapons(weapon_prefix, request.args.get('weapon_after', ''))
+    armors = equipment.search_armors(armor_prefix, request.args.get('armor_after', ''))
+    return {
+        'weapons': weapons.names,
+        'armors': armors.names,
+        'weapon_prefix': weapon_prefix,
+        'armor_prefix': armor_prefix,
+        'weapons_next': weapons.next_after,
+        'armors_next': armors.next_after,
+    }
 
 
-@app.route("/choose-hero/", methods=['post', 'get'])
+@pages.route("/choose-hero/", methods=['post', 'get'])
+@cached_page('hero_choosing.html', params=EQUIPMENT_PARAMS)
 def choose_hero() -> Union[str, Response]:
     """
     The view processes GET and POST requests at the address "/fight/choose-hero", is a form of selecting
@@ -96,14 +187,10 @@ def choose_hero() -> Union[str, Response]:
     """
     if request.method == 'GET':
         header = 'Выберите героя'
-        equipment = Equipment()
-        weapons = equipment.get_weapons_names()
-        armors = equipment.get_armors_names()
         result = {
             'header': header,
-            'weapons': weapons,
-            'armors': armors,
-            'classes': unit_classes
+            'classes': unit_classes,
+            **_equipment_pages()
         }
         return render_template('hero_choosing.html', result=result)
 
@@ -115,11 +202,12 @@ def choose_hero() -> Union[str, Response]:
         player = PlayerUnit(name=name, unit_class=unit_classes.get(unit_class))
         player.equip_armor(Equipment().get_armor(armor_name))
         player.equip_weapon(Equipment().get_weapon(weapon_name))
-        heroes['player'] = player
-        return redirect(url_for('choose_enemy'))
+        current_game().heroes['player'] = player
+        return redirect(url_for('pages.choose_enemy'))
 
 
-@app.route("/choose-enemy/", methods=['post', 'get'])
+@pages.route("/choose-enemy/", methods=['post', 'get'])
+@cached_page('hero_choosing.html', variant=_player_setup, params=EQUIPMENT_PARAMS)
 def choose_enemy() -> Union[str, werkzeug.wrappers.response.Response]:
     """
     The view processes GET and POST requests at the address "/fight/choose-enimy", is a form of selecting
@@ -128,13 +216,15 @@ def choose_enemy() -> Union[str, werkzeug.wrappers.response.Response]:
     """
     if request.method == 'GET':
         header = 'Выберите соперника'
-        equipment = Equipment()
-        weapons = equipment.get_weapons_names()
-        armors = equipment.get_armors_names()
         result: dict[str, Union[str, list]] = {'header': header,
-                                               'weapons': weapons,
-                                               'armors': armors,
-                                               'classes': unit_classes }
+                                               'classes': unit_classes,
+                                               'smart_enemy': True,
+                                               **_equipment_pages()}
+        game = peek_game()
+        player = game.heroes['player'] if game is not None else None
+        if player is not None and player.weapon is not None:
+            result['previews'] = get_matchup_table().against(player.unit_class.name, player.weapon.name,
+                                                             result['armors'])
         return render_template('hero_choosing.html', result=result)
 
     if request.method == 'POST':
@@ -142,12 +232,96 @@ def choose_enemy() -> Union[str, werkzeug.wrappers.response.Response]:
         weapon_name = request.form['weapon']
         armor_name = request.form['armor']
         unit_class = request.form['unit_class']
-        enemy = EnemyUnit(name=name, unit_class=unit_classes.get(unit_class))
+        enemy_type = SmartEnemyUnit if request.form.get('smart') else EnemyUnit
+        enemy = enemy_type(name=name, unit_class=unit_classes.get(unit_class))
         enemy.equip_armor(Equipment().get_armor(armor_name))
         enemy.equip_weapon(Equipment().get_weapon(weapon_name))
-        heroes['enemy'] = enemy
-        return redirect(url_for('start_fight'))
+        current_game().heroes['enemy'] = enemy
+        return redirect(url_for('pages.start_fight'))
+
+
+def warm_up(app: Flask) -> dict[str, float]:
+    """
+    The warm_up function prepares the application before it takes the first request: compiles all templates,
+    loads and indexes the equipment catalog, builds the matchup previews of unit_classes and renders
+    the cached pages. The requests of the warm-up are not counted in the metrics of the requests.
+    Returns the time of every step in seconds.
+    """
+    timings = {}
+    started = perf_counter()
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+    timings['templates'] = perf_counter() - started
+    started = perf_counter()
+    get_catalog()
+    classes_version()
+    timings['catalog'] = perf_counter() - started
+    started = perf_counter()
+    get_matchup_table()
+    timings['matchups'] = perf_counter() - started
+    started = perf_counter()
+    client = app.test_client()
+    for path in WARM_UP_PAGES:
+        client.get(path, environ_base={UNMONITORED: True})
+    timings['pages'] = perf_counter() - started
+    return timings
+
+
+def secret_key() -> bytes:
+    """
+    The secret_key function returns the key the sessions are signed with: the SECRET_KEY environment variable,
+    or the key kept in the SECRET_KEY_FILE file, data/secret_key by default. The file is created with a random
+    key by the first process that needs it, so all workers on the host and the restarts share one key.
+    """
+    key = os.environ.get('SECRET_KEY')
+    if key:
+        return key.encode()
+    path = os.environ.get('SECRET_KEY_FILE') or SECRET_KEY_PATH
+    if not os.path.exists(path):
+        temporary = f'{path}.{os.getpid()}'
+        with open(temporary, 'wb') as key_file:
+            key_file.write(os.urandom(24).hex().encode())
+        os.chmod(temporary, 0o600)
+        try:
+            # the link fails if another process has created the file in the meantime, its key is used then
+            os.link(temporary, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(temporary)
+    with open(path, 'rb') as key_file:
+        return key_file.read().strip()
+
+
+def create_app(warm_up_app: bool = True) -> Flask:
+    """
+    The create_app function creates and configures the application: registers the pages and the API,
+    the saving of the games, the statistics of the battles, the metrics and the profiler, and, unless
+    warm_up_app is False, warms it up. The time of importing the application and of warming it up is logged,
+    kept in app.config["STARTUP_TIMINGS"] and exported as metrics of the last created application.
+    """
+    app = Flask(__name__)
+    app.secret_key = secret_key()
+    app.register_blueprint(pages)
+    app.register_blueprint(api)
+    app.after_request(save_current_game)
+    app.add_url_rule('/stats', 'stats', stats_view)
+    instrument_app(app)
+    install_profiler(app)
+    timings = {'import': IMPORT_DURATION}
+    if warm_up_app:
+        started = perf_counter()
+        timings.update(warm_up(app))
+        timings['warm_up'] = perf_counter() - started
+    app.config['STARTUP_TIMINGS'] = timings
+    startup_timings.clear()
+    startup_timings.update(timings)
+    for step in timings:
+        metrics_registry.gauge('app_startup_duration_seconds', 'Time spent importing and warming up the application.',
+                               lambda step=step: startup_timings.get(step, 0), step=step)
+    app.logger.info('startup: %s', ', '.join(f'{step} {duration * 1000:.1f} ms' for step, duration in timings.items()))
+    return app
 
 
 if __name__ == "__main__":
-    app.run(debug=True)
+    create_app().run(debug=True)
@@ -0,0 +1,392 @@
+from dataclasses import dataclass, asdict
+from fnmatch import fnmatch
+from multiprocessing import Pool
+from typing import Optional
+import argparse
+import json
+import math
+import os
+import sys
+import time
+
+import numpy as np
+
+from classes import unit_classes
+from equipment import Armor, Equipment, Weapon
+from simulator import FighterParams, POLICIES, POLICY_HIT, simulate
+
+
+Setup = tuple[str, str, str]
+
+STAGES: tuple[int, ...] = (1000, 4000, 16000)
+Z_SCORE: float = 3.0
+TOLERANCE: float = 0.03
+BOUNDS: float = 0.5
+SIGMA: float = 0.1
+MIN_SIGMA: float = 0.005
+MAX_SIGMA: float = 0.5
+
+CLASS_FIELDS: tuple[str, ...] = ('max_health', 'max_stamina', 'attack', 'stamina', 'armor')
+SKILL_FIELDS: tuple[str, ...] = ('stamina', 'damage')
+WEAPON_FIELDS: tuple[str, ...] = ('min_damage', 'max_damage', 'stamina_per_hit')
+ARMOR_FIELDS: tuple[str, ...] = ('defence', 'stamina_per_turn')
+
+
+@dataclass(frozen=True)
+class Parameter:
+    """
+    The Parameter class is a dataclass that describes one tuned number: its name in the form
+    "kind:owner:field", its current value, the bounds of the search and the number of decimal places.
+    """
+    name: str
+    value: float
+    low: float
+    high: float
+    digits: int
+
+
+@dataclass(frozen=True)
+class Target:
+    """
+    The Target class is a dataclass that contains the setups of the player and the enemy of a matchup,
+    the win rate of the player the search aims at and the allowed deviation from it.
+    """
+    player: Setup
+    enemy: Setup
+    win_rate: float
+    tolerance: float = TOLERANCE
+
+
+@dataclass
+class Evaluation:
+    """
+    The Evaluation class is a dataclass with the win rates of the targets measured for a candidate,
+    the number of fights per target and the loss, the sum of the squared deviations from the targets.
+    """
+    win_rates: list[float]
+    fights: int
+    loss: float
+
+
+Values = dict[str, float]
+
+
+def _weapons(equipment: Equipment) -> list[Weapon]:
+    """
+    The _weapons function returns all weapons of the catalog through its lookups, so that it works
+    both with the equipment file and with a SQLite catalog, which does not keep the items in memory.
+    """
+    return [equipment.get_weapon(name) for name in equipment.get_weapons_names()]
+
+
+def _armors(equipment: Equipment) -> list[Armor]:
+    return [equipment.get_armor(name) for name in equipment.get_armors_names()]
+
+
+def get_parameters() -> list[Parameter]:
+    """
+    The get_parameters function returns the numbers of unit_classes, their skills and the equipment catalog
+    that can be tuned, the search may change each of them by BOUNDS of its value.
+    """
+    equipment = Equipment()
+    values = []
+    for unit_class in unit_classes.values():
+        values += [(f'class:{unit_class.name}:{field}', getattr(unit_class, field), 2) for field in CLASS_FIELDS]
+        values += [(f'skill:{unit_class.name}:{field}', getattr(unit_class.skill, field), 1) for field in SKILL_FIELDS]
+    for weapon in _weapons(equipment):
+        values += [(f'weapon:{weapon.name}:{field}', getattr(weapon, field), 1) for field in WEAPON_FIELDS]
+    for armor in _armors(equipment):
+        values += [(f'armor:{armor.name}:{field}', getattr(armor, field), 1) for field in ARMOR_FIELDS]
+    return [Parameter(name, value, round(value * (1 - BOUNDS), digits), round(value * (1 + BOUNDS), digits), digits)
+            for name, value, digits in values]
+
+
+def fighter(values: Values, setup: Setup) -> FighterParams:
+    """
+    The fighter function returns the numbers of a character with the setup, taken from the values
+    of the parameters, as FighterParams.from_equipment does.
+    """
+    class_name, weapon_name, armor_name = setup
+
+    def get(kind: str, owner: str, field: str) -> float:
+        return values[f'{kind}:{owner}:{field}']
+
+    min_damage = get('weapon', weapon_name, 'min_damage')
+    max_damage = get('weapon', weapon_name, 'max_damage')
+    return FighterParams(
+        max_health=get('class', class_name, 'max_health'),
+        max_stamina=get('class', class_name, 'max_stamina'),
+        attack=get('class', class_name, 'attack'),
+        min_damage=min(min_damage, max_damage),
+        max_damage=max(min_damage, max_damage),
+        stamina_per_hit=get('weapon', weapon_name, 'stamina_per_hit'),
+        defence=get('armor', armor_name, 'defence') * get('class', class_name, 'armor'),
+        armor_stamina=get('armor', armor_name, 'stamina_per_turn') * get('class', class_name, 'stamina'),
+        skill_stamina=get('skill', class_name, 'stamina'),
+        skill_damage=get('skill', class_name, 'damage'),
+    )
+
+
+def _loss(deviations: np.ndarray) -> float:
+    return float(np.sum(deviations ** 2))
+
+
+def evaluate(task: tuple) -> tuple[tuple, Evaluation]:
+    """
+    The evaluate function is executed in a worker process. It takes the values of a candidate, the targets,
+    the policy, the seed and the loss of the best candidate so far, and fights the targets in STAGES
+    of growing size. The evaluation stops early when the candidate is worse than the best one even with
+    the most favourable error of the measured win rates, or when all win rates are within their tolerance
+    even with the least favourable error.
+    """
+    key, targets, policy, seed, best_loss = task
+    values = dict(key)
+    wins = np.zeros(len(targets))
+    goals = np.array([target.win_rate for target in targets])
+    tolerances = np.array([target.tolerance for target in targets])
+    fights = 0
+    for stage, stage_fights in enumerate(STAGES):
+        for i, target in enumerate(targets):
+            stage_seed = int(np.random.SeedSequence(seed, spawn_key=(i, stage)).generate_state(1)[0])
+            result = simulate(fighter(values, target.player), fighter(values, target.enemy), stage_fights,
+                              policy=policy, seed=stage_seed)
+            wins[i] += result.wins
+        fights += stage_fights
+        rates = wins / fights
+        error = Z_SCORE * np.sqrt(np.maximum(rates * (1 - rates), 0.25 / fights) / fights)
+        deviations = np.abs(rates - goals)
+        if _loss(np.maximum(deviations - error, 0)) > best_loss:
+            break
+        if np.all(deviations + error <= tolerances):
+            break
+    rates = wins / fights
+    return key, Evaluation(win_rates=rates.tolist(), fights=fights, loss=_loss(rates - goals))
+
+
+def is_balanced(evaluation: Evaluation, targets: list[Target]) -> bool:
+    return all(abs(rate - target.win_rate) <= target.tolerance
+               for rate, target in zip(evaluation.win_rates, targets))
+
+
+def mutate(values: Values, parameters: list[Parameter], sigma: float, rng: np.random.Generator) -> Values:
+    """
+    The mutate function returns a copy of the values with some of the parameters multiplied
+    by a random log-normal factor with the deviation sigma, rounded and kept in their bounds.
+    """
+    candidate = dict(values)
+    chosen = rng.random(len(parameters)) < max(1 / len(parameters), 0.2)
+    if not chosen.any():
+        chosen[rng.integers(len(parameters))] = True
+    for parameter, change in zip(parameters, chosen):
+        if change:
+            value = candidate[parameter.name] * math.exp(rng.normal(0, sigma))
+            candidate[parameter.name] = round(min(max(value, parameter.low), parameter.high), parameter.digits)
+    return candidate
+
+
+def _key(values: Values) -> tuple:
+    return tuple(sorted(values.items()))
+
+
+def _setting(targets: list[Target], policy: str) -> tuple:
+    """
+    The _setting function returns the part of the key of a cached evaluation that does not depend on
+    the values: the targets, the policy of the player and the numbers of fights of the stages.
+    """
+    return tuple((target.player, target.enemy, target.win_rate, target.tolerance) for target in targets), policy, STAGES
+
+
+class BalanceSearch:
+    """
+    The BalanceSearch class searches the values of the parameters that bring the win rates of the targets
+    closest to their goals with the (1 + λ) evolution strategy: every generation evaluates λ mutations
+    of the best candidate in parallel, the step grows after an improvement or when no candidate changes
+    the win rates at all, and shrinks otherwise.
+    The evaluations are cached by the values, the targets, the policy and the stages, and can be saved to a file
+    and reused by the next search. Only the evaluations that fought all stages are cached, the ones stopped early
+    depend on the best candidate of the search they were made in.
+    """
+    def __init__(self, parameters: list[Parameter], fixed: Values, targets: list[Target],
+                 policy: str = POLICY_HIT, seed: int = 0, cache: Optional[dict] = None):
+        """
+        The "__init__" method is called when initializing the class object, takes the tuned parameters,
+        the values of the other parameters, the targets, the policy of the player, the seed and the cache.
+        """
+        self.parameters: list[Parameter] = parameters
+        self.fixed: Values = fixed
+        self.targets: list[Target] = targets
+        self.policy: str = policy
+        self.seed: int = seed
+        self.cache: dict[tuple, Evaluation] = cache if cache is not None else {}
+        self.setting: tuple = _setting(targets, policy)
+        self.evaluated: int = 0
+
+    def _evaluate_all(self, pool: Pool, candidates: list[Values], generation: int,
+                      best_loss: float) -> list[tuple[Values, Evaluation]]:
+        keys = [_key({**self.fixed, **candidate}) for candidate in candidates]
+        results = {key: self.cache[self.setting, key] for key in keys if (self.setting, key) in self.cache}
+        tasks = [(key, self.targets, self.policy, int(np.random.SeedSequence(self.seed, spawn_key=(generation, i))
+                                                         .generate_state(1)[0]), best_loss)
+                 for i, key in enumerate(dict.fromkeys(keys)) if key not in results]
+        for key, evaluation in pool.imap_unordered(evaluate, tasks):
+            results[key] = evaluation
+            self.evaluated += 1
+            if evaluation.fights == sum(STAGES):
+                self.cache[self.setting, key] = evaluation
+        return [(candidate, results[key]) for candidate, key in zip(candidates, keys)]
+
+    def run(self, generations: int, population: int, processes: Optional[int] = None,
+            time_limit: Optional[float] = None) -> tuple[Values, Evaluation]:
+        """
+        The run function defines a method of the BalanceSearch class, takes the number of generations,
+        the number of candidates in a generation, the number of worker processes and the limit of time
+        in seconds, and returns the best values found and their evaluation. The search stops early
+        when the best candidate meets all targets.
+        """
+        started = time.monotonic()
+        rng = np.random.default_rng(self.seed)
+        sigma = SIGMA
+        best = {parameter.name: parameter.value for parameter in self.parameters}
+        with Pool(processes) as pool:
+            (_, best_evaluation), = self._evaluate_all(pool, [best], 0, math.inf)
+            for generation in range(1, generations + 1):
+                if is_balanced(best_evaluation, self.targets) or sigma < MIN_SIGMA:
+                    break
+                if time_limit is not None and time.monotonic() - started > time_limit:
+                    break
+                candidates = [mutate(best, self.parameters, sigma, rng) for _ in range(population)]
+                results = self._evaluate_all(pool, candidates, generation, best_evaluation.loss)
+                candidate, evaluation = min(results, key=lambda result: result[1].loss)
+                if evaluation.loss < best_evaluation.loss:
+                    best, best_evaluation = candidate, evaluation
+                    sigma = min(sigma * 1.5, MAX_SIGMA)
+                elif all(result.loss == best_evaluation.loss for _, result in results):
+                    # all win rates are saturated at 0 or 1, larger steps are needed to leave the plateau
+                    sigma = min(sigma * 1.5, MAX_SIGMA)
+                else:
+                    sigma *= 0.7
+                print(f'generation {generation}: loss {best_evaluation.loss:.5f}, sigma {sigma:.3f}, '
+                      f'evaluated {self.evaluated}', file=sys.stderr)
+        return best, best_evaluation
+
+
+def proposal(values: Values, evaluation: Evaluation, targets: list[Target]) -> dict:
+    """
+    The proposal function returns the proposed parameters: the numbers of the classes and the skills,
+    the equipment in the format of the equipment file, and the win rates of the targets they give.
+    """
+    equipment = Equipment()
+    classes: dict[str, dict] = {}
+    skills: dict[str, dict] = {}
+    for name, value in values.items():
+        kind, owner, field = name.split(':')
+        if kind == 'class':
+            classes.setdefault(owner, {})[field] = value
+        elif kind == 'skill':
+            skills.setdefault(owner, {})[field] = value
+    weapons = [{**asdict(weapon), **{field: values.get(f'weapon:{weapon.name}:{field}', getattr(weapon, field))
+                                     for field in WEAPON_FIELDS}} for weapon in _weapons(equipment)]
+    armors = [{**asdict(armor), **{field: values.get(f'armor:{armor.name}:{field}', getattr(armor, field))
+                                   for field in ARMOR_FIELDS}} for armor in _armors(equipment)]
+    return {
+        'classes': classes,
+        'skills': skills,
+        'equipment': {'weapons': weapons, 'armors': armors},
+        'targets': [{'player': '/'.join(target.player), 'enemy': '/'.join(target.enemy),
+                     'goal': target.win_rate, 'win_rate': round(rate, 4)}
+                    for target, rate in zip(targets, evaluation.win_rates)],
+        'fights': evaluation.fights,
+        'loss': evaluation.loss,
+    }
+
+
+def parse_target(text: str, tolerance: float) -> Target:
+    """
+    The parse_target function parses a target in the form "class/weapon/armor:class/weapon/armor=win_rate".
+    """
+    matchup, win_rate = text.rsplit('=', 1)
+    player, enemy = matchup.split(':')
+    return Target(tuple(player.split('/')), tuple(enemy.split('/')), float(win_rate), tolerance)
+
+
+def default_targets(tolerance: float) -> list[Target]:
+    """
+    The default_targets function returns the targets of 50% for every pair of different classes
+    with the first weapon and the first armor of the catalog.
+    """
+    equipment = Equipment()
+    weapon, armor = equipment.get_weapons_names()[0], equipment.get_armors_names()[0]
+    return [Target((player, weapon, armor), (enemy, weapon, armor), 0.5, tolerance)
+            for player in unit_classes for enemy in unit_classes if player != enemy]
+
+
+def load_cache(path: str) -> dict[tuple, Evaluation]:
+    """
+    The load_cache function reads the evaluations saved by save_cache, the entries of the files written
+    before the targets and the policy were saved with them are skipped.
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as cache_file:
+        entries = json.load(cache_file)
+    cache = {}
+    for entry in entries:
+        if 'targets' not in entry:
+            continue
+        targets = tuple((tuple(player), tuple(enemy), win_rate, tolerance)
+                        for player, enemy, win_rate, tolerance in entry['targets'])
+        setting = (targets, entry['policy'], tuple(entry['stages']))
+        cache[setting, _key(entry['values'])] = Evaluation(**entry['evaluation'])
+    return cache
+
+
+def save_cache(cache: dict[tuple, Evaluation], path: str):
+    with open(path, 'w', encoding='utf-8') as cache_file:
+        json.dump([{'targets': targets, 'policy': policy, 'stages': stages, 'values': dict(key),
+                    'evaluation': asdict(evaluation)}
+                   for ((targets, policy, stages), key), evaluation in cache.items()],
+                  cache_file, ensure_ascii=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Searches the parameters of the classes and the equipment '
+                                                 'that give the target win rates.')
+    parser.add_argument('-t', '--target', action='append', default=[],
+                        help='"class/weapon/armor:class/weapon/armor=win_rate", 50%% for every pair of classes '
+                             'by default')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+    parser.add_argument('-p', '--params', action='append', default=[],
+                        help='tune only the parameters matching the pattern, e.g. "class:*" or "weapon:*:max_damage"')
+    parser.add_argument('-g', '--generations', type=int, default=50)
+    parser.add_argument('--population', type=int, default=os.cpu_count() * 2)
+    parser.add_argument('-j', '--processes', type=int, default=os.cpu_count())
+    parser.add_argument('--time-limit', type=float, help='seconds')
+    parser.add_argument('--policy', choices=POLICIES, default=POLICY_HIT)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--cache', help='JSON file of the evaluations kept between runs')
+    parser.add_argument('-o', '--output', help='save the proposal to a JSON file')
+    args = parser.parse_args()
+
+    targets = [parse_target(text, args.tolerance) for text in args.target] or default_targets(args.tolerance)
+    parameters = get_parameters()
+    tuned = [parameter for parameter in parameters
+             if not args.params or any(fnmatch(parameter.name, pattern) for pattern in args.params)]
+    if not tuned:
+        parser.error('no parameters match')
+    fixed = {parameter.name: parameter.value for parameter in parameters if parameter not in tuned}
+    cache = load_cache(args.cache) if args.cache else {}
+    search = BalanceSearch(tuned, fixed, targets, policy=args.policy, seed=args.seed, cache=cache)
+    best, evaluation = search.run(args.generations, args.population, processes=args.processes,
+                                  time_limit=args.time_limit)
+    if args.cache:
+        save_cache(search.cache, args.cache)
+    result = json.dumps(proposal({**fixed, **best}, evaluation, targets), ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output_file:
+            output_file.write(result)
+    else:
+        print(result)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,23 +1,27 @@
-from typing import Optional
+from __future__ import annotations
+from random import Random, getrandbits
+from typing import Iterator, Optional, TYPE_CHECKING
 
-from unit import PlayerUnit, EnemyUnit
+from battle_log import TurnLog, ACTOR_PLAYER, ACTOR_ENEMY, ACTION_PASS
+from metrics import timed_method, battles_started, battles_finished, battles_abandoned
+from policies import PLAYER_POLICIES, POLICY_HIT, MOVE_HIT, MOVE_SKILL, MOVE_PASS
+from unit import PlayerUnit, EnemyUnit, BaseUnit
 
+if TYPE_CHECKING:
+    from battle_stats import BattleStats
 
-class BaseSingleton(type):
-    _instances = {}
 
-    def __call__(cls, *args, **kwargs):
-        if cls not in cls._instances:
-            instance = super().__call__(*args, **kwargs)
-            cls._instances[cls] = instance
-        return cls._instances[cls]
+MAX_AUTO_TURNS: int = 1000
 
 
-class Arena(metaclass=BaseSingleton):
+class Arena:
     """
     The Arena class implements the interaction of all game objects, and contains the basic logic.
     When initializing the class object, it determines the initial values of the arguments,
-    does not accept any parameters.
+    optionally accepts the seed of the first battle and the statistics the finished battles are added to.
+    Every game session has its own instance of the class. The messages of the last move of the player
+    are kept in the "messages" attribute. Only the monitored arenas, the ones of the game sessions, are counted
+    in the metrics, the arenas of the simulations and the benchmarks are not.
     """
     STAMINA_PER_ROUND: float = 1
     player: PlayerUnit = ...
@@ -25,23 +29,78 @@ class Arena(metaclass=BaseSingleton):
     game_is_running: bool = False
     battle_resault: Optional[str] = None
 
-    def start_game(self, player: PlayerUnit, enemy: EnemyUnit):
+    def __init__(self, seed: Optional[int] = None, stats: Optional[BattleStats] = None, monitored: bool = False):
+        """
+        The "__init__" method is called when initializing the class object, takes the seed of the random
+        number generator of the first battle, if it is not passed, every battle gets a random seed,
+        the statistics of the battles and whether the arena is counted in the metrics. The battles of an arena
+        without statistics are not recorded.
+        """
+        self.stats: Optional[BattleStats] = stats
+        self.monitored: bool = monitored
+        self._next_seed: Optional[int] = seed
+        self.seed: Optional[int] = None
+        self.rng: Random = Random()
+        self.log: TurnLog = TurnLog()
+        self.messages: list[str] = []
+
+    def start_game(self, player: PlayerUnit, enemy: EnemyUnit, seed: Optional[int] = None):
         """
         The start_game function defines a method of the Arena class, when called, it takes as arguments
-        a player and an opponent in the form of objects of classes inherited from the abstract BaseUnit class.
-        When called, it assigns the attributes "player" and "opponent" to the instance of the class,
-        and also sets True for the "has the game started" property.
+        a player and an opponent in the form of objects of classes inherited from the abstract BaseUnit class,
+        and optionally the seed of the battle. When called, it assigns the attributes "player" and "opponent"
+        to the instance of the class, seeds the random number generator of the arena and gives it to both
+        characters, clears the log and sets True for the "has the game started" property.
         """
+        if self.monitored:
+            if self.game_is_running:
+                battles_abandoned.inc()
+            battles_started.inc()
+        if seed is None:
+            seed = self._next_seed if self._next_seed is not None else getrandbits(64)
+        self._next_seed = None
+        self.seed = seed
+        self.rng.seed(seed)
+        self.log.clear()
+        self.messages = []
         self.player = player
         self.enemy = enemy
+        player.rng = self.rng
+        enemy.rng = self.rng
         self.game_is_running = True
+        self.battle_resault = None
+
+    def resume(self, player: PlayerUnit, enemy: EnemyUnit, seed: Optional[int], log: TurnLog,
+               game_is_running: bool, battle_resault: Optional[str]):
+        """
+        The resume function defines a method of the Arena class, it restores a battle saved by another process:
+        takes the characters, the seed and the log of the battle and its status. The random number generator
+        is seeded with the seed and the number of turns made, so the continuation of the battle is reproducible.
+        """
+        self.seed = seed
+        self.log = log
+        self.rng.seed(f'{seed}:{len(log)}')
+        self.player = player
+        self.enemy = enemy
+        player.rng = self.rng
+        enemy.rng = self.rng
+        self.game_is_running = game_is_running
+        self.battle_resault = battle_resault
+
+    def _record(self, actor: int, unit: BaseUnit, target: BaseUnit, target_hp: float):
+        """
+        The _record function defines a protected method of the Arena class, takes the acting side, the acting
+        character, its target and the health of the target before the action, and writes the action to the log.
+        """
+        self.log.record(actor, unit.last_action, target_hp - target.hp, self.player, self.enemy)
 
     def _check_players_hp(self) -> Optional[str]:
         """
         The _check_players_hp function defines a protected method of the Arena class, does not accept
         arguments when called. Checks the hp attribute values of the player and the opponent.
         Based on the results of the check, it returns None if both values are greater than zero,
-        otherwise it determines the outcome of the battle and calls the _end_game method.
+        otherwise it determines the outcome of the battle, adds it to the messages of the move and returns
+        the result of the _end_game method.
         """
         if self.player.hp > 0 and self.enemy.hp > 0:
             return None
@@ -51,7 +110,8 @@ class Arena(metaclass=BaseSingleton):
             self.battle_resault = 'Игрок проиграл битву'
         else:
             self.battle_resault = 'Игрок выиграл битву'
-        self._end_game()
+        self.messages.append(self.battle_resault)
+        return self._end_game()
 
     def _stamina_regeneration(self):
         """
@@ -66,16 +126,21 @@ class Arena(metaclass=BaseSingleton):
             else:
                 unit.stamina += self.STAMINA_PER_ROUND
 
+    @timed_method('arena_method_duration_seconds', 'Time spent in the methods of Arena.', method='next_turn')
     def next_turn(self):
         """
         The next_turn function defines a method of the Arena class, does not accept arguments when called.
         It is called when the player performs some action, Checks the value returned by the _check_players_hp method,
         if the method returned the result, it returns it, Otherwise it calls the _stamina_regeneration method,
         and then enemy.hit with passing to it as an argument an instance of the player to perform a response move.
+        The result of the move of the enemy is added to the messages of the move.
         """
         if self.game_is_running:
             self._stamina_regeneration()
+            player_hp = self.player.hp
             result = self.enemy.hit(self.player)
+            self.messages.append(result)
+            self._record(ACTOR_ENEMY, self.enemy, self.player, player_hp)
 
             res = self._check_players_hp()
             if res is not None:
@@ -86,40 +151,79 @@ class Arena(metaclass=BaseSingleton):
     def _end_game(self) -> str:
         """
         The _end_game function defines a protected method of the Arena class, does not accept arguments when called.
-        Cleans singleton, stops the game and returns the result of the battle.
+        Stops the game, adds the battle to the statistics and returns the result of the battle.
         """
-        self._instances: dict = {}
         self.game_is_running = False
+        if self.monitored:
+            battles_finished.inc()
+        if self.stats is not None:
+            self.stats.record(self)
         return self.battle_resault
 
+    @timed_method('arena_method_duration_seconds', 'Time spent in the methods of Arena.', method='player_hit')
     def player_hit(self) -> str:
         """
         The player_hit function defines a method of the Arena class, does not accept arguments when called.
-        Retrieves the result of the player.hit function, starts the next move and returns
-        the result of the player's action.
+        Retrieves the result of the player.hit function, starts the next move and returns the messages
+        of the move joined by line breaks, they are also kept in the "messages" attribute as a list.
         """
+        enemy_hp = self.enemy.hp
         result = self.player.hit(self.enemy)
+        self.messages = [result]
+        self._record(ACTOR_PLAYER, self.player, self.enemy, enemy_hp)
 
-        res = self._check_players_hp()
-        if res is not None:
-            return res
-
-        turn_result = self.next_turn()
+        if self._check_players_hp() is None:
+            self.next_turn()
 
-        return f'{result}<br>{turn_result}'
+        return '<br>'.join(self.messages)
 
+    @timed_method('arena_method_duration_seconds', 'Time spent in the methods of Arena.', method='player_use_skill')
     def player_use_skill(self) -> str:
         """
         The player_use_skill function defines a method of the Arena class, does not accept arguments when called.
-        Retrieves the result of the player.use_skill function, starts the next move and returns
-        the result of the player's action.
+        Retrieves the result of the player.use_skill function, starts the next move and returns the messages
+        of the move joined by line breaks, they are also kept in the "messages" attribute as a list.
         """
+        enemy_hp = self.enemy.hp
         result = self.player.use_skill(self.enemy)
+        self.messages = [result]
+        self._record(ACTOR_PLAYER, self.player, self.enemy, enemy_hp)
+
+        if self._check_players_hp() is None:
+            self.next_turn()
 
-        res = self._check_players_hp()
-        if res is not None:
-            return res
+        return '<br>'.join(self.messages)
 
-        turn_result = self.next_turn()
+    def player_pass_turn(self) -> str:
+        """
+        The player_pass_turn function defines a method of the Arena class, does not accept arguments when called.
+        Writes the skipped move of the player to the log, starts the next move and returns its messages
+        joined by line breaks.
+        """
+        self.messages = []
+        self.log.record(ACTOR_PLAYER, ACTION_PASS, 0, self.player, self.enemy)
+        self.next_turn()
+        return '<br>'.join(self.messages)
 
-        return f'{result}<br>{turn_result}'
+    def play(self, policy: str = POLICY_HIT, max_turns: int = MAX_AUTO_TURNS) -> Iterator[str]:
+        """
+        The play function defines a generator method of the Arena class, takes the name of the policy
+        of the player from PLAYER_POLICIES and the maximum number of moves. Every step of the generator makes
+        one move chosen by the policy and yields its result, until _check_players_hp ends the battle or the moves
+        run out. The moves are made only when the next result is requested.
+        """
+        choose_move = PLAYER_POLICIES[policy]
+        moves = {MOVE_HIT: self.player_hit, MOVE_SKILL: self.player_use_skill, MOVE_PASS: self.player_pass_turn}
+        turns = 0
+        while self.game_is_running and turns < max_turns:
+            turns += 1
+            yield moves[choose_move(self.player, self.enemy)]()
+
+    @timed_method('arena_method_duration_seconds', 'Time spent in the methods of Arena.', method='auto_battle')
+    def auto_battle(self, policy: str = POLICY_HIT, max_turns: int = MAX_AUTO_TURNS) -> int:
+        """
+        The auto_battle function defines a method of the Arena class, takes the name of the policy of the player
+        and the maximum number of moves, makes all moves of the play generator and returns their number.
+        The result of the battle is in the "battle_resault" attribute and the moves are in the log.
+        """
+        return sum(1 for _ in self.play(policy, max_turns))
@@ -0,0 +1,110 @@
+from __future__ import annotations
+from typing import Iterator, NamedTuple, TYPE_CHECKING
+import struct
+import threading
+
+if TYPE_CHECKING:
+    from unit import BaseUnit
+
+
+ACTOR_PLAYER: int = 0
+ACTOR_ENEMY: int = 1
+
+ACTION_HIT: int = 0
+ACTION_BLOCKED: int = 1
+ACTION_NO_STAMINA: int = 2
+ACTION_SKILL: int = 3
+ACTION_SKILL_REPEATED: int = 4
+ACTION_PASS: int = 5
+
+# actor, action, damage, hp and stamina of the player, hp and stamina of the enemy, numbers in tenths
+TURN_FORMAT: struct.Struct = struct.Struct('<BBhhhhh')
+
+
+class TurnEvent(NamedTuple):
+    """
+    The TurnEvent class describes one action of a battle and the state of both characters after it.
+    """
+    actor: int
+    action: int
+    damage: float
+    player_hp: float
+    player_stamina: float
+    enemy_hp: float
+    enemy_stamina: float
+
+
+def _tenths(value: float) -> int:
+    return round(value * 10)
+
+
+class TurnLog:
+    """
+    The TurnLog class stores the actions of a battle as fixed-width binary records of TURN_FORMAT.size bytes.
+    Together with the seed of the arena it allows to audit the battle, and it can be replayed without
+    running the game logic. The generation is incremented whenever records are removed, so a reader that
+    remembers the generation and the number of records it has seen knows whether the log has only grown since.
+    """
+    def __init__(self, data: bytes = b''):
+        """
+        The "__init__" method is called when initializing the class object, takes the bytes of a previously
+        saved log, if any.
+        """
+        if len(data) % TURN_FORMAT.size:
+            raise ValueError('The size of the log is not a multiple of the record size')
+        self._data: bytearray = bytearray(data)
+        self.generation: int = 0
+        self._changed: threading.Condition = threading.Condition()
+
+    def __len__(self) -> int:
+        return len(self._data) // TURN_FORMAT.size
+
+    def __bytes__(self) -> bytes:
+        return bytes(self._data)
+
+    def record(self, actor: int, action: int, damage: float, player: BaseUnit, enemy: BaseUnit):
+        """
+        The record function defines a method of the TurnLog class, takes the acting side, the action code,
+        the damage done and both characters, and appends a record with their health and stamina.
+        """
+        self._data += TURN_FORMAT.pack(actor, action, _tenths(damage), _tenths(player.hp), _tenths(player.stamina),
+                                       _tenths(enemy.hp), _tenths(enemy.stamina))
+        self._notify()
+
+    def clear(self):
+        """
+        The clear function defines a method of the TurnLog class, removes all records of the log.
+        """
+        self._data.clear()
+        self.generation += 1
+        self._notify()
+
+    def _notify(self):
+        with self._changed:
+            self._changed.notify_all()
+
+    def wait(self, size: int, generation: int, timeout: float) -> bool:
+        """
+        The wait function defines a method of the TurnLog class, takes the number of records and the generation
+        known to the caller and blocks until the log changes or timeout seconds pass. Returns True if the log
+        has changed, also if it was cleared and has already grown back to the same size.
+        """
+        with self._changed:
+            return self._changed.wait_for(lambda: len(self) != size or self.generation != generation, timeout)
+
+    def records(self, start: int = 0) -> list[bytes]:
+        """
+        The records function defines a method of the TurnLog class, optionally takes the number of records
+        to skip, and returns the remaining records as separate bytes of TURN_FORMAT.size.
+        """
+        size = TURN_FORMAT.size
+        return [bytes(self._data[offset:offset + size]) for offset in range(start * size, len(self._data), size)]
+
+    def replay(self, start: int = 0) -> Iterator[TurnEvent]:
+        """
+        The replay function defines a method of the TurnLog class, optionally takes the number of records
+        to skip, and yields the actions of the battle in the order they were made. The records are copied
+        first, so the log may grow while they are replayed.
+        """
+        for actor, action, *values in TURN_FORMAT.iter_unpack(bytes(self._data[start * TURN_FORMAT.size:])):
+            yield TurnEvent(actor, action, *(value / 10 for value in values))
@@ -0,0 +1,233 @@
+from __future__ import annotations
+from typing import Optional, TYPE_CHECKING
+import atexit
+import os
+import sqlite3
+import threading
+import time
+
+from flask import Response, jsonify
+
+from metrics import registry as metrics_registry
+
+if TYPE_CHECKING:
+    from base import Arena
+
+
+FLUSH_INTERVAL: float = 10
+FLUSH_SIZE: int = 1000
+DEFAULT_PATH: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'battle_stats.db')
+
+# the kinds of the aggregates, the names of the sections of /stats
+KIND_TOTAL: str = 'total'
+KIND_CLASS: str = 'classes'
+KIND_WEAPON: str = 'weapons'
+KIND_ARMOR: str = 'armors'
+
+# the positions of the counters in an aggregate
+BATTLES, WINS, DRAWS, LOSSES, TURNS, SKILLS = range(6)
+
+CREATE_TABLE: str = (
+    'CREATE TABLE IF NOT EXISTS battle_stats ('
+    'kind TEXT NOT NULL, name TEXT NOT NULL, battles INTEGER NOT NULL, wins INTEGER NOT NULL, '
+    'draws INTEGER NOT NULL, losses INTEGER NOT NULL, turns INTEGER NOT NULL, skills INTEGER NOT NULL, '
+    'PRIMARY KEY (kind, name)) WITHOUT ROWID'
+)
+UPSERT_STATS: str = (
+    'INSERT INTO battle_stats (kind, name, battles, wins, draws, losses, turns, skills) '
+    'VALUES (?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (kind, name) DO UPDATE SET '
+    'battles = battles + excluded.battles, wins = wins + excluded.wins, draws = draws + excluded.draws, '
+    'losses = losses + excluded.losses, turns = turns + excluded.turns, skills = skills + excluded.skills'
+)
+SELECT_STATS: str = 'SELECT kind, name, battles, wins, draws, losses, turns, skills FROM battle_stats'
+
+battles_recorded = metrics_registry.counter('battle_stats_recorded_total', 'Finished battles added to the statistics.')
+stats_flushes = metrics_registry.counter('battle_stats_flushes_total', 'Batches of statistics written to SQLite.')
+flush_duration = metrics_registry.histogram('battle_stats_flush_duration_seconds',
+                                            'Time spent writing a batch of statistics and reloading them.')
+
+
+def _rates(counters: list[int]) -> dict:
+    """
+    The _rates function returns the counters of an aggregate with the shares computed from them.
+    """
+    battles = counters[BATTLES]
+    return {
+        'battles': battles,
+        'wins': counters[WINS],
+        'draws': counters[DRAWS],
+        'losses': counters[LOSSES],
+        'win_rate': counters[WINS] / battles if battles else None,
+        'mean_turns': counters[TURNS] / battles if battles else None,
+        'skill_rate': counters[SKILLS] / battles if battles else None,
+    }
+
+
+class BattleStats:
+    """
+    The BattleStats class collects the results of the finished battles. A battle only increments
+    the counters of the classes and the items of both characters in memory, a background thread writes
+    the accumulated counters to SQLite in one transaction every FLUSH_INTERVAL seconds, or earlier when
+    FLUSH_SIZE battles are waiting, and then rebuilds the summary served by /stats from the table of counters.
+    The counters are added to the rows, so several processes can share the database.
+    """
+    def __init__(self, path: str, flush_interval: float = FLUSH_INTERVAL, flush_size: int = FLUSH_SIZE):
+        """
+        The "__init__" method is called when initializing the class object, takes the path of the database,
+        the interval between the writes and the number of battles that triggers an early write.
+        """
+        self.path: str = path
+        self.flush_interval: float = flush_interval
+        self.flush_size: int = flush_size
+        self._pending: dict[tuple[str, str], list[int]] = {}
+        self._pending_battles: int = 0
+        self._lock: threading.Lock = threading.Lock()
+        self._flush_lock: threading.Lock = threading.Lock()
+        self._wake: threading.Event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._summary: Optional[dict] = None
+        self._summary_time: float = 0
+
+    def record(self, arena: Arena):
+        """
+        The record function defines a method of the BattleStats class, takes the arena of a finished battle
+        and adds its result to the counters in memory: the classes, the weapons and the armors of both
+        characters, the winner, the number of moves and whether the skill was used.
+        """
+        player, enemy = arena.player, arena.enemy
+        turns = (len(arena.log) + 1) // 2
+        player_result = WINS if enemy.hp <= 0 < player.hp else LOSSES if player.hp <= 0 < enemy.hp else DRAWS
+        enemy_result = {WINS: LOSSES, LOSSES: WINS, DRAWS: DRAWS}[player_result]
+        sides = ((player, player_result), (enemy, enemy_result))
+        with self._lock:
+            self._add((KIND_TOTAL, ''), player_result, turns, player._is_skill_used)
+            for unit, result in sides:
+                skill_used = unit._is_skill_used
+                self._add((KIND_CLASS, unit.unit_class.name), result, turns, skill_used)
+                self._add((KIND_WEAPON, unit.weapon.name), result, turns, skill_used)
+                self._add((KIND_ARMOR, unit.armor.name), result, turns, skill_used)
+            self._pending_battles += 1
+            pending = self._pending_battles
+            if self._thread is None:
+                self._start()
+        battles_recorded.inc()
+        if pending >= self.flush_size:
+            self._wake.set()
+
+    def _add(self, key: tuple[str, str], result: int, turns: int, skill_used: bool):
+        counters = self._pending.get(key)
+        if counters is None:
+            counters = self._pending[key] = [0] * 6
+        counters[BATTLES] += 1
+        counters[result] += 1
+        counters[TURNS] += turns
+        counters[SKILLS] += skill_used
+
+    def _start(self):
+        """
+        The _start function defines a protected method of the BattleStats class, it starts the thread
+        of the writes with the first recorded battle and writes the rest of the counters at the exit.
+        """
+        self._thread = threading.Thread(target=self._run, name='battle-stats', daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except sqlite3.Error:
+                time.sleep(self.flush_interval)
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, isolation_level=None, timeout=5)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute(CREATE_TABLE)
+        return connection
+
+    def flush(self):
+        """
+        The flush function defines a method of the BattleStats class, writes the counters accumulated
+        in memory to the database in one transaction and rebuilds the summary from the table. If the write
+        fails, the counters are returned to memory and written with the next batch.
+        """
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                self._pending_battles = 0
+            started = time.perf_counter()
+            connection = self._connect()
+            try:
+                if pending:
+                    try:
+                        with connection:
+                            connection.execute('BEGIN IMMEDIATE')
+                            connection.executemany(UPSERT_STATS, [(*key, *counters)
+                                                                  for key, counters in pending.items()])
+                    except sqlite3.Error:
+                        self._restore(pending)
+                        raise
+                    stats_flushes.inc()
+                self._load_summary(connection)
+            finally:
+                connection.close()
+            flush_duration.observe(time.perf_counter() - started)
+
+    def _restore(self, pending: dict[tuple[str, str], list[int]]):
+        with self._lock:
+            for key, counters in pending.items():
+                current = self._pending.setdefault(key, [0] * 6)
+                for i, value in enumerate(counters):
+                    current[i] += value
+                if key[0] == KIND_TOTAL:
+                    self._pending_battles += counters[BATTLES]
+
+    @staticmethod
+    def _build_summary(rows) -> dict:
+        """
+        The _build_summary function defines a protected static method of the BattleStats class, takes
+        the rows of the table of counters and returns the statistics served by /stats: the totals of the player
+        and the shares of wins, draws and losses, the mean number of moves and the share of battles with the skill
+        used for every class and item.
+        """
+        summary: dict = {KIND_TOTAL: _rates([0] * 6), KIND_CLASS: {}, KIND_WEAPON: {}, KIND_ARMOR: {}}
+        for kind, name, *counters in rows:
+            if kind == KIND_TOTAL:
+                summary[KIND_TOTAL] = _rates(counters)
+            elif kind in summary:
+                summary[kind][name] = _rates(counters)
+        return summary
+
+    def _load_summary(self, connection: sqlite3.Connection):
+        self._summary = self._build_summary(connection.execute(SELECT_STATS))
+        self._summary_time = time.monotonic()
+
+    def summary(self) -> dict:
+        """
+        The summary function defines a method of the BattleStats class and returns the statistics built
+        by the last write. The table of counters is only read again when the summary is older than
+        flush_interval, for example in a process that serves /stats but has no finished battles.
+        """
+        if time.monotonic() - self._summary_time > self.flush_interval:
+            with self._flush_lock:
+                if time.monotonic() - self._summary_time > self.flush_interval:
+                    connection = self._connect()
+                    try:
+                        self._load_summary(connection)
+                    finally:
+                        connection.close()
+        return self._summary
+
+
+battle_stats: BattleStats = BattleStats(os.environ.get('BATTLE_STATS_DB', DEFAULT_PATH))
+
+
+def stats_view() -> Response:
+    """
+    The stats_view function returns the statistics of the finished battles in JSON. The statistics
+    are updated with every write of the counters, so the battles of the last FLUSH_INTERVAL seconds
+    may be missing.
+    """
+    return jsonify(battle_stats.summary())
@@ -0,0 +1,368 @@
+from random import Random
+from typing import Callable, Optional
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+import timeit
+import tracemalloc
+
+from base import Arena
+from classes import unit_classes
+from equipment import Equipment
+from simulator import FighterParams, simulate, simulate_arena
+from unit import PlayerUnit, EnemyUnit
+from unit_store import UnitStore
+
+
+REPEAT: int = 5
+THRESHOLD: float = 0.1
+RAID_SIZE: int = 500
+MEMORY_FIGHTS: int = 100_000
+
+PLAYER_SETUP: tuple[str, str, str] = ('Воин', 'топорик', 'кожаная броня')
+ENEMY_SETUP: tuple[str, str, str] = ('Вор', 'ножик', 'кожаная броня')
+
+
+def _units() -> tuple[PlayerUnit, EnemyUnit]:
+    """
+    The _units function returns a new player and a new enemy with the benchmark setups.
+    """
+    equipment = Equipment()
+    player = PlayerUnit(name='player', unit_class=unit_classes[PLAYER_SETUP[0]])
+    player.equip_weapon(equipment.get_weapon(PLAYER_SETUP[1]))
+    player.equip_armor(equipment.get_armor(PLAYER_SETUP[2]))
+    enemy = EnemyUnit(name='enemy', unit_class=unit_classes[ENEMY_SETUP[0]])
+    enemy.equip_weapon(equipment.get_weapon(ENEMY_SETUP[1]))
+    enemy.equip_armor(equipment.get_armor(ENEMY_SETUP[2]))
+    return player, enemy
+
+
+def _running_arena() -> Callable[[], Arena]:
+    """
+    The _running_arena function returns a function that returns an arena with a running battle,
+    a new battle is started when the previous one ends.
+    """
+    arena = Arena(seed=0)
+
+    def get() -> Arena:
+        if not arena.game_is_running:
+            arena.start_game(*_units())
+        return arena
+    return get
+
+
+def count_damage() -> Callable[[], None]:
+    player, enemy = _units()
+
+    def run():
+        player.stamina = player.unit_class.max_stamina
+        enemy.stamina = enemy.unit_class.max_stamina
+        player._count_damage(enemy)
+    return run
+
+
+def player_hit() -> Callable[[], None]:
+    arena = _running_arena()
+    return lambda: arena().player_hit()
+
+
+def next_turn() -> Callable[[], None]:
+    arena = _running_arena()
+    return lambda: arena().next_turn()
+
+
+def skill_use() -> Callable[[], None]:
+    player, enemy = _units()
+    skill = player.unit_class.skill
+
+    def run():
+        player.stamina = player.unit_class.max_stamina
+        skill.use(user=player, target=enemy)
+    return run
+
+
+def enemy_ai_move() -> Callable[[], None]:
+    from enemy_ai import choose_move
+
+    player, enemy = _units()
+    rng = Random(0)
+    return lambda: choose_move(enemy, player, rng)
+
+
+def team_action() -> Callable[[], None]:
+    """
+    The team_action function returns a benchmark of one action in a battle of two teams of RAID_SIZE
+    characters, a new battle is started when the previous one ends.
+    """
+    from team_arena import TeamArena
+
+    arena = TeamArena(seed=0)
+
+    def run():
+        if not arena.game_is_running:
+            teams = [_units() for _ in range(RAID_SIZE)]
+            arena.start_game([player for player, _ in teams], [enemy for _, enemy in teams])
+        arena.next_action()
+    return run
+
+
+def win_odds_cached() -> Callable[[], None]:
+    """
+    The win_odds_cached function returns a benchmark of the odds of a running battle found in the cache.
+    """
+    from win_odds import battle_odds, odds_cache
+
+    arena = _running_arena()()
+    odds_cache.get(arena.player, arena.enemy)
+    return lambda: battle_odds(arena)
+
+
+def win_odds_solve() -> Callable[[], None]:
+    """
+    The win_odds_solve function returns a benchmark of the computation of the odds of a new battle
+    without the cache.
+    """
+    from win_odds import BattleState, OddsSolver
+
+    player, enemy = _units()
+    solver = OddsSolver(FighterParams.from_equipment(player.unit_class, player.weapon, player.armor),
+                        FighterParams.from_equipment(enemy.unit_class, enemy.weapon, enemy.armor))
+    state = BattleState.from_units(player, enemy)
+    return lambda: solver.solve(state)
+
+
+def equipment_data() -> Callable[[], None]:
+    return Equipment._get_equipment_data
+
+
+def equipment_catalog() -> Callable[[], None]:
+    return Equipment
+
+
+def arena_battle() -> Callable[[], None]:
+    equipment = Equipment()
+    setup = (unit_classes[PLAYER_SETUP[0]], equipment.get_weapon(PLAYER_SETUP[1]), equipment.get_armor(PLAYER_SETUP[2]),
+             unit_classes[ENEMY_SETUP[0]], equipment.get_weapon(ENEMY_SETUP[1]), equipment.get_armor(ENEMY_SETUP[2]))
+    return lambda: simulate_arena(*setup, n_battles=1)
+
+
+def arena_store_battle() -> Callable[[], None]:
+    equipment = Equipment()
+    setup = (unit_classes[PLAYER_SETUP[0]], equipment.get_weapon(PLAYER_SETUP[1]), equipment.get_armor(PLAYER_SETUP[2]),
+             unit_classes[ENEMY_SETUP[0]], equipment.get_weapon(ENEMY_SETUP[1]), equipment.get_armor(ENEMY_SETUP[2]))
+    store = UnitStore()
+    return lambda: simulate_arena(*setup, n_battles=1, store=store)
+
+
+def vectorized_battles() -> Callable[[], None]:
+    equipment = Equipment()
+    player = FighterParams.from_equipment(unit_classes[PLAYER_SETUP[0]], equipment.get_weapon(PLAYER_SETUP[1]),
+                                          equipment.get_armor(PLAYER_SETUP[2]))
+    enemy = FighterParams.from_equipment(unit_classes[ENEMY_SETUP[0]], equipment.get_weapon(ENEMY_SETUP[1]),
+                                         equipment.get_armor(ENEMY_SETUP[2]))
+    return lambda: simulate(player, enemy, 10_000, seed=0)
+
+
+def fighters_objects(fights: int) -> list:
+    """
+    The fighters_objects function creates the players and the enemies of the given number of fights
+    as PlayerUnit and EnemyUnit objects and returns them.
+    """
+    return [_units() for _ in range(fights)]
+
+
+def fighters_store(fights: int) -> UnitStore:
+    """
+    The fighters_store function creates the players and the enemies of the given number of fights
+    in a UnitStore and returns the store. The handles are not kept, the characters of the fight number i
+    are in the slots 2 * i and 2 * i + 1 of the store.
+    """
+    equipment = Equipment()
+    player_setup = (unit_classes[PLAYER_SETUP[0]], equipment.get_weapon(PLAYER_SETUP[1]),
+                    equipment.get_armor(PLAYER_SETUP[2]))
+    enemy_setup = (unit_classes[ENEMY_SETUP[0]], equipment.get_weapon(ENEMY_SETUP[1]),
+                   equipment.get_armor(ENEMY_SETUP[2]))
+    store = UnitStore()
+    for _ in range(fights):
+        store.add_player('player', *player_setup)
+        store.add_enemy('enemy', *enemy_setup)
+    return store
+
+
+def _client():
+    """
+    The _client function returns a Flask test client whose session has chosen heroes.
+    """
+    from app import create_app
+
+    client = create_app().test_client()
+    client.post('/choose-hero/', data={'name': 'player', 'unit_class': PLAYER_SETUP[0],
+                                       'weapon': PLAYER_SETUP[1], 'armor': PLAYER_SETUP[2]})
+    client.post('/choose-enemy/', data={'name': 'enemy', 'unit_class': ENEMY_SETUP[0],
+                                        'weapon': ENEMY_SETUP[1], 'armor': ENEMY_SETUP[2]})
+    return client
+
+
+def route(method: str, path: str, fight: bool = False, data: Optional[dict] = None) -> Callable[[], Callable]:
+    """
+    The route function returns a benchmark of one request to the application. For fight routes a new battle
+    is started whenever the previous one has ended.
+    """
+    def setup() -> Callable[[], None]:
+        client = _client()
+        if not fight:
+            return lambda: client.open(path, method=method, data=data)
+        from sessions import current_game
+
+        with client:
+            client.get('/fight/')
+            game = current_game()
+
+        def run():
+            if not game.arena.game_is_running:
+                client.get('/fight/')
+            client.open(path, method=method)
+        return run
+    return setup
+
+
+BENCHMARKS: dict[str, Callable[[], Callable[[], None]]] = {
+    'engine.count_damage': count_damage,
+    'engine.player_hit': player_hit,
+    'engine.next_turn': next_turn,
+    'engine.skill_use': skill_use,
+    'engine.enemy_ai_move': enemy_ai_move,
+    'engine.team_action': team_action,
+    'engine.win_odds_cached': win_odds_cached,
+    'engine.win_odds_solve': win_odds_solve,
+    'equipment.get_equipment_data': equipment_data,
+    'equipment.catalog': equipment_catalog,
+    'battle.arena': arena_battle,
+    'battle.arena_store': arena_store_battle,
+    'battle.vectorized_10k': vectorized_battles,
+    'route.menu': route('GET', '/'),
+    'route.choose_hero': route('GET', '/choose-hero/'),
+    'route.choose_enemy': route('GET', '/choose-enemy/'),
+    'route.choose_hero_post': route('POST', '/choose-hero/', data={
+        'name': 'player', 'unit_class': PLAYER_SETUP[0], 'weapon': PLAYER_SETUP[1], 'armor': PLAYER_SETUP[2]}),
+    'route.fight': route('GET', '/fight/'),
+    'route.fight_hit': route('GET', '/fight/hit', fight=True),
+    'route.fight_use_skill': route('GET', '/fight/use-skill', fight=True),
+    'route.fight_pass_turn': route('GET', '/fight/pass-turn', fight=True),
+    'route.fight_end': route('GET', '/fight/end-fight'),
+    'route.api_fight_hit': route('POST', '/api/fight/hit', fight=True),
+}
+
+MEMORY_BENCHMARKS: dict[str, Callable[[int], object]] = {
+    'memory.fighters_objects': fighters_objects,
+    'memory.fighters_store': fighters_store,
+}
+
+
+def measure(func: Callable[[], None], repeat: int = REPEAT, min_time: float = 0.2) -> dict[str, float]:
+    """
+    The measure function runs func in batches that take at least min_time seconds, repeat times,
+    and returns the time of one call in seconds: the best, the median and the mean of the batches.
+    """
+    timer = timeit.Timer(func)
+    number = 1
+    while timer.timeit(number) < min_time:
+        number *= 2
+    times = [time_ / number for time_ in timer.repeat(repeat=repeat, number=number)]
+    return {'best': min(times), 'median': statistics.median(times), 'mean': statistics.fmean(times),
+            'number': number}
+
+
+def measure_memory(func: Callable[[int], object], fights: int = MEMORY_FIGHTS) -> dict[str, float]:
+    """
+    The measure_memory function creates the characters of the given number of fights with func, keeps them
+    alive while tracemalloc counts the allocated memory and returns the number of bytes per fight.
+    """
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        fighters = func(fights)
+        allocated = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+    del fighters
+    return {'bytes_per_fight': allocated / fights, 'fights': fights}
+
+
+def run(names: list[str], repeat: int = REPEAT, memory_names: tuple = ()) -> dict:
+    """
+    The run function runs the benchmarks with the given names and the memory benchmarks with the given names
+    and returns their results together with the description of the environment.
+    """
+    results = {}
+    for name in names:
+        results[name] = measure(BENCHMARKS[name](), repeat=repeat)
+        print(f"{name:32} {results[name]['best'] * 1e6:12.2f} us", file=sys.stderr)
+    memory = {}
+    for name in memory_names:
+        memory[name] = measure_memory(MEMORY_BENCHMARKS[name])
+        print(f"{name:32} {memory[name]['bytes_per_fight']:12.1f} B/fight", file=sys.stderr)
+    return {
+        'meta': {'python': platform.python_version(), 'platform': platform.platform(),
+                 'time': time.strftime('%Y-%m-%dT%H:%M:%S')},
+        'results': results,
+        'memory': memory,
+    }
+
+
+def compare(current: dict, baseline: dict, threshold: float = THRESHOLD) -> list[str]:
+    """
+    The compare function compares the best times of two runs and returns the names of the benchmarks
+    that became slower by more than threshold.
+    """
+    regressions = []
+    for name, result in current['results'].items():
+        previous = baseline['results'].get(name)
+        if previous is None:
+            continue
+        ratio = result['best'] / previous['best']
+        mark = 'REGRESSION' if ratio > 1 + threshold else ''
+        print(f"{name:32} {previous['best'] * 1e6:12.2f} -> {result['best'] * 1e6:12.2f} us {ratio:6.2f}x {mark}")
+        if mark:
+            regressions.append(name)
+    for name, result in current.get('memory', {}).items():
+        previous = baseline.get('memory', {}).get(name)
+        if previous is None:
+            continue
+        ratio = result['bytes_per_fight'] / previous['bytes_per_fight']
+        mark = 'REGRESSION' if ratio > 1 + threshold else ''
+        print(f"{name:32} {previous['bytes_per_fight']:12.1f} -> {result['bytes_per_fight']:12.1f} B {ratio:6.2f}x "
+              f"{mark}")
+        if mark:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks of the game engine, the equipment and the routes.')
+    parser.add_argument('-o', '--output', help='save the results to a JSON file')
+    parser.add_argument('-k', '--filter', default='', help='run only benchmarks whose name contains this string')
+    parser.add_argument('-r', '--repeat', type=int, default=REPEAT)
+    parser.add_argument('--compare', metavar='BASELINE', help='compare with the results saved in a JSON file')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD,
+                        help='relative slowdown reported as a regression')
+    args = parser.parse_args()
+
+    names = [name for name in BENCHMARKS if args.filter in name]
+    memory_names = tuple(name for name in MEMORY_BENCHMARKS if args.filter in name)
+    current = run(names, repeat=args.repeat, memory_names=memory_names)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output_file:
+            json.dump(current, output_file, indent=2)
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as baseline_file:
+            baseline = json.load(baseline_file)
+        if compare(current, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+from random import Random
+from time import perf_counter
+
+from base import Arena
+from battle_log import ACTION_PASS
+from metrics import registry as metrics_registry
+from policies import MOVE_HIT, MOVE_SKILL, MOVE_PASS
+from simulator import FighterParams
+from unit import BaseUnit, EnemyUnit
+
+
+# about 3 ms per move, the search is bounded by the number of rollouts to keep the battles reproducible
+ROLLOUTS: int = 8
+HORIZON: int = 30
+
+# the positions of the values in the state of a rollout
+ENEMY_HP, ENEMY_STAMINA, ENEMY_SKILL, PLAYER_HP, PLAYER_STAMINA, PLAYER_SKILL = range(6)
+
+ai_move_duration = metrics_registry.histogram('enemy_ai_move_duration_seconds', 'Time spent choosing a move.')
+
+
+def _hit(state: list, attacker: FighterParams, defender: FighterParams, stamina: int, hp: int,
+         defender_stamina: int, rng: Random):
+    """
+    The _hit function makes a hit in the state of a rollout with the same operations as BaseUnit._count_damage.
+    """
+    state[stamina] -= attacker.stamina_per_hit
+    damage = round(rng.uniform(attacker.min_damage, attacker.max_damage), 1) * attacker.attack
+    if state[defender_stamina] >= defender.armor_stamina:
+        state[defender_stamina] -= defender.armor_stamina
+        damage -= defender.defence
+    damage = round(damage, 1)
+    if damage > 0:
+        state[hp] -= damage
+
+
+def _enemy_move(state: list, move: str, enemy: FighterParams, player: FighterParams, rng: Random):
+    if move == MOVE_SKILL:
+        if state[ENEMY_STAMINA] > enemy.skill_stamina:
+            state[ENEMY_SKILL] = True
+            state[ENEMY_STAMINA] -= enemy.skill_stamina
+            state[PLAYER_HP] -= enemy.skill_damage
+    elif move == MOVE_HIT and state[ENEMY_STAMINA] >= enemy.stamina_per_hit:
+        _hit(state, enemy, player, ENEMY_STAMINA, PLAYER_HP, PLAYER_STAMINA, rng)
+
+
+def _player_move(state: list, enemy: FighterParams, player: FighterParams, rng: Random):
+    """
+    The _player_move function makes the move of the player in the state of a rollout: the player uses the skill
+    when it kills the enemy and hits otherwise.
+    """
+    if (not state[PLAYER_SKILL] and state[PLAYER_STAMINA] > player.skill_stamina
+            and state[ENEMY_HP] <= player.skill_damage):
+        state[PLAYER_SKILL] = True
+        state[PLAYER_STAMINA] -= player.skill_stamina
+        state[ENEMY_HP] -= player.skill_damage
+    elif state[PLAYER_STAMINA] >= player.stamina_per_hit:
+        _hit(state, player, enemy, PLAYER_STAMINA, ENEMY_HP, ENEMY_STAMINA, rng)
+
+
+def _regenerate(state: list, enemy: FighterParams, player: FighterParams, regeneration: float):
+    state[ENEMY_STAMINA] = min(state[ENEMY_STAMINA] + regeneration, enemy.max_stamina)
+    state[PLAYER_STAMINA] = min(state[PLAYER_STAMINA] + regeneration, player.max_stamina)
+
+
+def _value(state: list, enemy: FighterParams, player: FighterParams) -> float:
+    """
+    The _value function returns the value of the state for the enemy: 1 for a win, 0 for a loss, 0.5
+    for a draw, and for an unfinished battle a value between them by the shares of health left.
+    """
+    if state[PLAYER_HP] <= 0:
+        return 0.5 if state[ENEMY_HP] <= 0 else 1.0
+    if state[ENEMY_HP] <= 0:
+        return 0.0
+    return 0.5 + (state[ENEMY_HP] / enemy.max_health - state[PLAYER_HP] / player.max_health) / 2
+
+
+def _rollout(root: list, move: str, enemy: FighterParams, player: FighterParams, regeneration: float,
+             rng: Random) -> float:
+    """
+    The _rollout function plays the battle from the state after the given move of the enemy for HORIZON
+    turns, the enemy then hits on every turn, and returns the value of the final state.
+    """
+    state = root[:]
+    _enemy_move(state, move, enemy, player, rng)
+    for _ in range(HORIZON):
+        if state[PLAYER_HP] <= 0 or state[ENEMY_HP] <= 0:
+            break
+        _player_move(state, enemy, player, rng)
+        if state[PLAYER_HP] <= 0 or state[ENEMY_HP] <= 0:
+            break
+        _regenerate(state, enemy, player, regeneration)
+        _enemy_move(state, MOVE_HIT, enemy, player, rng)
+    return _value(state, enemy, player)
+
+
+def choose_move(enemy: BaseUnit, player: BaseUnit, rng: Random, regeneration: float = Arena.STAMINA_PER_ROUND,
+                rollouts: int = ROLLOUTS) -> str:
+    """
+    The choose_move function chooses the move of the enemy by Monte Carlo search: every possible move
+    is followed by the given number of random rollouts of the rest of the battle, and the move with the best
+    mean value is returned. The search does not depend on the time it takes, so the same generator always
+    gives the same move. The rollouts work on a list of six numbers, the characters themselves are not copied.
+    """
+    moves = [MOVE_HIT, MOVE_PASS]
+    if not enemy._is_skill_used and enemy.unit_class.skill.is_stamina_enough(enemy):
+        moves.insert(0, MOVE_SKILL)
+    if enemy.stamina < enemy.weapon.stamina_per_hit:
+        moves.remove(MOVE_HIT)
+    if len(moves) == 1:
+        return moves[0]
+    started = perf_counter()
+    enemy_params = FighterParams.from_equipment(enemy.unit_class, enemy.weapon, enemy.armor)
+    player_params = FighterParams.from_equipment(player.unit_class, player.weapon, player.armor)
+    root = [enemy.hp, enemy.stamina, enemy._is_skill_used, player.hp, player.stamina, player._is_skill_used]
+    totals = dict.fromkeys(moves, 0.0)
+    for _ in range(rollouts):
+        for move in moves:
+            totals[move] += _rollout(root, move, enemy_params, player_params, regeneration, rng)
+    ai_move_duration.observe(perf_counter() - started)
+    return max(moves, key=totals.__getitem__)
+
+
+class SmartEnemyUnit(EnemyUnit):
+    """
+    The SmartEnemyUnit class represents an enemy that chooses between a hit, the skill and a pass
+    by the search of the choose_move function instead of a random roll of the skill.
+    """
+    rollouts: int = ROLLOUTS
+
+    def hit(self, target: BaseUnit) -> str:
+        """
+        The hit function overrides the method of the EnemyUnit class, chooses the move by the choose_move
+        function with a generator seeded from the generator of the arena, so that the battle is reproducible
+        from its seed, and makes the move.
+        """
+        move = choose_move(self, target, Random(self.rng.getrandbits(64)), rollouts=self.rollouts)
+        if move == MOVE_SKILL:
+            return self.use_skill(target)
+        if move == MOVE_PASS:
+            self.last_action = ACTION_PASS
+            return f"{self.name} пропускает ход."
+        return self._strike(target)
@@ -1,10 +1,20 @@
+from abc import ABC, abstractmethod
+from bisect import bisect_left, bisect_right
 from dataclasses import dataclass
-from typing import Optional, List
-from random import uniform
+from typing import Optional, List, Dict, NamedTuple
+from random import uniform, Random
+import threading
+import os
 import marshmallow_dataclass
 import marshmallow
 import json
 
+from metrics import timed
+
+
+EQUIPMENT_PATH: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'equipment.json')
+PAGE_SIZE: int = 50
+
 
 @dataclass
 class Armor:
@@ -36,6 +46,14 @@ class Weapon:
         """
         return round(uniform(self.min_damage, self.max_damage), 1)
 
+    def roll_damage(self, rng: Random) -> float:
+        """
+        The roll_damage function defines a method of the Weapon class, takes a random number generator
+        as an argument, and returns a random weapon damage value from a specified range drawn from this generator,
+        rounded to one decimal place.
+        """
+        return round(rng.uniform(self.min_damage, self.max_damage), 1)
+
 
 @dataclass
 class EquipmentData:
@@ -47,6 +65,173 @@ class EquipmentData:
     armors: List[Armor]
 
 
+EquipmentSchema = marshmallow_dataclass.class_schema(EquipmentData)
+
+
+class Page(NamedTuple):
+    """
+    The Page class is a named tuple with the names of one page of equipment and the name after which
+    the next page starts, or None if the page is the last one.
+    """
+    names: List[str]
+    next_after: Optional[str]
+
+
+def _search_sorted(names: List[str], prefix: str, after: str, limit: int) -> List[str]:
+    """
+    The _search_sorted function takes a sorted list of names and returns at most limit names that start
+    with prefix and go after the name after, found by binary search.
+    """
+    start = bisect_left(names, prefix)
+    if after:
+        start = max(start, bisect_right(names, after))
+    result = []
+    for name in names[start:start + limit]:
+        if not name.startswith(prefix):
+            break
+        result.append(name)
+    return result
+
+
+class BaseEquipmentCatalog(ABC):
+    """
+    The BaseEquipmentCatalog class is an abstract class that defines how the game looks up weapons and armors.
+    A catalog knows the modification time of the file it was read from, "data" is the whole EquipmentData
+    if the catalog holds it in memory, or None if the items are only read one at a time.
+    """
+    data: Optional[EquipmentData]
+    mtime: int
+
+    @abstractmethod
+    def get_weapon(self, name: str) -> Optional[Weapon]:
+        pass
+
+    @abstractmethod
+    def get_armor(self, name: str) -> Optional[Armor]:
+        pass
+
+    @abstractmethod
+    def get_weapon_by_id(self, weapon_id: int) -> Optional[Weapon]:
+        pass
+
+    @abstractmethod
+    def get_armor_by_id(self, armor_id: int) -> Optional[Armor]:
+        pass
+
+    @abstractmethod
+    def get_weapons_names(self) -> List[str]:
+        pass
+
+    @abstractmethod
+    def get_armors_names(self) -> List[str]:
+        pass
+
+    @abstractmethod
+    def search_weapons(self, prefix: str, after: str, limit: int) -> List[str]:
+        """
+        The search_weapons function defines an abstract method of the class and returns at most limit names
+        of weapons in alphabetical order that start with prefix and go after the name after.
+        """
+        pass
+
+    @abstractmethod
+    def search_armors(self, prefix: str, after: str, limit: int) -> List[str]:
+        """
+        The search_armors function defines an abstract method of the class and returns at most limit names
+        of armors in alphabetical order that start with prefix and go after the name after.
+        """
+        pass
+
+
+class EquipmentCatalog(BaseEquipmentCatalog):
+    """
+    The EquipmentCatalog class is an immutable, indexed snapshot of the equipment file. When initializing
+    the class object, it takes the loaded EquipmentData and the modification time of the file it was read from,
+    and builds dictionaries of weapons and armor by name and by id, as well as the lists of their names.
+    """
+    def __init__(self, data: EquipmentData, mtime: int):
+        """
+        The "__init__" method is called when initializing the class object and builds all indexes of the catalog
+        once, so that the lookups of the Equipment class do not iterate over the lists.
+        """
+        self.data: Optional[EquipmentData] = data
+        self.mtime: int = mtime
+        self.weapons_by_name: Dict[str, Weapon] = {weapon.name: weapon for weapon in data.weapons}
+        self.weapons_by_id: Dict[int, Weapon] = {weapon.id: weapon for weapon in data.weapons}
+        self.armors_by_name: Dict[str, Armor] = {armor.name: armor for armor in data.armors}
+        self.armors_by_id: Dict[int, Armor] = {armor.id: armor for armor in data.armors}
+        self.weapons_names: List[str] = [weapon.name for weapon in data.weapons]
+        self.armors_names: List[str] = [armor.name for armor in data.armors]
+        self._sorted_weapons_names: List[str] = sorted(self.weapons_names)
+        self._sorted_armors_names: List[str] = sorted(self.armors_names)
+
+    def get_weapon(self, name: str) -> Optional[Weapon]:
+        return self.weapons_by_name.get(name)
+
+    def get_armor(self, name: str) -> Optional[Armor]:
+        return self.armors_by_name.get(name)
+
+    def get_weapon_by_id(self, weapon_id: int) -> Optional[Weapon]:
+        return self.weapons_by_id.get(weapon_id)
+
+    def get_armor_by_id(self, armor_id: int) -> Optional[Armor]:
+        return self.armors_by_id.get(armor_id)
+
+    def get_weapons_names(self) -> List[str]:
+        return self.weapons_names
+
+    def get_armors_names(self) -> List[str]:
+        return self.armors_names
+
+    def search_weapons(self, prefix: str, after: str, limit: int) -> List[str]:
+        return _search_sorted(self._sorted_weapons_names, prefix, after, limit)
+
+    def search_armors(self, prefix: str, after: str, limit: int) -> List[str]:
+        return _search_sorted(self._sorted_armors_names, prefix, after, limit)
+
+
+_catalog: Optional[BaseEquipmentCatalog] = None
+_catalog_lock: threading.Lock = threading.Lock()
+
+
+def _catalog_path() -> str:
+    """
+    The _catalog_path function returns the path of the SQLite catalog from the EQUIPMENT_DB environment
+    variable, or the path of the equipment file.
+    """
+    return os.environ.get('EQUIPMENT_DB') or EQUIPMENT_PATH
+
+
+def _load_catalog(path: str, mtime: int) -> BaseEquipmentCatalog:
+    if path != EQUIPMENT_PATH:
+        from sqlite_equipment import SQLiteEquipmentCatalog
+
+        return SQLiteEquipmentCatalog(path, mtime)
+    return EquipmentCatalog(Equipment._get_equipment_data(), mtime)
+
+
+def get_catalog() -> BaseEquipmentCatalog:
+    """
+    The get_catalog function returns the catalog of equipment shared by the whole process: the equipment file
+    loaded into memory, or the SQLite catalog from the EQUIPMENT_DB environment variable for large catalogs.
+    The catalog is opened on the first call and then only when the modification time of its file changes.
+    The new catalog is built aside and replaces the previous one with a single assignment, so readers always
+    see a complete catalog.
+    """
+    global _catalog
+    path = _catalog_path()
+    mtime = os.stat(path).st_mtime_ns
+    catalog = _catalog
+    if catalog is not None and catalog.mtime == mtime:
+        return catalog
+    with _catalog_lock:
+        catalog = _catalog
+        if catalog is None or catalog.mtime != mtime:
+            catalog = _load_catalog(path, mtime)
+            _catalog = catalog
+    return catalog
+
+
 class Equipment:
     """
     The Equipment class is designed to load and form objects of armor and weapons used by the characters of the game.
@@ -54,35 +239,46 @@ class Equipment:
     """
     def __init__(self):
         """
-        The "__init__" method is called when initializing the class object and generates the class attribute
-        by calling the data loading method from an external file.
+        The "__init__" method is called when initializing the class object and takes the shared catalog
+        of equipment, the data file is read only when it has been changed since the previous load.
         """
-        self.equipment = self._get_equipment_data()
+        self.catalog: BaseEquipmentCatalog = get_catalog()
+        self.equipment: Optional[EquipmentData] = self.catalog.data
 
     def get_weapon(self, weapon_name: str) -> Weapon:
         """
         The get_weapon function defines a method of the Equipment class, takes the name of the weapon
         as a string as an argument, and returns the requested type of weapon as an instance of the Weapon class.
         """
-        for weapon in self.equipment.weapons:
-            if weapon.name == weapon_name:
-                return weapon
+        return self.catalog.get_weapon(weapon_name)
 
     def get_armor(self, armor_name: str) -> Armor:
         """
         The get_armor function defines a method of the Equipment class, takes as an argument the name of the armor
         as a string and returns the requested type of armor as an instance of the Armor class.
         """
-        for armor in self.equipment.armors:
-            if armor.name == armor_name:
-                return armor
+        return self.catalog.get_armor(armor_name)
+
+    def get_weapon_by_id(self, weapon_id: int) -> Weapon:
+        """
+        The get_weapon_by_id function defines a method of the Equipment class, takes the id of the weapon
+        as an argument, and returns the requested type of weapon as an instance of the Weapon class.
+        """
+        return self.catalog.get_weapon_by_id(weapon_id)
+
+    def get_armor_by_id(self, armor_id: int) -> Armor:
+        """
+        The get_armor_by_id function defines a method of the Equipment class, takes the id of the armor
+        as an argument, and returns the requested type of armor as an instance of the Armor class.
+        """
+        return self.catalog.get_armor_by_id(armor_id)
 
     def get_weapons_names(self) -> List[str]:
         """
         The get_weapons_names function defines a method of the Equipment class, does not accept arguments,
         and when called generates and returns the names of all available weapons, in the form of a list of strings.
         """
-        return [weapon.name for weapon in self.equipment.weapons]
+        return self.catalog.get_weapons_names()
 
     def get_armors_names(self) -> List[str]:
         """
@@ -90,18 +286,37 @@ class Equipment:
         and when called generates and returns the names of all available types of armor,
         in the form of a list of strings.
         """
-        return [armor.name for armor in self.equipment.armors]
+        return self.catalog.get_armors_names()
+
+    def search_weapons(self, prefix: str = '', after: str = '', limit: int = PAGE_SIZE) -> Page:
+        """
+        The search_weapons function defines a method of the Equipment class, takes the beginning of the name,
+        the name after which the page starts and the size of the page, and returns the page of the names
+        of weapons in alphabetical order. The search uses the index of names and does not depend on the size
+        of the catalog.
+        """
+        names = self.catalog.search_weapons(prefix, after, limit + 1)
+        return Page(names[:limit], names[limit - 1] if len(names) > limit else None)
+
+    def search_armors(self, prefix: str = '', after: str = '', limit: int = PAGE_SIZE) -> Page:
+        """
+        The search_armors function defines a method of the Equipment class, takes the beginning of the name,
+        the name after which the page starts and the size of the page, and returns the page of the names
+        of armors in alphabetical order.
+        """
+        names = self.catalog.search_armors(prefix, after, limit + 1)
+        return Page(names[:limit], names[limit - 1] if len(names) > limit else None)
 
     @staticmethod
+    @timed('equipment_load_duration_seconds', 'Time spent loading the equipment file.')
     def _get_equipment_data() -> EquipmentData:
         """
         The _get_equipment_data function defines a protected method of the Equipment class, does not accept arguments,
         and when called loads data from an external file, forms an object of the EquipmentData class.
         """
-        with open("./data/equipment.json", 'r', encoding='utf-8') as equipment_file:
+        with open(EQUIPMENT_PATH, 'r', encoding='utf-8') as equipment_file:
             data = json.load(equipment_file)
-        equipment_schema = marshmallow_dataclass.class_schema(EquipmentData)
         try:
-            return equipment_schema().load(data)
+            return EquipmentSchema().load(data)
         except marshmallow.exceptions.ValidationError:
             raise ValueError
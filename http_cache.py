@@ -0,0 +1,146 @@
+from collections import OrderedDict
+from typing import Callable, NamedTuple, Optional
+import functools
+import gzip
+import hashlib
+import os
+import threading
+
+from flask import Response, current_app, request
+
+from equipment import get_catalog
+from matchups import classes_version
+from metrics import registry as metrics_registry
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+MAX_PAGES: int = 1024
+MAX_AGE: int = 60
+CONTENT_TYPE: str = 'text/html; charset=utf-8'
+# The pages are small and compressed on every miss, the highest levels cost much more time for a few bytes.
+GZIP_LEVEL: int = 6
+BROTLI_QUALITY: int = 5
+
+page_cache_hits = metrics_registry.counter('page_cache_hits_total', 'Pages served from the cache.')
+page_cache_misses = metrics_registry.counter('page_cache_misses_total', 'Pages rendered and put into the cache.')
+
+
+class CachedPage(NamedTuple):
+    """
+    The CachedPage class is a named tuple with a rendered page, the version of the data it was rendered from,
+    its ETag and its bodies: uncompressed, compressed with gzip and with brotli, if it is installed.
+    """
+    version: tuple
+    etag: str
+    body: bytes
+    gzip_body: bytes
+    brotli_body: Optional[bytes]
+
+
+class PageCache:
+    """
+    The PageCache class keeps the rendered pages by the endpoint, the query parameters and the variant of the page.
+    The number of pages is limited, the least recently used page is evicted when the limit is reached.
+    """
+    def __init__(self, max_size: int = MAX_PAGES):
+        self.max_size: int = max_size
+        self._pages: OrderedDict[tuple, CachedPage] = OrderedDict()
+        self._lock: threading.Lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._pages)
+
+    def get(self, key: tuple, version: tuple) -> Optional[CachedPage]:
+        with self._lock:
+            page = self._pages.get(key)
+            if page is None or page.version != version:
+                return None
+            self._pages.move_to_end(key)
+            return page
+
+    def put(self, key: tuple, page: CachedPage):
+        with self._lock:
+            self._pages[key] = page
+            self._pages.move_to_end(key)
+            while len(self._pages) > self.max_size:
+                self._pages.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
+
+
+pages: PageCache = PageCache()
+
+
+def _template_mtime(template: str) -> int:
+    return os.stat(os.path.join(current_app.root_path, current_app.template_folder, template)).st_mtime_ns
+
+
+def _make_page(version: tuple, html: str) -> CachedPage:
+    """
+    The _make_page function encodes and compresses a rendered page once, when it is put into the cache.
+    """
+    body = html.encode('utf-8')
+    etag = hashlib.sha1(body).hexdigest()[:20]
+    return CachedPage(version=version, etag=etag, body=body, gzip_body=gzip.compress(body, GZIP_LEVEL, mtime=0),
+                      brotli_body=brotli.compress(body, quality=BROTLI_QUALITY) if brotli else None)
+
+
+def _respond(page: CachedPage, private: bool) -> Response:
+    """
+    The _respond function returns the page in the best encoding accepted by the client, or the response 304
+    if the client already has it. Every encoding of the page has its own strong ETag.
+    """
+    encodings = request.accept_encodings
+    if page.brotli_body is not None and encodings['br']:
+        encoding, body = 'br', page.brotli_body
+    elif encodings['gzip']:
+        encoding, body = 'gzip', page.gzip_body
+    else:
+        encoding, body = None, page.body
+    etag = f'{page.etag}-{encoding}' if encoding else page.etag
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        response = Response(body, content_type=CONTENT_TYPE)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = f"{'private' if private else 'public'}, max-age={MAX_AGE}"
+    response.headers['Vary'] = 'Accept-Encoding, Cookie' if private else 'Accept-Encoding'
+    return response
+
+
+def cached_page(template: str, variant: Optional[Callable[[], tuple]] = None,
+                params: tuple[str, ...] = ()) -> Callable:
+    """
+    The cached_page function returns a decorator of a view that renders a page from the template, unit_classes
+    and the equipment catalog. The GET requests are answered with the page rendered once for the version
+    of these data and kept compressed in the cache. The page is looked up by the values of the query
+    parameters the view reads, listed in params, so the other parameters and their order do not make
+    new pages. The variant function returns the part of the state of the session the page depends on,
+    such a page is marked as private.
+    """
+    def decorator(view: Callable) -> Callable:
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method != 'GET':
+                return view(*args, **kwargs)
+            key = (request.endpoint, tuple(request.args.get(param, '') for param in params),
+                   variant() if variant else None)
+            version = (_template_mtime(template), get_catalog().mtime, classes_version())
+            page = pages.get(key, version)
+            if page is None:
+                page_cache_misses.inc()
+                page = _make_page(version, view(*args, **kwargs))
+                pages.put(key, page)
+            else:
+                page_cache_hits.inc()
+            return _respond(page, private=variant is not None)
+        return wrapper
+    return decorator
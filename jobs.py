@@ -0,0 +1,272 @@
+from collections import OrderedDict
+from concurrent.futures import CancelledError, Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Optional
+import multiprocessing
+import os
+import threading
+import uuid
+
+import marshmallow
+import marshmallow_dataclass
+
+from classes import unit_classes
+from equipment import Equipment
+from simulator import POLICIES, POLICY_HIT
+from tournament import matchup_seed, run_matchup
+
+
+MAX_WORKERS: int = max((os.cpu_count() or 1) - 1, 1)
+MAX_ACTIVE_JOBS: int = 8
+MAX_FIGHTS: int = 1_000_000
+CHUNK_SIZE: int = 1000
+KEEP_FINISHED_JOBS: int = 1000
+
+STATUS_QUEUED: str = 'queued'
+STATUS_RUNNING: str = 'running'
+STATUS_DONE: str = 'done'
+STATUS_FAILED: str = 'failed'
+
+
+class QueueFullError(Exception):
+    """
+    The QueueFullError exception is raised when a job is submitted while the maximum number of jobs
+    is already waiting or running.
+    """
+
+
+@dataclass
+class SetupData:
+    """
+    The SetupData class is a dataclass that defines the names of the class, the weapon and the armor
+    of a character in a job request.
+    """
+    unit_class: str = field(metadata={'validate': marshmallow.validate.OneOf(list(unit_classes))})
+    weapon: str
+    armor: str
+
+
+@dataclass
+class JobRequest:
+    """
+    The JobRequest class is a dataclass that defines the list and type of attributes of a request
+    to simulate fights of a player and an enemy. Used to load data.
+    """
+    player: SetupData
+    enemy: SetupData
+    fights: int = field(default=1000, metadata={'validate': marshmallow.validate.Range(1, MAX_FIGHTS)})
+    policy: str = field(default=POLICY_HIT, metadata={'validate': marshmallow.validate.OneOf(POLICIES)})
+    seed: Optional[int] = field(default=None, metadata={'validate': marshmallow.validate.Range(min=0)})
+
+
+JobRequestSchema = marshmallow_dataclass.class_schema(JobRequest)
+
+
+def load_job_request(data: dict) -> JobRequest:
+    """
+    The load_job_request function validates the data of a request and forms an object of the JobRequest class,
+    raises ValueError with the description of the errors if the data is not valid.
+    """
+    try:
+        job_request = JobRequestSchema().load(data)
+    except marshmallow.exceptions.ValidationError as error:
+        raise ValueError(error.messages)
+    equipment = Equipment()
+    for side in ('player', 'enemy'):
+        setup = getattr(job_request, side)
+        if equipment.get_weapon(setup.weapon) is None:
+            raise ValueError({side: {'weapon': ['Unknown weapon.']}})
+        if equipment.get_armor(setup.armor) is None:
+            raise ValueError({side: {'armor': ['Unknown armor.']}})
+    return job_request
+
+
+@dataclass
+class Job:
+    """
+    The Job class is a dataclass that contains the progress and the aggregated results of a job.
+    """
+    id: str
+    request: JobRequest
+    chunks: int
+    chunks_done: int = 0
+    wins: int = 0
+    draws: int = 0
+    losses: int = 0
+    unfinished: int = 0
+    turns: float = 0
+    status: str = STATUS_QUEUED
+    error: Optional[str] = None
+    futures: list[Future] = field(default_factory=list, repr=False)
+    executor: Optional[ProcessPoolExecutor] = field(default=None, repr=False)
+
+    def to_dict(self) -> dict:
+        """
+        The to_dict function defines a method of the Job class and returns the progress and the results
+        of the job in the form of a dictionary.
+        """
+        fights = self.wins + self.draws + self.losses + self.unfinished
+        finished = fights - self.unfinished
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'progress': self.chunks_done / self.chunks,
+            'fights': fights,
+            'wins': self.wins,
+            'draws': self.draws,
+            'losses': self.losses,
+            'unfinished': self.unfinished,
+            'win_rate': self.wins / fights if fights else None,
+            'mean_turns': self.turns / finished if finished else None,
+            'error': self.error,
+        }
+
+
+class JobManager:
+    """
+    The JobManager class runs simulation jobs in a pool of worker processes. A job is split into chunks
+    of CHUNK_SIZE fights, the results of the chunks are added up as they finish. No more than max_jobs jobs
+    can wait or run at the same time, the request threads never wait for the results. If a worker process dies,
+    the pool is broken: the jobs running in it fail and the next job gets a new pool.
+    """
+    def __init__(self, max_workers: int = MAX_WORKERS, max_jobs: int = MAX_ACTIVE_JOBS):
+        """
+        The "__init__" method is called when initializing the class object, takes the number of worker
+        processes and the maximum number of active jobs. The pool is created on the first job.
+        """
+        self.max_workers: int = max_workers
+        self.max_jobs: int = max_jobs
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._jobs: OrderedDict[str, Job] = OrderedDict()
+        self._active: int = 0
+        self._lock: threading.Lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context('spawn'))
+        return self._executor
+
+    def _discard_executor(self, executor: Optional[ProcessPoolExecutor]):
+        """
+        The _discard_executor function defines a protected method of the JobManager class, takes a broken pool
+        and shuts it down, the next job creates a new one. A pool that has already been replaced is ignored.
+        """
+        with self._lock:
+            if executor is None or self._executor is not executor:
+                return
+            self._executor = None
+        executor.shutdown(wait=False)
+
+    def submit(self, job_request: JobRequest) -> Job:
+        """
+        The submit function defines a method of the JobManager class, takes a job request, queues its chunks
+        and returns the job at once. Raises QueueFullError if there are too many active jobs. A job whose chunks
+        cannot be queued is returned failed and does not keep its place in the queue.
+        """
+        with self._lock:
+            if self._active >= self.max_jobs:
+                raise QueueFullError
+            self._active += 1
+            chunks = -(-job_request.fights // CHUNK_SIZE)
+            job = Job(id=uuid.uuid4().hex, request=job_request, chunks=chunks)
+            self._jobs[job.id] = job
+        try:
+            seed = job_request.seed if job_request.seed is not None else uuid.uuid4().int
+            player = (job_request.player.unit_class, job_request.player.weapon, job_request.player.armor)
+            enemy = (job_request.enemy.unit_class, job_request.enemy.weapon, job_request.enemy.armor)
+            for chunk in range(chunks):
+                fights = min(CHUNK_SIZE, job_request.fights - chunk * CHUNK_SIZE)
+                task = (0, chunk, player, enemy, fights, job_request.policy, matchup_seed(seed, 0, chunk))
+                future = self._submit_chunk(job, task)
+                job.futures.append(future)
+                future.add_done_callback(partial(self._on_chunk_done, job))
+        except Exception as error:
+            # the place of the job in the queue is freed whatever failed, unless a failed chunk has done it
+            with self._lock:
+                cancelled = job.futures[:]
+                if job.status not in (STATUS_DONE, STATUS_FAILED):
+                    job.status = STATUS_FAILED
+                    job.error = repr(error)
+                    self._finish(job)
+            for future in cancelled:
+                future.cancel()
+        return job
+
+    def _submit_chunk(self, job: Job, task: tuple) -> Future:
+        """
+        The _submit_chunk function defines a protected method of the JobManager class, takes the job and
+        the task of its chunk and submits it to the pool. If the pool turns out to be broken before the first
+        chunk of the job, the job is submitted to a new pool, otherwise BrokenProcessPool is raised.
+        """
+        with self._lock:
+            executor = job.executor = job.executor or self._get_executor()
+        try:
+            return executor.submit(run_matchup, task)
+        except BrokenProcessPool:
+            self._discard_executor(executor)
+            if job.futures:
+                raise
+        with self._lock:
+            executor = job.executor = self._get_executor()
+        return executor.submit(run_matchup, task)
+
+    def _on_chunk_done(self, job: Job, future: Future):
+        """
+        The _on_chunk_done function defines a protected method of the JobManager class, it is called
+        when a chunk of the job finishes and adds its results to the job. If the chunk failed, the job fails
+        and its remaining chunks are cancelled, a pool broken by a dead worker is replaced for the next jobs.
+        """
+        cancelled: list[Future] = []
+        error = CancelledError() if future.cancelled() else future.exception()
+        if isinstance(error, BrokenProcessPool):
+            self._discard_executor(job.executor)
+        with self._lock:
+            if job.status in (STATUS_DONE, STATUS_FAILED):
+                return
+            if error is not None:
+                job.status = STATUS_FAILED
+                job.error = repr(error)
+                if not isinstance(error, BrokenProcessPool):
+                    # the chunks left in a broken pool are failed by the pool itself
+                    cancelled = job.futures[:]
+                self._finish(job)
+            else:
+                _, _, wins, draws, losses, unfinished, mean_turns = future.result()
+                job.wins += wins
+                job.draws += draws
+                job.losses += losses
+                job.unfinished += unfinished
+                job.turns += mean_turns * (wins + draws + losses)
+                job.chunks_done += 1
+                job.status = STATUS_RUNNING
+                if job.chunks_done == job.chunks:
+                    job.status = STATUS_DONE
+                    self._finish(job)
+        for other in cancelled:
+            other.cancel()
+
+    def _finish(self, job: Job):
+        """
+        The _finish function defines a protected method of the JobManager class, frees the place of a finished
+        job in the queue and forgets the oldest finished jobs above KEEP_FINISHED_JOBS.
+        """
+        job.futures.clear()
+        job.executor = None
+        self._active -= 1
+        while len(self._jobs) > KEEP_FINISHED_JOBS + self._active:
+            job_id, job = next(iter(self._jobs.items()))
+            if job.status not in (STATUS_DONE, STATUS_FAILED):
+                break
+            self._jobs.popitem(last=False)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """
+        The get function defines a method of the JobManager class, takes the id of a job and returns the job,
+        or None if it does not exist.
+        """
+        return self._jobs.get(job_id)
+
+
+jobs: JobManager = JobManager()
@@ -0,0 +1,197 @@
+from http.cookiejar import CookieJar
+from random import Random
+from typing import Optional
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode
+from urllib.request import HTTPCookieProcessor, HTTPRedirectHandler, OpenerDirector, build_opener
+import argparse
+import json
+import math
+import re
+import threading
+import time
+
+
+TIMEOUT: float = 10
+MAX_MOVES: int = 500
+MOVES: tuple[tuple[str, float], ...] = (('/fight/hit', 0.7), ('/fight/use-skill', 0.1), ('/fight/pass-turn', 0.2))
+BATTLE_RESULTS: tuple[str, ...] = ('Игрок выиграл битву', 'Игрок проиграл битву', 'Ничья')
+SELECT_PATTERN: re.Pattern = re.compile(r'<select[^>]*name="(\w+)"[^>]*>(.*?)</select>', re.S)
+OPTION_PATTERN: re.Pattern = re.compile(r'<option value="([^"]+)">')
+
+
+class _NoRedirect(HTTPRedirectHandler):
+    """
+    The _NoRedirect class makes urllib return the redirects instead of following them,
+    so that every route is measured separately.
+    """
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+def percentile(values: list[float], share: float) -> float:
+    """
+    The percentile function returns the value below which the share of the sorted values lies,
+    by the nearest rank.
+    """
+    if not values:
+        return math.nan
+    return values[min(len(values) - 1, max(0, math.ceil(share * len(values)) - 1))]
+
+
+class VirtualUser:
+    """
+    The VirtualUser class plays complete game sessions against the application like a visitor
+    with its own cookies: chooses a random hero and enemy, starts the fight and makes random moves
+    until the fight ends. The time of every request is recorded by the route.
+    """
+    def __init__(self, base_url: str, seed: int, think_time: float = 0):
+        """
+        The "__init__" method is called when initializing the class object, takes the address
+        of the application, the seed of the choices of the user and the pause between the requests.
+        """
+        self.base_url: str = base_url.rstrip('/')
+        self.rng: Random = Random(seed)
+        self.think_time: float = think_time
+        self.opener: OpenerDirector = build_opener(HTTPCookieProcessor(CookieJar()), _NoRedirect)
+        self.latencies: dict[str, list[float]] = {}
+        self.errors: dict[str, int] = {}
+        self.sessions: int = 0
+
+    def request(self, path: str, data: Optional[dict] = None) -> Optional[str]:
+        """
+        The request function defines a method of the VirtualUser class, sends a GET request, or a POST request
+        with the form data, records its time and returns the body of the response, or None on an error.
+        """
+        route = f"{'POST' if data is not None else 'GET'} {path}"
+        body = urlencode(data).encode('utf-8') if data is not None else None
+        started = time.perf_counter()
+        try:
+            with self.opener.open(self.base_url + path, data=body, timeout=TIMEOUT) as response:
+                text = response.read().decode('utf-8')
+        except HTTPError as error:
+            text = None if error.code >= 400 else ''
+        except (URLError, OSError):
+            text = None
+        self.latencies.setdefault(route, []).append(time.perf_counter() - started)
+        if text is None:
+            self.errors[route] = self.errors.get(route, 0) + 1
+        if self.think_time:
+            time.sleep(self.rng.uniform(0, 2 * self.think_time))
+        return text
+
+    def _choose(self, form: str) -> dict[str, str]:
+        choices = {name: OPTION_PATTERN.findall(options) for name, options in SELECT_PATTERN.findall(form)}
+        return {name: self.rng.choice(options) for name, options in choices.items() if options}
+
+    def play(self) -> bool:
+        """
+        The play function defines a method of the VirtualUser class, plays one session from the choice
+        of the hero to the end of the fight and returns True if it was completed without errors.
+        """
+        form = self.request('/choose-hero/')
+        if not form:
+            return False
+        hero = self._choose(form)
+        if self.request('/choose-hero/', {'name': 'player', **hero}) is None:
+            return False
+        enemy = self._choose(form)
+        if self.request('/choose-enemy/', {'name': 'enemy', **enemy}) is None:
+            return False
+        if self.request('/fight/') is None:
+            return False
+        paths, weights = zip(*MOVES)
+        for _ in range(MAX_MOVES):
+            page = self.request(self.rng.choices(paths, weights)[0])
+            if page is None:
+                return False
+            if any(result in page for result in BATTLE_RESULTS):
+                self.sessions += 1
+                return True
+        return False
+
+    def run(self, deadline: float):
+        while time.monotonic() < deadline:
+            self.play()
+
+
+def run_load(base_url: str, users: int, duration: float, think_time: float = 0, seed: int = 0) -> dict:
+    """
+    The run_load function runs the virtual users in threads for duration seconds and returns the report:
+    the number of requests, errors and the percentiles of the latency by the route and in total,
+    the throughput and the number of completed sessions.
+    """
+    virtual_users = [VirtualUser(base_url, seed * 100_003 + i, think_time) for i in range(users)]
+    deadline = time.monotonic() + duration
+    started = time.perf_counter()
+    threads = [threading.Thread(target=user.run, args=(deadline,), daemon=True) for user in virtual_users]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies: dict[str, list[float]] = {}
+    errors: dict[str, int] = {}
+    for user in virtual_users:
+        for route, values in user.latencies.items():
+            latencies.setdefault(route, []).extend(values)
+        for route, count in user.errors.items():
+            errors[route] = errors.get(route, 0) + count
+    latencies['total'] = [value for values in latencies.values() for value in values]
+    errors['total'] = sum(errors.values())
+    routes = {}
+    for route, values in sorted(latencies.items(), key=lambda item: item[0] == 'total'):
+        values.sort()
+        routes[route] = {
+            'requests': len(values),
+            'errors': errors.get(route, 0),
+            'p50': percentile(values, 0.5),
+            'p95': percentile(values, 0.95),
+            'p99': percentile(values, 0.99),
+        }
+    total = routes['total']['requests']
+    return {
+        'users': users,
+        'duration': elapsed,
+        'sessions': sum(user.sessions for user in virtual_users),
+        'throughput': total / elapsed,
+        'error_rate': errors['total'] / total if total else 0.0,
+        'routes': routes,
+    }
+
+
+def print_report(report: dict):
+    print(f"users: {report['users']}, {report['duration']:.1f}s, sessions: {report['sessions']}, "
+          f"throughput: {report['throughput']:.1f} req/s, error rate: {report['error_rate']:.2%}")
+    print(f"{'route':28} {'requests':>9} {'errors':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for route, stats in report['routes'].items():
+        print(f"{route:28} {stats['requests']:9} {stats['errors']:7} {stats['p50'] * 1000:9.2f} "
+              f"{stats['p95'] * 1000:9.2f} {stats['p99'] * 1000:9.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Plays complete game sessions against a running instance '
+                                                 'with many concurrent virtual users.')
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('-c', '--users', default='10',
+                        help='number of virtual users, or a comma-separated list to run one step per number')
+    parser.add_argument('-d', '--duration', type=float, default=30, help='seconds per step')
+    parser.add_argument('--think-time', type=float, default=0, help='mean pause between requests in seconds')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-o', '--output', help='save the reports to a JSON file')
+    args = parser.parse_args()
+
+    reports = []
+    for users in (int(value) for value in args.users.split(',')):
+        report = run_load(args.url, users, args.duration, think_time=args.think_time, seed=args.seed)
+        print_report(report)
+        print()
+        reports.append(report)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output_file:
+            json.dump(reports, output_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
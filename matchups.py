@@ -0,0 +1,154 @@
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from typing import Optional
+import math
+import threading
+
+from base import Arena
+from classes import UnitClass, unit_classes
+from equipment import Armor, Weapon, BaseEquipmentCatalog, get_catalog
+from simulator import damage_table, roll_probabilities
+
+
+MatchupKey = tuple[str, str, str, str]
+
+MAX_PREVIEWS: int = 100_000
+
+
+@dataclass(frozen=True)
+class MatchupPreview:
+    """
+    The MatchupPreview class is a dataclass that describes the hits of an attacker with a class and a weapon
+    on a defender with a class and an armor: the expected damage of a hit with and without the armor
+    of the defender, the chance that the armor stops the hit, and the expected number of hits and turns
+    needed to kill the defender. The turns take into account that the attacker regenerates the stamina
+    for the hits slower than it spends it.
+    """
+    expected_damage: float
+    expected_damage_unarmored: float
+    block_chance: float
+    hits_to_kill: Optional[int]
+    turns_to_kill: Optional[int]
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def compute_preview(attacker: UnitClass, weapon: Weapon, defender: UnitClass, armor: Armor) -> MatchupPreview:
+    """
+    The compute_preview function computes the preview of one matchup from the damage of every possible
+    weapon roll, taken with the same operations as in BaseUnit._count_damage, and its probability.
+    """
+    probabilities = roll_probabilities(weapon.min_damage, weapon.max_damage)
+    _, armored = damage_table(attacker.attack, weapon.min_damage, weapon.max_damage, armor.defence * defender.armor)
+    _, unarmored = damage_table(attacker.attack, weapon.min_damage, weapon.max_damage, 0)
+    expected_damage = float(probabilities @ armored)
+    if expected_damage <= 0:
+        hits = turns = None
+    else:
+        hits = math.ceil(defender.max_health / expected_damage)
+        regeneration = Arena.STAMINA_PER_ROUND
+        turns = max(hits, math.ceil((hits * weapon.stamina_per_hit - attacker.max_stamina) / regeneration))
+    return MatchupPreview(
+        expected_damage=round(expected_damage, 2),
+        expected_damage_unarmored=round(float(probabilities @ unarmored), 2),
+        block_chance=round(float(probabilities[armored <= 0].sum()), 4),
+        hits_to_kill=hits,
+        turns_to_kill=turns,
+    )
+
+
+def classes_version() -> tuple:
+    return tuple((unit_class.name, unit_class.max_health, unit_class.max_stamina, unit_class.attack,
+                  unit_class.stamina, unit_class.armor, unit_class.skill.stamina, unit_class.skill.damage)
+                 for unit_class in unit_classes.values())
+
+
+class MatchupTable:
+    """
+    The MatchupTable class holds the previews of every (attacker class, weapon) and (defender class, armor)
+    pair, built once for a version of the equipment catalog and of unit_classes. Lookups are dictionary reads.
+    The previews of a SQLite catalog are too many to build at once, they are computed on the first lookup
+    and kept up to MAX_PREVIEWS of them, the least recently used ones are evicted.
+    """
+    def __init__(self, version: tuple):
+        """
+        The "__init__" method is called when initializing the class object, takes the version of the data
+        and computes all previews of a catalog loaded into memory.
+        """
+        self.version: tuple = version
+        self.catalog: BaseEquipmentCatalog = get_catalog()
+        self.previews: OrderedDict[MatchupKey, MatchupPreview] = OrderedDict()
+        self._lock: threading.Lock = threading.Lock()
+        if self.catalog.data is not None:
+            self.previews = OrderedDict(
+                ((attacker.name, weapon.name, defender.name, armor.name),
+                 compute_preview(attacker, weapon, defender, armor))
+                for attacker in unit_classes.values() for weapon in self.catalog.data.weapons
+                for defender in unit_classes.values() for armor in self.catalog.data.armors
+            )
+
+    def _compute(self, key: MatchupKey) -> Optional[MatchupPreview]:
+        attacker, weapon, defender, armor = key
+        if self.catalog.data is not None or attacker not in unit_classes or defender not in unit_classes:
+            return None
+        weapon = self.catalog.get_weapon(weapon)
+        armor = self.catalog.get_armor(armor)
+        if weapon is None or armor is None:
+            return None
+        preview = compute_preview(unit_classes[attacker], weapon, unit_classes[defender], armor)
+        with self._lock:
+            self.previews[key] = preview
+            while len(self.previews) > MAX_PREVIEWS:
+                self.previews.popitem(last=False)
+        return preview
+
+    def get(self, attacker: str, weapon: str, defender: str, armor: str) -> Optional[MatchupPreview]:
+        """
+        The get function defines a method of the MatchupTable class, takes the names of the attacker class,
+        its weapon, the defender class and its armor and returns the preview, or None if it is unknown.
+        """
+        key = (attacker, weapon, defender, armor)
+        with self._lock:
+            preview = self.previews.get(key)
+            if preview is not None and self.catalog.data is None:
+                self.previews.move_to_end(key)
+        if preview is None:
+            preview = self._compute(key)
+        return preview
+
+    def against(self, attacker: str, weapon: str, armors: list[str]) -> list[tuple[str, str, MatchupPreview]]:
+        """
+        The against function defines a method of the MatchupTable class, takes the names of the attacker class,
+        its weapon and the names of armors and returns the previews of its hits on every defender class
+        in each of the armors.
+        """
+        previews = []
+        for defender in unit_classes:
+            for armor in armors:
+                preview = self.get(attacker, weapon, defender, armor)
+                if preview is not None:
+                    previews.append((defender, armor, preview))
+        return previews
+
+
+_table: Optional[MatchupTable] = None
+_table_lock: threading.Lock = threading.Lock()
+
+
+def get_matchup_table() -> MatchupTable:
+    """
+    The get_matchup_table function returns the table of previews shared by the process, the table is rebuilt
+    only when the equipment catalog or unit_classes have changed since it was built.
+    """
+    global _table
+    version = (get_catalog().mtime, classes_version())
+    table = _table
+    if table is not None and table.version == version:
+        return table
+    with _table_lock:
+        table = _table
+        if table is None or table.version != version:
+            table = MatchupTable(version)
+            _table = table
+    return table
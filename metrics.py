@@ -0,0 +1,212 @@
+from bisect import bisect_left
+from time import perf_counter
+from typing import Callable
+import functools
+
+from flask import Flask, Response, request
+
+
+BUCKETS: tuple[float, ...] = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                              0.5, 1, 2.5, 5)
+CONTENT_TYPE: str = 'text/plain; version=0.0.4; charset=utf-8'
+# the key of the WSGI environment that marks the internal requests, like the ones of the warm-up
+UNMONITORED: str = 'metrics.unmonitored'
+
+
+def _format_labels(labels: dict[str, str]) -> str:
+    if not labels:
+        return ''
+    pairs = ','.join(f'{key}="{value}"' for key, value in labels.items())
+    return '{' + pairs + '}'
+
+
+class Counter:
+    """
+    The Counter class is a monotonically increasing value. The increment does not take a lock, so under
+    concurrent updates an increment may rarely be lost, which is acceptable for monitoring.
+    """
+    __slots__ = ('labels', 'value')
+
+    def __init__(self, labels: dict[str, str]):
+        self.labels: dict[str, str] = labels
+        self.value: float = 0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def samples(self, name: str) -> list[str]:
+        return [f'{name}{_format_labels(self.labels)} {self.value}']
+
+
+class Gauge:
+    """
+    The Gauge class is a value that is computed by a function at the moment of collecting the metrics,
+    so it costs nothing between the scrapes.
+    """
+    __slots__ = ('labels', 'function')
+
+    def __init__(self, labels: dict[str, str], function: Callable[[], float]):
+        self.labels: dict[str, str] = labels
+        self.function: Callable[[], float] = function
+
+    def samples(self, name: str) -> list[str]:
+        return [f'{name}{_format_labels(self.labels)} {self.function()}']
+
+
+class Histogram:
+    """
+    The Histogram class counts observed values in buckets allocated when it is created. Observing a value
+    is a binary search and two additions, without locks.
+    """
+    __slots__ = ('labels', 'buckets', 'counts', 'sum')
+
+    def __init__(self, labels: dict[str, str], buckets: tuple[float, ...] = BUCKETS):
+        self.labels: dict[str, str] = labels
+        self.buckets: tuple[float, ...] = buckets
+        self.counts: list[int] = [0] * (len(buckets) + 1)
+        self.sum: float = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def samples(self, name: str) -> list[str]:
+        lines = []
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            le = '+Inf' if bound == float('inf') else repr(float(bound))
+            lines.append(f'{name}_bucket{_format_labels({**self.labels, "le": le})} {total}')
+        lines.append(f'{name}_sum{_format_labels(self.labels)} {self.sum}')
+        lines.append(f'{name}_count{_format_labels(self.labels)} {total}')
+        return lines
+
+
+class MetricsRegistry:
+    """
+    The MetricsRegistry class keeps the families of metrics by name and renders them
+    in the Prometheus text format.
+    """
+    def __init__(self):
+        self._families: dict[str, tuple[str, str, list]] = {}
+
+    def _add(self, name: str, kind: str, help_text: str, metric):
+        """
+        The _add function defines a protected method of the MetricsRegistry class, adds the metric
+        to its family and returns it, or returns the metric of the family with the same labels,
+        so that an application created again does not duplicate its metrics.
+        """
+        family = self._families.setdefault(name, (kind, help_text, []))
+        for known in family[2]:
+            if known.labels == metric.labels:
+                return known
+        family[2].append(metric)
+        return metric
+
+    def counter(self, name: str, help_text: str, **labels: str) -> Counter:
+        return self._add(name, 'counter', help_text, Counter(labels))
+
+    def gauge(self, name: str, help_text: str, function: Callable[[], float], **labels: str) -> Gauge:
+        return self._add(name, 'gauge', help_text, Gauge(labels, function))
+
+    def histogram(self, name: str, help_text: str, **labels: str) -> Histogram:
+        return self._add(name, 'histogram', help_text, Histogram(labels))
+
+    def render(self) -> str:
+        """
+        The render function defines a method of the MetricsRegistry class and returns all metrics
+        in the Prometheus text format.
+        """
+        lines = []
+        for name, (kind, help_text, metrics) in self._families.items():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for metric in metrics:
+                lines.extend(metric.samples(name))
+        return '\n'.join(lines) + '\n'
+
+
+registry: MetricsRegistry = MetricsRegistry()
+
+battles_started: Counter = registry.counter('battles_started_total', 'Battles started.')
+battles_finished: Counter = registry.counter('battles_finished_total', 'Battles finished with a result.')
+battles_abandoned: Counter = registry.counter('battles_abandoned_total',
+                                              'Battles dropped or restarted before they finished.')
+
+
+def timed(name: str, help_text: str, **labels: str) -> Callable:
+    """
+    The timed function returns a decorator that observes the duration of every call of the decorated
+    function in the histogram with the given name and labels.
+    """
+    def decorator(func: Callable) -> Callable:
+        histogram = registry.histogram(name, help_text, **labels)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histogram.observe(perf_counter() - started)
+        return wrapper
+    return decorator
+
+
+def timed_method(name: str, help_text: str, **labels: str) -> Callable:
+    """
+    The timed_method function returns a decorator of a method like timed, but the duration is only observed
+    for the objects whose "monitored" attribute is True, the calls of the other objects are passed through.
+    """
+    def decorator(func: Callable) -> Callable:
+        histogram = registry.histogram(name, help_text, **labels)
+
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            if not self.monitored:
+                return func(self, *args, **kwargs)
+            started = perf_counter()
+            try:
+                return func(self, *args, **kwargs)
+            finally:
+                histogram.observe(perf_counter() - started)
+        return wrapper
+    return decorator
+
+
+def metrics_view() -> Response:
+    """
+    The view processes GET requests at the address "/metrics" and returns all metrics
+    in the Prometheus text format.
+    """
+    return Response(registry.render(), content_type=CONTENT_TYPE)
+
+
+def _timed_view(view: Callable, endpoint: str) -> Callable:
+    """
+    The _timed_view function wraps a view like timed, but the requests marked as UNMONITORED in the WSGI
+    environment are not observed.
+    """
+    histogram = registry.histogram('http_request_duration_seconds', 'Time spent in the views.', endpoint=endpoint)
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.environ.get(UNMONITORED):
+            return view(*args, **kwargs)
+        started = perf_counter()
+        try:
+            return view(*args, **kwargs)
+        finally:
+            histogram.observe(perf_counter() - started)
+    return wrapper
+
+
+def instrument_app(app: Flask):
+    """
+    The instrument_app function wraps every view of the application registered so far in a latency
+    histogram labeled with its endpoint, and adds the "/metrics" view. The internal requests marked
+    as UNMONITORED, like the ones of the warm-up, are not counted.
+    """
+    for endpoint, view in list(app.view_functions.items()):
+        app.view_functions[endpoint] = _timed_view(view, endpoint)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
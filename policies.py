@@ -0,0 +1,47 @@
+from __future__ import annotations
+from typing import Callable, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from unit import PlayerUnit, EnemyUnit
+
+
+MOVE_HIT: str = 'hit'
+MOVE_SKILL: str = 'skill'
+MOVE_PASS: str = 'pass'
+
+POLICY_HIT: str = 'hit'
+POLICY_SKILL_FIRST: str = 'skill_first'
+POLICY_SKILL_WHEN_KILLS: str = 'skill_when_kills'
+
+
+def always_hit(player: PlayerUnit, enemy: EnemyUnit) -> str:
+    """
+    The always_hit function is the policy of the player that hits on every move.
+    """
+    return MOVE_HIT
+
+
+def skill_first(player: PlayerUnit, enemy: EnemyUnit) -> str:
+    """
+    The skill_first function is the policy of the player that uses the skill on the first move
+    and hits on the next ones.
+    """
+    return MOVE_HIT if player._is_skill_used else MOVE_SKILL
+
+
+def skill_when_kills(player: PlayerUnit, enemy: EnemyUnit) -> str:
+    """
+    The skill_when_kills function is the policy of the player that keeps the skill until its damage
+    kills the enemy and there is enough stamina to use it, and hits on the other moves.
+    """
+    skill = player.unit_class.skill
+    if not player._is_skill_used and skill.is_stamina_enough(player) and enemy.hp <= skill.damage:
+        return MOVE_SKILL
+    return MOVE_HIT
+
+
+PLAYER_POLICIES: dict[str, Callable[[PlayerUnit, EnemyUnit], str]] = {
+    POLICY_HIT: always_hit,
+    POLICY_SKILL_FIRST: skill_first,
+    POLICY_SKILL_WHEN_KILLS: skill_when_kills,
+}
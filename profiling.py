@@ -0,0 +1,266 @@
+from time import perf_counter, time
+from types import FrameType
+from typing import Callable, Iterable, Optional
+import argparse
+import hashlib
+import hmac
+import os
+import re
+import sys
+import threading
+
+from flask import Flask
+
+from metrics import registry as metrics_registry
+
+
+DEFAULT_DIR: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'profiles')
+HEADER: str = 'X-Profile'
+QUERY_PARAM: str = 'profile'
+MODE_HEADER: str = 'X-Profile-Mode'
+MODE_PARAM: str = 'profile_mode'
+FILE_HEADER: str = 'X-Profile-File'
+MODE_SAMPLING: str = 'sampling'
+MODE_TRACE: str = 'trace'
+SAMPLE_INTERVAL: float = 0.0005
+TOKEN_TTL: int = 300
+
+profiled_requests = metrics_registry.counter('profiled_requests_total', 'Requests run under the profiler.')
+rejected_tokens = metrics_registry.counter('profile_tokens_rejected_total',
+                                           'Requests with an expired, forged or already used profiling token.')
+
+
+def sign(secret: str, path: str, expires: int) -> str:
+    """
+    The sign function returns the token that allows profiling the requests at the path until the time expires
+    (seconds since the epoch): the time and the HMAC-SHA256 of the path and the time with the secret.
+    """
+    digest = hmac.new(secret.encode(), f'{path}\n{expires}'.encode(), hashlib.sha256).hexdigest()
+    return f'{expires}.{digest}'
+
+
+def verify(secret: str, path: str, token: str) -> bool:
+    """
+    The verify function checks that the token was made by sign with the secret for the path and has not expired.
+    """
+    expires, _, _ = token.partition('.')
+    if not expires.isdigit() or int(expires) < time():
+        return False
+    return hmac.compare_digest(sign(secret, path, int(expires)), token)
+
+
+def _frame_name(frame: FrameType) -> str:
+    code = frame.f_code
+    return f'{os.path.basename(code.co_filename)}:{code.co_qualname}'
+
+
+def _c_name(function: Callable) -> str:
+    module = getattr(function, '__module__', None) or type(getattr(function, '__self__', None)).__name__
+    return f'{module}:{getattr(function, "__qualname__", repr(function))}'
+
+
+class StackProfile:
+    """
+    The StackProfile class collects the stacks of one request in the collapsed format of flamegraph.pl
+    and speedscope: one line per stack, the frames from the outermost one separated by semicolons and the weight,
+    microseconds in the trace mode and the number of samples in the sampling mode.
+    """
+    def __init__(self):
+        self.stacks: dict[str, float] = {}
+
+    def add(self, stack: str, weight: float):
+        self.stacks[stack] = self.stacks.get(stack, 0) + weight
+
+    def collapsed(self) -> str:
+        return ''.join(f'{stack} {round(weight)}\n' for stack, weight in sorted(self.stacks.items()) if weight >= 0.5)
+
+
+class TraceProfiler:
+    """
+    The TraceProfiler class is a deterministic profiler: sys.setprofile reports every call and return
+    of the Python and C functions in the thread of the request, and the time between two events is added
+    to the stack that was running. It sees every call, also the short ones, but slows the request down several times.
+    """
+    def __init__(self):
+        self.profile: StackProfile = StackProfile()
+        self._stack: list[str] = []
+        self._last: float = 0
+
+    def _event(self, frame: FrameType, event: str, arg):
+        now = perf_counter()
+        if self._stack:
+            self.profile.add(';'.join(self._stack), (now - self._last) * 1_000_000)
+        if event == 'call':
+            self._stack.append(_frame_name(frame))
+        elif event == 'c_call':
+            self._stack.append(_c_name(arg))
+        elif self._stack:
+            self._stack.pop()
+        self._last = perf_counter()
+
+    def __enter__(self) -> 'TraceProfiler':
+        self._last = perf_counter()
+        sys.setprofile(self._event)
+        return self
+
+    def __exit__(self, *exc_info):
+        sys.setprofile(None)
+
+
+class SamplingProfiler:
+    """
+    The SamplingProfiler class is a statistical profiler: a background thread reads the stack of the thread
+    of the request every SAMPLE_INTERVAL seconds. It barely slows the request down, but misses the calls
+    shorter than the interval, so it suits the slow requests.
+    """
+    def __init__(self, interval: float = SAMPLE_INTERVAL):
+        self.profile: StackProfile = StackProfile()
+        self.interval: float = interval
+        self._thread_id: int = 0
+        self._done: threading.Event = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+
+    def _run(self):
+        while not self._done.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            names = []
+            while frame is not None:
+                names.append(_frame_name(frame))
+                frame = frame.f_back
+            if names:
+                self.profile.add(';'.join(reversed(names)), 1)
+
+    def __enter__(self) -> 'SamplingProfiler':
+        self._thread_id = threading.get_ident()
+        self._sampler = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+        self._sampler.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._done.set()
+        self._sampler.join()
+
+
+PROFILERS: dict[str, type] = {MODE_SAMPLING: SamplingProfiler, MODE_TRACE: TraceProfiler}
+
+
+class UsedTokens:
+    """
+    The UsedTokens class remembers the tokens that have already profiled a request until they expire,
+    so a token profiles only one request and cannot be replayed by whoever has seen it.
+    """
+    def __init__(self):
+        self._expires: dict[str, int] = {}
+        self._lock: threading.Lock = threading.Lock()
+
+    def use(self, token: str) -> bool:
+        """
+        The use function defines a method of the UsedTokens class, takes a valid token and returns True
+        if it has not been used yet, marking it as used, and False otherwise.
+        """
+        now = time()
+        with self._lock:
+            if token in self._expires:
+                return False
+            self._expires = {used: expires for used, expires in self._expires.items() if expires >= now}
+            self._expires[token] = int(token.partition('.')[0])
+            return True
+
+
+def _is_stream(headers: list[tuple[str, str]]) -> bool:
+    return any(name.lower() == 'content-type' and value.startswith('text/event-stream') for name, value in headers)
+
+
+class ProfilerMiddleware:
+    """
+    The ProfilerMiddleware class wraps the WSGI application and profiles the requests that carry a valid token
+    from sign in the X-Profile header or the "profile" query parameter. The whole request is profiled:
+    the view, the methods of Arena, the loading of Equipment and the rendering of Jinja templates, also
+    a body produced while it is sent. A Server-Sent Events stream never ends by itself, so it is profiled only
+    until the view returns and its events are sent as they are made. The stacks are written to a file
+    in the collapsed format, the name of the file is returned in the X-Profile-File header. Every token
+    profiles one request, the other requests only pay for looking up the token.
+    """
+    def __init__(self, wsgi_app: Callable, secret: str, directory: str = DEFAULT_DIR):
+        self.wsgi_app: Callable = wsgi_app
+        self.secret: str = secret
+        self.directory: str = directory
+        self.used_tokens: UsedTokens = UsedTokens()
+
+    def _token(self, environ: dict) -> Optional[str]:
+        token = environ.get('HTTP_X_PROFILE')
+        if token is None and QUERY_PARAM in environ.get('QUERY_STRING', ''):
+            match = re.search(rf'(?:^|&){QUERY_PARAM}=([^&]*)', environ['QUERY_STRING'])
+            token = match.group(1) if match else None
+        return token
+
+    def _mode(self, environ: dict) -> str:
+        mode = environ.get('HTTP_X_PROFILE_MODE')
+        if mode is None:
+            match = re.search(rf'(?:^|&){MODE_PARAM}=([^&]*)', environ.get('QUERY_STRING', ''))
+            mode = match.group(1) if match else MODE_SAMPLING
+        return mode if mode in PROFILERS else MODE_SAMPLING
+
+    def _path(self, environ: dict, mode: str) -> str:
+        name = re.sub(r'[^A-Za-z0-9]+', '_', environ.get('PATH_INFO', '')).strip('_') or 'index'
+        os.makedirs(self.directory, exist_ok=True)
+        return os.path.join(self.directory, f'{time():.6f}-{name}-{mode}.folded')
+
+    def __call__(self, environ: dict, start_response: Callable) -> Iterable[bytes]:
+        token = self._token(environ)
+        if token is None:
+            return self.wsgi_app(environ, start_response)
+        if not verify(self.secret, environ.get('PATH_INFO', ''), token) or not self.used_tokens.use(token):
+            rejected_tokens.inc()
+            return self.wsgi_app(environ, start_response)
+        mode = self._mode(environ)
+        path = self._path(environ, mode)
+        streams = []
+
+        def profiled_start_response(status, headers, exc_info=None):
+            streams.append(_is_stream(headers))
+            return start_response(status, headers + [(FILE_HEADER, os.path.basename(path))], exc_info)
+
+        profiled_requests.inc()
+        with PROFILERS[mode]() as profiler:
+            response = self.wsgi_app(environ, profiled_start_response)
+            if streams and streams[-1]:
+                body = response
+            else:
+                try:
+                    body = list(response)
+                finally:
+                    if hasattr(response, 'close'):
+                        response.close()
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(profiler.profile.collapsed())
+        return body
+
+
+def install_profiler(app: Flask):
+    """
+    The install_profiler function wraps the WSGI application in ProfilerMiddleware if the PROFILE_SECRET
+    environment variable is set, the stacks are written to the PROFILE_DIR directory. Without the variable
+    the application is not changed, so the profiling costs nothing.
+    """
+    secret = os.environ.get('PROFILE_SECRET')
+    if secret:
+        app.wsgi_app = ProfilerMiddleware(app.wsgi_app, secret, os.environ.get('PROFILE_DIR', DEFAULT_DIR))
+
+
+def main():
+    """
+    The main function prints the value of the X-Profile header for the path, signed with PROFILE_SECRET.
+    """
+    parser = argparse.ArgumentParser(description='Sign a request for the profiler.')
+    parser.add_argument('path', help='the path of the request, for example /fight/hit')
+    parser.add_argument('--ttl', type=int, default=TOKEN_TTL, help='seconds the token is valid')
+    args = parser.parse_args()
+    secret = os.environ.get('PROFILE_SECRET')
+    if not secret:
+        parser.error('PROFILE_SECRET is not set')
+    print(sign(secret, args.path, int(time()) + args.ttl))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,270 @@
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Optional, Union
+import os
+import threading
+import time
+import uuid
+
+from flask import Response, g, jsonify, make_response, session
+
+from base import Arena
+from battle_stats import battle_stats
+from metrics import registry as metrics_registry, battles_abandoned
+from unit import PlayerUnit, EnemyUnit
+
+
+MAX_SESSIONS: int = 10_000
+SESSION_TTL: float = 30 * 60
+SESSION_KEY: str = 'game_id'
+
+
+class StaleGameError(Exception):
+    """
+    The StaleGameError exception is raised by the backend when a game is saved, but another request
+    has saved the same game since it was loaded.
+    """
+
+
+@dataclass
+class GameSession:
+    """
+    The GameSession class is a dataclass that contains the state of one visitor's game: the arena,
+    the selected heroes and the time of the last access to it. The finished battles of the arena are added
+    to the statistics of the battles. The lock serializes the moves of concurrent requests of the same visitor
+    only while they share the object, that is with MemoryStateBackend. The backends that load a new object
+    for every request keep the version of the stored game instead: of two requests that changed the same
+    version, the one that saves later fails with StaleGameError and its changes are dropped.
+    """
+    arena: Arena = field(default_factory=lambda: Arena(stats=battle_stats, monitored=True))
+    heroes: dict[str, Union[PlayerUnit, EnemyUnit, None]] = field(
+        default_factory=lambda: {"player": None, "enemy": None})
+    last_access: float = field(default_factory=time.monotonic)
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+    version: int = field(default=0, compare=False)
+    stored: Optional[tuple[bytes, int, int]] = field(default=None, repr=False, compare=False)
+
+    @property
+    def heroes_are_chosen(self) -> bool:
+        """
+        The heroes_are_chosen function defines the property method of the GameSession class, returns True
+        if both the player and the enemy of the session have been chosen, otherwise False.
+        """
+        return self.heroes['player'] is not None and self.heroes['enemy'] is not None
+
+
+class ArenaRegistry:
+    """
+    The ArenaRegistry class stores the games of all visitors by the session id. The number of stored games
+    is limited, the games that were not accessed for longer than ttl seconds are removed, and when the limit
+    is reached the least recently used game is evicted.
+    """
+    def __init__(self, max_size: int = MAX_SESSIONS, ttl: float = SESSION_TTL):
+        """
+        The "__init__" method is called when initializing the class object, takes the maximum number
+        of stored games and the idle time after which a game is removed.
+        """
+        self.max_size: int = max_size
+        self.ttl: float = ttl
+        self._games: OrderedDict[str, GameSession] = OrderedDict()
+        self._lock: threading.Lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._games)
+
+    def get(self, session_id: str) -> Optional[GameSession]:
+        """
+        The get function defines a method of the ArenaRegistry class, takes the session id as an argument
+        and returns the game of this session, or None if it does not exist or has expired.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._evict_expired(now)
+            game = self._games.get(session_id)
+            if game is not None:
+                game.last_access = now
+                self._games.move_to_end(session_id)
+            return game
+
+    def get_or_create(self, session_id: str) -> GameSession:
+        """
+        The get_or_create function defines a method of the ArenaRegistry class, takes the session id
+        as an argument and returns the game of this session, creating a new one if necessary.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._evict_expired(now)
+            game = self._games.get(session_id)
+            if game is None:
+                game = GameSession(last_access=now)
+                self._games[session_id] = game
+                while len(self._games) > self.max_size:
+                    self._drop(self._games.popitem(last=False)[1])
+            else:
+                game.last_access = now
+                self._games.move_to_end(session_id)
+            return game
+
+    def remove(self, session_id: str):
+        """
+        The remove function defines a method of the ArenaRegistry class, takes the session id as an argument
+        and removes the game of this session from the registry.
+        """
+        with self._lock:
+            game = self._games.pop(session_id, None)
+            if game is not None:
+                self._drop(game)
+
+    def _evict_expired(self, now: float):
+        """
+        The _evict_expired function defines a protected method of the ArenaRegistry class. The games are kept
+        in the order of access, so the expired ones are always at the beginning and are removed from there.
+        """
+        while self._games:
+            session_id, game = next(iter(self._games.items()))
+            if now - game.last_access <= self.ttl:
+                break
+            self._drop(self._games.popitem(last=False)[1])
+
+    @staticmethod
+    def _drop(game: GameSession):
+        """
+        The _drop function defines a protected method of the ArenaRegistry class, it is called for every game
+        removed from the registry and counts the battles left unfinished.
+        """
+        if game.arena.game_is_running:
+            battles_abandoned.inc()
+
+
+class StateBackend(ABC):
+    """
+    The StateBackend class is an abstract class that defines where the games of the sessions are kept
+    between the requests.
+    """
+    @abstractmethod
+    def __len__(self) -> int:
+        pass
+
+    @abstractmethod
+    def load(self, session_id: str) -> Optional[GameSession]:
+        """
+        The load function defines an abstract method of the class, takes the session id and returns
+        the game of the session, or None if there is no game.
+        """
+        pass
+
+    def load_or_create(self, session_id: str) -> GameSession:
+        """
+        The load_or_create function defines a method of the class, takes the session id and returns
+        the game of the session, or a new game if there is none. The new game is stored by the save method.
+        """
+        game = self.load(session_id)
+        return game if game is not None else GameSession()
+
+    @abstractmethod
+    def save(self, session_id: str, game: GameSession):
+        """
+        The save function defines an abstract method of the class, takes the session id and the game
+        and stores the game at the end of a request. Raises StaleGameError if another request has saved
+        the game since it was loaded.
+        """
+        pass
+
+    @abstractmethod
+    def delete(self, session_id: str):
+        """
+        The delete function defines an abstract method of the class, takes the session id and removes its game.
+        """
+        pass
+
+
+class MemoryStateBackend(StateBackend):
+    """
+    The MemoryStateBackend class keeps the games as objects in an ArenaRegistry of the process.
+    Only suitable for a single process.
+    """
+    def __init__(self, games: ArenaRegistry):
+        self.games: ArenaRegistry = games
+
+    def __len__(self) -> int:
+        return len(self.games)
+
+    def load(self, session_id: str) -> Optional[GameSession]:
+        return self.games.get(session_id)
+
+    def load_or_create(self, session_id: str) -> GameSession:
+        return self.games.get_or_create(session_id)
+
+    def save(self, session_id: str, game: GameSession):
+        pass
+
+    def delete(self, session_id: str):
+        self.games.remove(session_id)
+
+
+def create_backend() -> StateBackend:
+    """
+    The create_backend function returns the backend of the games: SQLite database at the path
+    from the GAME_STATE_DB environment variable, shared by all processes, or the memory of the process.
+    """
+    path = os.environ.get('GAME_STATE_DB')
+    if path:
+        from sqlite_state import SQLiteStateBackend
+
+        return SQLiteStateBackend(path)
+    return MemoryStateBackend(registry)
+
+
+registry: ArenaRegistry = ArenaRegistry()
+backend: StateBackend = create_backend()
+metrics_registry.gauge('arenas_alive', 'Games kept by the backend of sessions.', lambda: len(backend))
+
+
+def current_game() -> GameSession:
+    """
+    The current_game function returns the game of the visitor of the current request, a new session id
+    is assigned to the visitor if the cookie does not contain one yet. The game is loaded from the backend
+    once per request.
+    """
+    game = g.get('game')
+    if game is not None:
+        return game
+    session_id = session.get(SESSION_KEY)
+    if session_id is None:
+        session_id = uuid.uuid4().hex
+        session[SESSION_KEY] = session_id
+    game = backend.load_or_create(session_id)
+    g.game = game
+    g.game_id = session_id
+    return game
+
+
+def peek_game() -> Optional[GameSession]:
+    """
+    The peek_game function returns the game of the visitor of the current request only for reading, or None
+    if the visitor has no game yet. Unlike current_game, it does not assign a session id and the game
+    is not stored at the end of the request, so the pages that only show the game do not write the backend.
+    """
+    game = g.get('game')
+    if game is not None:
+        return game
+    if 'peeked_game' not in g:
+        session_id = session.get(SESSION_KEY)
+        g.peeked_game = backend.load(session_id) if session_id is not None else None
+    return g.peeked_game
+
+
+def save_current_game(response: Response) -> Response:
+    """
+    The save_current_game function is called after every request and stores the game of the request
+    in the backend, if the request used it. If another request has changed the game in the meantime,
+    the changes of this request are dropped and the response is replaced with an error.
+    """
+    game = g.get('game')
+    if game is not None:
+        try:
+            backend.save(g.game_id, game)
+        except StaleGameError:
+            return make_response(jsonify({'error': 'Игра изменена другим запросом, повторите ход'}), 409)
+    return response
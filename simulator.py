@@ -0,0 +1,318 @@
+from dataclasses import dataclass
+from random import Random
+from typing import Optional
+import argparse
+import math
+
+import numpy as np
+
+from base import Arena
+from classes import UnitClass, unit_classes
+from equipment import Weapon, Armor, Equipment
+from policies import POLICY_HIT, POLICY_SKILL_FIRST
+from unit import PlayerUnit, EnemyUnit, ENEMY_SKILL_ROLL
+from unit_store import UnitStore
+
+
+POLICIES: tuple = (POLICY_HIT, POLICY_SKILL_FIRST)
+
+MAX_TURNS: int = 1000
+
+
+@dataclass(frozen=True)
+class FighterParams:
+    """
+    The FighterParams class is a dataclass that contains all the numbers of a character with a class,
+    a weapon and an armor, which are needed to simulate battles without creating unit objects.
+    """
+    max_health: float
+    max_stamina: float
+    attack: float
+    min_damage: float
+    max_damage: float
+    stamina_per_hit: float
+    defence: float
+    armor_stamina: float
+    skill_stamina: float
+    skill_damage: float
+
+    @classmethod
+    def from_equipment(cls, unit_class: UnitClass, weapon: Weapon, armor: Armor) -> 'FighterParams':
+        """
+        The from_equipment function defines a class method, takes the character class, the weapon
+        and the armor, and returns the numbers used by BaseUnit._count_damage and Skill.use.
+        """
+        return cls(
+            max_health=unit_class.max_health,
+            max_stamina=unit_class.max_stamina,
+            attack=unit_class.attack,
+            min_damage=weapon.min_damage,
+            max_damage=weapon.max_damage,
+            stamina_per_hit=weapon.stamina_per_hit,
+            defence=armor.defence * unit_class.armor,
+            armor_stamina=armor.stamina_per_turn * unit_class.stamina,
+            skill_stamina=unit_class.skill.stamina,
+            skill_damage=unit_class.skill.damage,
+        )
+
+
+@dataclass
+class SimulationResult:
+    """
+    The SimulationResult class is a dataclass that contains the outcome counts of simulated battles
+    and the distribution of their length, turn_counts[n] is the number of battles finished on turn n.
+    """
+    wins: int
+    draws: int
+    losses: int
+    unfinished: int
+    turn_counts: np.ndarray
+
+    @property
+    def battles(self) -> int:
+        return self.wins + self.draws + self.losses + self.unfinished
+
+    @property
+    def win_rate(self) -> float:
+        return self.wins / self.battles if self.battles else 0.0
+
+    @property
+    def draw_rate(self) -> float:
+        return self.draws / self.battles if self.battles else 0.0
+
+    @property
+    def loss_rate(self) -> float:
+        return self.losses / self.battles if self.battles else 0.0
+
+    @property
+    def mean_turns(self) -> float:
+        finished = self.turn_counts.sum()
+        if not finished:
+            return 0.0
+        return float((self.turn_counts * np.arange(self.turn_counts.size)).sum() / finished)
+
+
+def damage_table(attack: float, min_damage: float, max_damage: float, defence: float) -> tuple[int, np.ndarray]:
+    """
+    The damage_table function computes the damage of every possible weapon roll. The roll of Weapon.damage
+    is rounded to one decimal place, so it takes few values, and the damage of each of them is computed
+    with the same float operations as in BaseUnit._count_damage, negative damage is replaced with zero.
+    Returns the smallest roll in tenths and the table indexed by the roll in tenths minus this value.
+    """
+    low = int(round(min_damage * 10))
+    high = int(round(max_damage * 10))
+    table = np.empty(high - low + 1, dtype=np.float64)
+    for tenths in range(low, high + 1):
+        damage = tenths / 10 * attack
+        damage -= defence
+        table[tenths - low] = max(round(damage, 1), 0)
+    return low, table
+
+
+def roll_probabilities(min_damage: float, max_damage: float) -> np.ndarray:
+    """
+    The roll_probabilities function returns the probabilities of the values of Weapon.damage, indexed
+    like the table of the damage_table function: every value in tenths takes the part of the range
+    of the uniform distribution that is rounded to it.
+    """
+    low = int(round(min_damage * 10))
+    high = int(round(max_damage * 10))
+    if high == low:
+        return np.ones(1)
+    bounds = np.clip((np.arange(low, high + 2) - 0.5) / 10, min_damage, max_damage)
+    return np.diff(bounds) / (max_damage - min_damage)
+
+
+def _damage_tables(attacker: FighterParams, defender: FighterParams) -> tuple[int, np.ndarray, np.ndarray]:
+    """
+    The _damage_tables function returns the smallest roll of the attacker in tenths and the tables
+    of its damage with and without the armor of the defender.
+    """
+    low, armored = damage_table(attacker.attack, attacker.min_damage, attacker.max_damage, defender.defence)
+    _, unarmored = damage_table(attacker.attack, attacker.min_damage, attacker.max_damage, 0)
+    return low, armored, unarmored
+
+
+def _strike(rng: np.random.Generator, attacker: FighterParams, defender: FighterParams,
+            tables: tuple[int, np.ndarray, np.ndarray], hit: np.ndarray,
+            attacker_stamina: np.ndarray, defender_hp: np.ndarray, defender_stamina: np.ndarray):
+    """
+    The _strike function applies the rules of BaseUnit._count_damage to all battles selected by the hit mask:
+    the attacker spends stamina, the damage roll is reduced by the armor if the defender can afford it,
+    and the positive damage is subtracted from the defender's health.
+    """
+    idx = np.flatnonzero(hit)
+    if not idx.size:
+        return
+    low, armored_damage, unarmored_damage = tables
+    attacker_stamina[idx] -= attacker.stamina_per_hit
+    rolls = np.rint(rng.uniform(attacker.min_damage, attacker.max_damage, idx.size) * 10).astype(np.intp) - low
+    armored = defender_stamina[idx] >= defender.armor_stamina
+    defender_stamina[idx[armored]] -= defender.armor_stamina
+    defender_hp[idx] -= np.where(armored, armored_damage[rolls], unarmored_damage[rolls])
+
+
+def simulate(player: FighterParams, enemy: FighterParams, n_battles: int, policy: str = POLICY_HIT,
+             max_turns: int = MAX_TURNS, seed: Optional[int] = None) -> SimulationResult:
+    """
+    The simulate function runs n_battles independent battles between the player and the enemy at once,
+    keeping health and stamina of all battles in NumPy arrays. Every turn follows Arena.player_hit
+    (or Arena.player_use_skill for the skill_first policy) and Arena.next_turn: the player acts,
+    then both regenerate stamina and the enemy acts. Finished battles are dropped from the arrays,
+    battles still running after max_turns are counted as unfinished.
+    """
+    if policy not in POLICIES:
+        raise ValueError(f'Unknown policy {policy}')
+    rng = np.random.default_rng(seed)
+    player_tables = _damage_tables(player, enemy)
+    enemy_tables = _damage_tables(enemy, player)
+    player_hp = np.full(n_battles, player.max_health, dtype=np.float64)
+    player_stamina = np.full(n_battles, player.max_stamina, dtype=np.float64)
+    player_skill_used = np.zeros(n_battles, dtype=bool)
+    enemy_hp = np.full(n_battles, enemy.max_health, dtype=np.float64)
+    enemy_stamina = np.full(n_battles, enemy.max_stamina, dtype=np.float64)
+    enemy_skill_used = np.zeros(n_battles, dtype=bool)
+    wins = draws = losses = 0
+    turn_counts = np.zeros(max_turns + 1, dtype=np.int64)
+
+    for turn in range(1, max_turns + 1):
+        for phase in (0, 1):
+            if phase == 0:
+                use = ~player_skill_used if policy == POLICY_SKILL_FIRST else np.zeros(player_hp.size, dtype=bool)
+                applied = use & (player_stamina > player.skill_stamina)
+                player_stamina[applied] -= player.skill_stamina
+                enemy_hp[applied] -= player.skill_damage
+                player_skill_used |= applied
+                hit = ~use & (player_stamina >= player.stamina_per_hit)
+                _strike(rng, player, enemy, player_tables, hit, player_stamina, enemy_hp, enemy_stamina)
+            else:
+                np.minimum(player_stamina + Arena.STAMINA_PER_ROUND, player.max_stamina, out=player_stamina)
+                np.minimum(enemy_stamina + Arena.STAMINA_PER_ROUND, enemy.max_stamina, out=enemy_stamina)
+                use = (~enemy_skill_used & (enemy_stamina > enemy.skill_stamina)
+                       & (rng.integers(1, 101, enemy_hp.size) < ENEMY_SKILL_ROLL))
+                enemy_stamina[use] -= enemy.skill_stamina
+                player_hp[use] -= enemy.skill_damage
+                enemy_skill_used |= use
+                hit = ~use & (enemy_stamina >= enemy.stamina_per_hit)
+                _strike(rng, enemy, player, enemy_tables, hit, enemy_stamina, player_hp, player_stamina)
+
+            player_dead = player_hp <= 0
+            enemy_dead = enemy_hp <= 0
+            finished = player_dead | enemy_dead
+            finished_count = int(finished.sum())
+            if not finished_count:
+                continue
+            both_dead = int((player_dead & enemy_dead).sum())
+            draws += both_dead
+            wins += int(enemy_dead.sum()) - both_dead
+            losses += int(player_dead.sum()) - both_dead
+            turn_counts[turn] += finished_count
+            alive = ~finished
+            player_hp, player_stamina, player_skill_used = player_hp[alive], player_stamina[alive], player_skill_used[alive]
+            enemy_hp, enemy_stamina, enemy_skill_used = enemy_hp[alive], enemy_stamina[alive], enemy_skill_used[alive]
+        if not player_hp.size:
+            break
+
+    return SimulationResult(wins=wins, draws=draws, losses=losses, unfinished=int(player_hp.size),
+                            turn_counts=turn_counts)
+
+
+def simulate_arena(unit_class: UnitClass, weapon: Weapon, armor: Armor, enemy_class: UnitClass,
+                   enemy_weapon: Weapon, enemy_armor: Armor, n_battles: int, policy: str = POLICY_HIT,
+                   max_turns: int = MAX_TURNS, seed: Optional[int] = None,
+                   store: Optional[UnitStore] = None) -> SimulationResult:
+    """
+    The simulate_arena function runs the same battles as the simulate function one by one through
+    PlayerUnit, EnemyUnit and Arena. It is much slower and is used to check the vectorized engine.
+    The seeds of the arenas are drawn from a generator seeded with seed. If a store is passed, the characters
+    are the handles of the store instead, their slots are released when the battle ends.
+    """
+    if policy not in POLICIES:
+        raise ValueError(f'Unknown policy {policy}')
+    wins = draws = losses = unfinished = 0
+    turn_counts = np.zeros(max_turns + 1, dtype=np.int64)
+    seeds = Random(seed)
+    for _ in range(n_battles):
+        if store is not None:
+            player = store.add_player('player', unit_class, weapon, armor)
+            enemy = store.add_enemy('enemy', enemy_class, enemy_weapon, enemy_armor)
+        else:
+            player = PlayerUnit(name='player', unit_class=unit_class)
+            player.equip_weapon(weapon)
+            player.equip_armor(armor)
+            enemy = EnemyUnit(name='enemy', unit_class=enemy_class)
+            enemy.equip_weapon(enemy_weapon)
+            enemy.equip_armor(enemy_armor)
+        arena = Arena()
+        arena.start_game(player=player, enemy=enemy, seed=seeds.getrandbits(64))
+        turn = arena.auto_battle(policy, max_turns)
+        if store is not None:
+            store.remove(player)
+            store.remove(enemy)
+        if arena.game_is_running:
+            unfinished += 1
+            continue
+        turn_counts[turn] += 1
+        if player.hp <= 0 and enemy.hp <= 0:
+            draws += 1
+        elif player.hp <= 0:
+            losses += 1
+        else:
+            wins += 1
+    return SimulationResult(wins=wins, draws=draws, losses=losses, unfinished=unfinished,
+                            turn_counts=turn_counts)
+
+
+def compare_results(fast: SimulationResult, reference: SimulationResult) -> dict[str, float]:
+    """
+    The compare_results function returns the z-scores of the difference between the win, draw and loss rates
+    of two simulation results. Absolute values below 3 mean that the results match statistically.
+    """
+    scores = {}
+    for name in ('win_rate', 'draw_rate', 'loss_rate'):
+        p1, p2 = getattr(fast, name), getattr(reference, name)
+        pooled = (p1 * fast.battles + p2 * reference.battles) / (fast.battles + reference.battles)
+        variance = pooled * (1 - pooled) * (1 / fast.battles + 1 / reference.battles)
+        scores[name] = (p1 - p2) / math.sqrt(variance) if variance else 0.0
+    return scores
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Vectorized simulation of battles between two characters.')
+    parser.add_argument('unit_class', choices=list(unit_classes))
+    parser.add_argument('weapon')
+    parser.add_argument('armor')
+    parser.add_argument('enemy_class', choices=list(unit_classes))
+    parser.add_argument('enemy_weapon')
+    parser.add_argument('enemy_armor')
+    parser.add_argument('-n', '--battles', type=int, default=100_000)
+    parser.add_argument('--policy', choices=POLICIES, default=POLICY_HIT)
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--check', type=int, default=0, metavar='N',
+                        help='also run N battles through Arena and compare the results')
+    parser.add_argument('--store', action='store_true',
+                        help='keep the characters of the Arena battles in a UnitStore')
+    args = parser.parse_args()
+
+    equipment = Equipment()
+    setup = (unit_classes[args.unit_class], equipment.get_weapon(args.weapon), equipment.get_armor(args.armor),
+             unit_classes[args.enemy_class], equipment.get_weapon(args.enemy_weapon),
+             equipment.get_armor(args.enemy_armor))
+    if None in setup:
+        parser.error('unknown weapon or armor')
+    player = FighterParams.from_equipment(*setup[:3])
+    enemy = FighterParams.from_equipment(*setup[3:])
+    result = simulate(player, enemy, args.battles, policy=args.policy, seed=args.seed)
+    print(f'battles: {result.battles}, wins: {result.win_rate:.4f}, draws: {result.draw_rate:.4f}, '
+          f'losses: {result.loss_rate:.4f}, unfinished: {result.unfinished}, mean turns: {result.mean_turns:.2f}')
+    if args.check:
+        reference = simulate_arena(*setup, n_battles=args.check, policy=args.policy,
+                                   store=UnitStore() if args.store else None)
+        print(f'arena: wins: {reference.win_rate:.4f}, draws: {reference.draw_rate:.4f}, '
+              f'losses: {reference.loss_rate:.4f}, mean turns: {reference.mean_turns:.2f}')
+        for name, score in compare_results(result, reference).items():
+            print(f'{name} z-score: {score:+.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -8,10 +8,9 @@ if TYPE_CHECKING:
 class Skill(ABC):
     """
     The Skill class is an abstract class inherited from the ABC class of the abc library and defines the attributes
-    and methods necessary for all classes inherited from it.
+    and methods necessary for all classes inherited from it. One instance of a skill is shared by all characters
+    of a class, so the instance keeps no state of a particular use, the characters are passed to its methods.
     """
-    user: BaseUnit = ...
-    target: BaseUnit = ...
 
     @property
     @abstractmethod
@@ -41,33 +40,31 @@ class Skill(ABC):
         pass
 
     @abstractmethod
-    def skill_effect(self) -> str:
+    def skill_effect(self, user: BaseUnit, target: BaseUnit) -> str:
         """
         The skill_effect function defines an abstract method of the class and must be redefined
         in all inherited classes.
         """
         pass
 
-    def _is_stamina_enough(self) -> bool:
+    def is_stamina_enough(self, user: BaseUnit) -> bool:
         """
-        The _is_stamina_enough function defines a protected method of the class, does not accept arguments,
+        The is_stamina_enough function defines a method of the class, takes the character as an argument,
         compares the available stamina of the character with the required amount for the use of the skill.
         Returns True if stamina is sufficient, otherwise False.
         """
-        return self.user.stamina > self.stamina
+        return user.stamina > self.stamina
 
     def use(self, user: BaseUnit, target: BaseUnit) -> str:
         """
         The use function defines the class method, takes as arguments the player character and the opponent character
         in the form of objects of the corresponding classes, compares the available endurance of the character
-        with the required amount for the use of the skill, by calling the protected method _is_stamina_enough.
+        with the required amount for the use of the skill, by calling the method is_stamina_enough.
         If the value is sufficient, it applies the skill, otherwise it returns a string with a message.
         """
-        self.user = user
-        self.target = target
-        if self._is_stamina_enough:
-            return self.skill_effect()
-        return f"{self.user.name} попытался использовать {self.name} но у него не хватило выносливости."
+        if self.is_stamina_enough(user):
+            return self.skill_effect(user, target)
+        return f"{user.name} попытался использовать {self.name} но у него не хватило выносливости."
 
 
 class FuryPunch(Skill):
@@ -79,15 +76,15 @@ class FuryPunch(Skill):
     stamina = 6
     damage = 12
 
-    def skill_effect(self) -> str:
+    def skill_effect(self, user: BaseUnit, target: BaseUnit) -> str:
         """
-        The skill_effect function overrides the method of the parent abstract class Skill. Does not accept arguments.
-        Produces a decrease in the player's stamina and a decrease in the opponent's health after applying the skill.
-        Returns the result as a string.
+        The skill_effect function overrides the method of the parent abstract class Skill. Takes the character
+        using the skill and its target as arguments. Produces a decrease in the user's stamina and a decrease
+        in the target's health after applying the skill. Returns the result as a string.
         """
-        self.user.stamina -= self.stamina
-        self.target.hp -= self.damage
-        return f'{self.user.name} использует {self.name} и наносит {self.damage} урона сопернику.'
+        user.stamina -= self.stamina
+        target.hp -= self.damage
+        return f'{user.name} использует {self.name} и наносит {self.damage} урона сопернику.'
 
 class HardShot(Skill):
     """
@@ -98,12 +95,12 @@ class HardShot(Skill):
     stamina = 5
     damage = 15
 
-    def skill_effect(self) -> str:
+    def skill_effect(self, user: BaseUnit, target: BaseUnit) -> str:
         """
-        The skill_effect function overrides the method of the parent abstract class Skill. Does not accept arguments.
-        Produces a decrease in the player's stamina and a decrease in the opponent's health after applying the skill.
-        Returns the result as a string.
+        The skill_effect function overrides the method of the parent abstract class Skill. Takes the character
+        using the skill and its target as arguments. Produces a decrease in the user's stamina and a decrease
+        in the target's health after applying the skill. Returns the result as a string.
         """
-        self.user.stamina -= self.stamina
-        self.target.hp -= self.damage
-        return f'{self.user.name} использует {self.name} и наносит {self.damage} урона сопернику.'
+        user.stamina -= self.stamina
+        target.hp -= self.damage
+        return f'{user.name} использует {self.name} и наносит {self.damage} урона сопернику.'
@@ -0,0 +1,166 @@
+from typing import Optional
+import argparse
+import json
+import os
+import random
+import sqlite3
+import threading
+
+from equipment import Armor, Weapon, BaseEquipmentCatalog, EquipmentData
+
+
+CREATE_WEAPONS: str = (
+    'CREATE TABLE weapons (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE, '
+    'min_damage REAL NOT NULL, max_damage REAL NOT NULL, stamina_per_hit REAL NOT NULL)'
+)
+CREATE_ARMORS: str = (
+    'CREATE TABLE armors (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE, '
+    'defence REAL NOT NULL, stamina_per_turn REAL NOT NULL)'
+)
+INSERT_WEAPON: str = 'INSERT INTO weapons VALUES (?, ?, ?, ?, ?)'
+INSERT_ARMOR: str = 'INSERT INTO armors VALUES (?, ?, ?, ?)'
+WEAPON_COLUMNS: str = 'id, name, min_damage, max_damage, stamina_per_hit'
+ARMOR_COLUMNS: str = 'id, name, defence, stamina_per_turn'
+SELECT_WEAPON_BY_NAME: str = f'SELECT {WEAPON_COLUMNS} FROM weapons WHERE name = ?'
+SELECT_WEAPON_BY_ID: str = f'SELECT {WEAPON_COLUMNS} FROM weapons WHERE id = ?'
+SELECT_ARMOR_BY_NAME: str = f'SELECT {ARMOR_COLUMNS} FROM armors WHERE name = ?'
+SELECT_ARMOR_BY_ID: str = f'SELECT {ARMOR_COLUMNS} FROM armors WHERE id = ?'
+SEARCH_WEAPONS: str = 'SELECT name FROM weapons WHERE name >= ? AND name > ? AND name < ? ORDER BY name LIMIT ?'
+SEARCH_ARMORS: str = 'SELECT name FROM armors WHERE name >= ? AND name > ? AND name < ? ORDER BY name LIMIT ?'
+ALL_WEAPONS_NAMES: str = 'SELECT name FROM weapons ORDER BY id'
+ALL_ARMORS_NAMES: str = 'SELECT name FROM armors ORDER BY id'
+
+# The largest code point, every name that starts with a prefix is less than the prefix followed by it.
+LAST_CHARACTER: str = chr(0x10FFFF)
+
+
+class SQLiteEquipmentCatalog(BaseEquipmentCatalog):
+    """
+    The SQLiteEquipmentCatalog class is a catalog of equipment kept in a SQLite file built by this module.
+    Weapons and armors are read one at a time through the primary key or the unique index of names,
+    so opening the catalog and the memory of the process do not depend on the number of items.
+    The file is opened read-only, every thread uses its own connection.
+    """
+    def __init__(self, path: str, mtime: int):
+        """
+        The "__init__" method is called when initializing the class object, takes the path of the catalog
+        and the modification time of the file.
+        """
+        self.path: str = path
+        self.mtime: int = mtime
+        self.data: Optional[EquipmentData] = None
+        self._local: threading.local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        """
+        The _connection function defines a protected method of the class and returns the read-only connection
+        of the current thread.
+        """
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(f'file:{self.path}?mode=ro', uri=True, isolation_level=None)
+            self._local.connection = connection
+        return connection
+
+    def _weapon(self, query: str, key) -> Optional[Weapon]:
+        row = self._connection().execute(query, (key,)).fetchone()
+        return Weapon(*row) if row else None
+
+    def _armor(self, query: str, key) -> Optional[Armor]:
+        row = self._connection().execute(query, (key,)).fetchone()
+        return Armor(*row) if row else None
+
+    def _search(self, query: str, prefix: str, after: str, limit: int) -> list[str]:
+        rows = self._connection().execute(query, (prefix, after, prefix + LAST_CHARACTER, limit))
+        return [name for name, in rows]
+
+    def get_weapon(self, name: str) -> Optional[Weapon]:
+        return self._weapon(SELECT_WEAPON_BY_NAME, name)
+
+    def get_armor(self, name: str) -> Optional[Armor]:
+        return self._armor(SELECT_ARMOR_BY_NAME, name)
+
+    def get_weapon_by_id(self, weapon_id: int) -> Optional[Weapon]:
+        return self._weapon(SELECT_WEAPON_BY_ID, weapon_id)
+
+    def get_armor_by_id(self, armor_id: int) -> Optional[Armor]:
+        return self._armor(SELECT_ARMOR_BY_ID, armor_id)
+
+    def get_weapons_names(self) -> list[str]:
+        return [name for name, in self._connection().execute(ALL_WEAPONS_NAMES)]
+
+    def get_armors_names(self) -> list[str]:
+        return [name for name, in self._connection().execute(ALL_ARMORS_NAMES)]
+
+    def search_weapons(self, prefix: str, after: str, limit: int) -> list[str]:
+        return self._search(SEARCH_WEAPONS, prefix, after, limit)
+
+    def search_armors(self, prefix: str, after: str, limit: int) -> list[str]:
+        return self._search(SEARCH_ARMORS, prefix, after, limit)
+
+
+def build_catalog(path: str, weapons: list[Weapon], armors: list[Armor]):
+    """
+    The build_catalog function writes the weapons and armors to a new SQLite catalog at the given path.
+    """
+    if os.path.exists(path):
+        os.remove(path)
+    connection = sqlite3.connect(path)
+    with connection:
+        connection.execute(CREATE_WEAPONS)
+        connection.execute(CREATE_ARMORS)
+        connection.executemany(INSERT_WEAPON, ((weapon.id, weapon.name, weapon.min_damage, weapon.max_damage,
+                                                weapon.stamina_per_hit) for weapon in weapons))
+        connection.executemany(INSERT_ARMOR, ((armor.id, armor.name, armor.defence, armor.stamina_per_turn)
+                                              for armor in armors))
+    connection.execute('VACUUM')
+    connection.close()
+
+
+def generate_equipment(data: EquipmentData, size: int, seed: int = 0) -> tuple[list[Weapon], list[Armor]]:
+    """
+    The generate_equipment function returns the weapons and armors of the equipment data followed by
+    generated items, so that there are size items of every kind. The generated items are the variations
+    of the original ones with the values changed by up to 20%, their ids follow the largest id of the data.
+    """
+    rng = random.Random(seed)
+    weapons = list(data.weapons)
+    armors = list(data.armors)
+    weapon_id = max((weapon.id for weapon in weapons), default=0)
+    armor_id = max((armor.id for armor in armors), default=0)
+    while len(weapons) < size:
+        base = weapons[rng.randrange(len(data.weapons))]
+        scale = rng.uniform(0.8, 1.2)
+        weapon_id += 1
+        weapons.append(Weapon(id=weapon_id, name=f'{base.name} {weapon_id}',
+                              min_damage=round(base.min_damage * scale, 1), max_damage=round(base.max_damage * scale, 1),
+                              stamina_per_hit=round(base.stamina_per_hit * rng.uniform(0.8, 1.2), 1)))
+    while len(armors) < size:
+        base = armors[rng.randrange(len(data.armors))]
+        armor_id += 1
+        armors.append(Armor(id=armor_id, name=f'{base.name} {armor_id}',
+                            defence=round(base.defence * rng.uniform(0.8, 1.2), 1),
+                            stamina_per_turn=round(base.stamina_per_turn * rng.uniform(0.8, 1.2), 1)))
+    return weapons, armors
+
+
+def main():
+    from equipment import EquipmentSchema, EQUIPMENT_PATH
+
+    parser = argparse.ArgumentParser(description='Build a SQLite catalog of equipment from the equipment file.')
+    parser.add_argument('output', help='path of the catalog to create')
+    parser.add_argument('--source', default=EQUIPMENT_PATH, help='equipment file in JSON')
+    parser.add_argument('--generate', type=int, default=0, metavar='N',
+                        help='add generated weapons and armors up to N items of every kind')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    with open(args.source, 'r', encoding='utf-8') as equipment_file:
+        data = EquipmentSchema().load(json.load(equipment_file))
+    weapons, armors = generate_equipment(data, args.generate, args.seed)
+    build_catalog(args.output, weapons, armors)
+    print(f'weapons: {len(weapons)}, armors: {len(armors)}')
+
+
+if __name__ == '__main__':
+    main()
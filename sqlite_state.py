@@ -0,0 +1,228 @@
+from typing import Optional
+import json
+import sqlite3
+import threading
+import time
+
+from base import Arena
+from battle_log import TurnLog
+from classes import unit_classes
+from enemy_ai import SmartEnemyUnit
+from equipment import Equipment
+from sessions import GameSession, StateBackend, StaleGameError, SESSION_TTL
+from unit import BaseUnit, PlayerUnit, EnemyUnit
+
+
+PURGE_EVERY: int = 1000
+
+CREATE_TABLES: tuple[str, ...] = (
+    'CREATE TABLE IF NOT EXISTS game_state ('
+    'session_id TEXT PRIMARY KEY, updated REAL NOT NULL, version INTEGER NOT NULL, state BLOB NOT NULL'
+    ') WITHOUT ROWID',
+    'CREATE INDEX IF NOT EXISTS game_state_updated ON game_state (updated)',
+    'CREATE TABLE IF NOT EXISTS game_turns ('
+    'session_id TEXT NOT NULL, turn INTEGER NOT NULL, record BLOB NOT NULL, PRIMARY KEY (session_id, turn)'
+    ') WITHOUT ROWID',
+)
+SELECT_GAME: str = 'SELECT state, version FROM game_state WHERE session_id = ? AND updated > ?'
+SELECT_TURNS: str = 'SELECT record FROM game_turns WHERE session_id = ? ORDER BY turn'
+# a new game may only replace an expired one
+INSERT_GAME: str = (
+    'INSERT INTO game_state (session_id, updated, version, state) VALUES (?, ?, 1, ?) '
+    'ON CONFLICT (session_id) DO UPDATE SET updated = excluded.updated, version = 1, state = excluded.state '
+    'WHERE game_state.updated <= ?'
+)
+UPDATE_GAME: str = (
+    'UPDATE game_state SET updated = ?, version = version + 1, state = ? WHERE session_id = ? AND version = ?'
+)
+INSERT_TURN: str = 'INSERT INTO game_turns (session_id, turn, record) VALUES (?, ?, ?)'
+DELETE_TURNS: str = 'DELETE FROM game_turns WHERE session_id = ?'
+DELETE_GAME: str = 'DELETE FROM game_state WHERE session_id = ?'
+PURGE_TURNS: str = 'DELETE FROM game_turns WHERE session_id IN (SELECT session_id FROM game_state WHERE updated <= ?)'
+PURGE_GAMES: str = 'DELETE FROM game_state WHERE updated <= ?'
+COUNT_GAMES: str = 'SELECT count(*) FROM game_state WHERE updated > ?'
+
+
+UNIT_KINDS: dict[str, type] = {'player': PlayerUnit, 'enemy': EnemyUnit, 'smart_enemy': SmartEnemyUnit}
+
+
+def _unit_kind(unit: BaseUnit) -> str:
+    if isinstance(unit, SmartEnemyUnit):
+        return 'smart_enemy'
+    return 'enemy' if isinstance(unit, EnemyUnit) else 'player'
+
+
+def _dump_unit(unit: BaseUnit) -> list:
+    return [
+        _unit_kind(unit),
+        unit.name,
+        unit.unit_class.name,
+        unit.weapon.id if unit.weapon else None,
+        unit.armor.id if unit.armor else None,
+        unit.hp,
+        unit.stamina,
+        unit._is_skill_used,
+    ]
+
+
+def _load_unit(data: list, equipment: Equipment) -> BaseUnit:
+    kind, name, class_name, weapon_id, armor_id, hp, stamina, is_skill_used = data
+    unit = UNIT_KINDS[kind](name=name, unit_class=unit_classes[class_name])
+    unit.weapon = equipment.get_weapon_by_id(weapon_id)
+    unit.armor = equipment.get_armor_by_id(armor_id)
+    unit.hp = hp
+    unit.stamina = stamina
+    unit._is_skill_used = is_skill_used
+    return unit
+
+
+def dump_game(game: GameSession) -> bytes:
+    """
+    The dump_game function returns the state of the game without its log as compact JSON: the list
+    of characters and the indexes of the heroes and of the fighters of the arena in it.
+    """
+    units: list[BaseUnit] = []
+
+    def index(unit: Optional[BaseUnit]) -> Optional[int]:
+        if unit is None or unit is ...:
+            return None
+        for i, known in enumerate(units):
+            if known is unit:
+                return i
+        units.append(unit)
+        return len(units) - 1
+
+    arena = game.arena
+    state = {
+        'heroes': [index(game.heroes['player']), index(game.heroes['enemy'])],
+        'arena': [index(arena.player), index(arena.enemy)],
+        'running': arena.game_is_running,
+        'result': arena.battle_resault,
+        'seed': arena.seed,
+    }
+    state['units'] = [_dump_unit(unit) for unit in units]
+    return json.dumps(state, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def load_game(state: bytes, log: bytes) -> GameSession:
+    """
+    The load_game function restores the game saved by the dump_game function and its log.
+    """
+    data = json.loads(state)
+    equipment = Equipment()
+    units = [_load_unit(unit, equipment) for unit in data['units']]
+    player_index, enemy_index = data['heroes']
+    game = GameSession()
+    game.heroes['player'] = units[player_index] if player_index is not None else None
+    game.heroes['enemy'] = units[enemy_index] if enemy_index is not None else None
+    player_index, enemy_index = data['arena']
+    if player_index is not None and enemy_index is not None:
+        game.arena.resume(units[player_index], units[enemy_index], data['seed'], TurnLog(log),
+                          data['running'], data['result'])
+    return game
+
+
+EMPTY_STATE: bytes = dump_game(GameSession())
+
+
+class SQLiteStateBackend(StateBackend):
+    """
+    The SQLiteStateBackend class keeps the games in a local SQLite database, so that any process on the host
+    can serve any session. The database works in WAL mode with prepared statements. The state of the game
+    without the log is one small row, every turn of the log is appended as a row of its own, and nothing
+    is written when the request has not changed the game. The row of the state has a version, a game saved
+    by another request since it was loaded is not overwritten. The games not changed for ttl seconds
+    are purged from time to time.
+    """
+    def __init__(self, path: str, ttl: float = SESSION_TTL):
+        """
+        The "__init__" method is called when initializing the class object, takes the path of the database
+        and the idle time after which a game is removed, and creates the table if necessary.
+        """
+        self.path: str = path
+        self.ttl: float = ttl
+        self._local: threading.local = threading.local()
+        self._saves: int = 0
+        connection = self._connection()
+        for statement in CREATE_TABLES:
+            connection.execute(statement)
+
+    def _connection(self) -> sqlite3.Connection:
+        """
+        The _connection function defines a protected method of the class and returns the connection
+        of the current thread, the statements are prepared once per connection and cached by sqlite3.
+        """
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, isolation_level=None, timeout=5)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        return connection
+
+    def __len__(self) -> int:
+        return self._connection().execute(COUNT_GAMES, (time.time() - self.ttl,)).fetchone()[0]
+
+    def load(self, session_id: str) -> Optional[GameSession]:
+        connection = self._connection()
+        with connection:
+            connection.execute('BEGIN')
+            row = connection.execute(SELECT_GAME, (session_id, time.time() - self.ttl)).fetchone()
+            if row is None:
+                return None
+            state, version = row
+            log = b''.join(record for record, in connection.execute(SELECT_TURNS, (session_id,)))
+        game = load_game(state, log)
+        game.version = version
+        game.stored = (state, game.arena.log.generation, len(game.arena.log))
+        return game
+
+    def save(self, session_id: str, game: GameSession):
+        """
+        The save function defines a method of the SQLiteStateBackend class, takes the session id and the game
+        and writes the changes of the game in one transaction: the row of the state, if it has changed, and
+        the turns added to the log. When the log has been cleared for a new battle, its turns are written anew.
+        Raises StaleGameError if the version of the row is not the one the game was loaded with.
+        """
+        state = dump_game(game)
+        log = game.arena.log
+        if game.stored is None:
+            if state == EMPTY_STATE:
+                return
+            saved_turns = None
+        else:
+            stored_state, generation, saved_turns = game.stored
+            if generation != log.generation:
+                saved_turns = None
+            elif state == stored_state and saved_turns == len(log):
+                return
+        connection = self._connection()
+        now = time.time()
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            if game.version:
+                cursor = connection.execute(UPDATE_GAME, (now, state, session_id, game.version))
+            else:
+                cursor = connection.execute(INSERT_GAME, (session_id, now, state, now - self.ttl))
+            if cursor.rowcount != 1:
+                raise StaleGameError(session_id)
+            if saved_turns is None:
+                connection.execute(DELETE_TURNS, (session_id,))
+                saved_turns = 0
+            connection.executemany(INSERT_TURN, [(session_id, saved_turns + i, record)
+                                                 for i, record in enumerate(log.records(saved_turns))])
+        game.version = game.version + 1 if game.version else 1
+        game.stored = (state, log.generation, len(log))
+        self._saves += 1
+        if self._saves % PURGE_EVERY == 0:
+            with connection:
+                connection.execute('BEGIN IMMEDIATE')
+                connection.execute(PURGE_TURNS, (now - self.ttl,))
+                connection.execute(PURGE_GAMES, (now - self.ttl,))
+
+    def delete(self, session_id: str):
+        connection = self._connection()
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            connection.execute(DELETE_TURNS, (session_id,))
+            connection.execute(DELETE_GAME, (session_id,))
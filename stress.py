@@ -0,0 +1,204 @@
+from concurrent.futures import ThreadPoolExecutor
+from itertools import product
+from random import Random
+from typing import Callable
+import argparse
+import os
+import sys
+import time
+
+os.environ.pop('GAME_STATE_DB', None)
+
+from base import Arena
+from classes import unit_classes
+from equipment import Equipment
+from policies import POLICY_SKILL_FIRST, POLICY_SKILL_WHEN_KILLS
+from unit import PlayerUnit, EnemyUnit
+
+
+SWITCH_INTERVAL: float = 1e-6
+POLICIES: tuple[str, ...] = (POLICY_SKILL_FIRST, POLICY_SKILL_WHEN_KILLS)
+
+
+def _fighters(setup: tuple[str, ...], equipment: Equipment, name: str) -> tuple[PlayerUnit, EnemyUnit]:
+    player_class, player_weapon, player_armor, enemy_class, enemy_weapon, enemy_armor = setup
+    player = PlayerUnit(name=f'{name}-player', unit_class=unit_classes[player_class])
+    player.equip_weapon(equipment.get_weapon(player_weapon))
+    player.equip_armor(equipment.get_armor(player_armor))
+    enemy = EnemyUnit(name=f'{name}-enemy', unit_class=unit_classes[enemy_class])
+    enemy.equip_weapon(equipment.get_weapon(enemy_weapon))
+    enemy.equip_armor(equipment.get_armor(enemy_armor))
+    return player, enemy
+
+
+def _setups(count: int, seed: int) -> list[tuple[tuple[str, ...], int, str]]:
+    """
+    The _setups function returns the setups of count fights: the classes and the equipment of both
+    characters, every combination in turn, the seed of the arena and the policy of the player.
+    """
+    equipment = Equipment()
+    sides = list(product(unit_classes, equipment.get_weapons_names(), equipment.get_armors_names()))
+    matchups = [player + enemy for player, enemy in product(sides, sides)]
+    rng = Random(seed)
+    return [(matchups[i % len(matchups)], rng.getrandbits(64), POLICIES[i % len(POLICIES)]) for i in range(count)]
+
+
+def _fight(setup: tuple[tuple[str, ...], int, str], name: str) -> tuple[bytes, str, bool, bool]:
+    matchup, seed, policy = setup
+    player, enemy = _fighters(matchup, Equipment(), name)
+    arena = Arena()
+    arena.start_game(player, enemy, seed=seed)
+    arena.auto_battle(policy)
+    return bytes(arena.log), arena.battle_resault, player._is_skill_used, enemy._is_skill_used
+
+
+def check_engine(fights: int, threads: int, seed: int) -> list[str]:
+    """
+    The check_engine function plays the same seeded fights once in one thread and once in many threads
+    at the same time. The characters of a class share one instance of the skill and every arena has its own
+    random number generator, so every fight must give the same log, result and skill flags in both runs.
+    """
+    setups = _setups(fights, seed)
+    expected = [_fight(setup, str(i)) for i, setup in enumerate(setups)]
+    with ThreadPoolExecutor(threads) as executor:
+        actual = list(executor.map(_fight, setups, map(str, range(fights))))
+    return [f'engine: fight {i} {setups[i][0]} differs when played concurrently'
+            for i, (one, other) in enumerate(zip(expected, actual)) if one != other]
+
+
+def _play_session(app, setup: tuple[tuple[str, ...], int, str], index: int) -> list[str]:
+    """
+    The _play_session function plays one game with its own client: chooses the heroes with the names
+    of the session, makes moves until the end and checks that every response is about its own heroes
+    and matches the log of its own arena.
+    """
+    from sessions import registry
+
+    matchup = setup[0]
+    client = app.test_client()
+    client.post('/choose-hero/', data={'name': f'{index}-player', 'unit_class': matchup[0],
+                                       'weapon': matchup[1], 'armor': matchup[2]})
+    client.post('/choose-enemy/', data={'name': f'{index}-enemy', 'unit_class': matchup[3],
+                                        'weapon': matchup[4], 'armor': matchup[5]})
+    started = client.post('/api/fight/').get_json()
+    errors = []
+    if (started['player']['name'], started['enemy']['name']) != (f'{index}-player', f'{index}-enemy'):
+        errors.append(f'session {index}: started the fight of {started["player"]["name"]}')
+    session_id = started['watch_url'].split('/')[-2]
+    states = []
+    while True:
+        response = client.post('/api/fight/use-skill' if len(states) % 7 == 3 else '/api/fight/hit')
+        if response.status_code != 200:
+            errors.append(f'session {index}: status {response.status_code}')
+            break
+        delta = response.get_json()
+        states.append((delta['player']['health_points'], delta['enemy']['health_points']))
+        if not delta['game_is_running']:
+            break
+    game = registry.get(session_id)
+    if game is None or game.arena.player.name != f'{index}-player':
+        return errors + [f'session {index}: the arena of the session holds other heroes']
+    logged = [(event.player_hp, event.enemy_hp) for event in game.arena.log.replay()]
+    if round(game.arena.player.hp, 1) != states[-1][0] or round(game.arena.enemy.hp, 1) != states[-1][1]:
+        errors.append(f'session {index}: the last response does not match the arena')
+    if states[-1] != logged[-1]:
+        errors.append(f'session {index}: the last response does not match the log')
+    return errors
+
+
+def check_sessions(sessions: int, threads: int, seed: int) -> list[str]:
+    """
+    The check_sessions function plays many games of different visitors through the application
+    at the same time and checks that no session sees the heroes or the moves of another one.
+    """
+    from app import create_app
+
+    app = create_app(warm_up_app=False)
+    setups = _setups(sessions, seed)
+    with ThreadPoolExecutor(threads) as executor:
+        results = executor.map(_play_session, [app] * sessions, setups, range(sessions))
+        return [error for errors in results for error in errors]
+
+
+def check_same_session(moves: int, threads: int) -> list[str]:
+    """
+    The check_same_session function sends the moves of one visitor from many threads at the same time.
+    The lock of the game serializes them, so the log must hold exactly the records of the moves
+    that were made: two per move, one less if the move of the player ended the battle.
+    """
+    from app import create_app
+    from sessions import registry
+
+    app = create_app(warm_up_app=False)
+    client = app.test_client()
+    client.post('/choose-hero/', data={'name': 'player', 'unit_class': 'Воин', 'weapon': 'ладошки',
+                                       'armor': 'панцирь'})
+    client.post('/choose-enemy/', data={'name': 'enemy', 'unit_class': 'Воин', 'weapon': 'ладошки',
+                                        'armor': 'панцирь'})
+    session_id = client.post('/api/fight/').get_json()['watch_url'].split('/')[-2]
+    cookies = [(cookie.name, cookie.value) for cookie in client.cookie_jar]
+    clients = []
+    for _ in range(threads):
+        other = app.test_client()
+        for name, value in cookies:
+            other.set_cookie('localhost', name, value)
+        clients.append(other)
+
+    def move(i: int) -> tuple[int, list[str]]:
+        response = clients[i % threads].post('/api/fight/hit')
+        return response.status_code, response.get_json().get('messages', [])
+
+    with ThreadPoolExecutor(threads) as executor:
+        results = list(executor.map(move, range(moves)))
+    errors = [f'same session: status {status}' for status, _ in results if status != 200]
+    # a move made in a running battle has the message of the player and the answer or the result
+    made = sum(1 for _, messages in results if len(messages) >= 2)
+    game = registry.get(session_id)
+    records = len(game.arena.log)
+    if records not in (2 * made, 2 * made - 1):
+        errors.append(f'same session: {made} moves made, but {records} records in the log')
+    return errors
+
+
+def run(fights: int, sessions: int, moves: int, threads: int, seed: int) -> list[str]:
+    """
+    The run function runs all checks with the given sizes and returns the descriptions of the failures.
+    The threads are switched as often as possible to make the interleavings likely.
+    """
+    checks: list[tuple[str, Callable[[], list[str]]]] = [
+        ('engine', lambda: check_engine(fights, threads, seed)),
+        ('sessions', lambda: check_sessions(sessions, threads, seed)),
+        ('same session', lambda: check_same_session(moves, threads)),
+    ]
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(SWITCH_INTERVAL)
+    errors = []
+    try:
+        for name, check in checks:
+            started = time.perf_counter()
+            found = check()
+            print(f'{name}: {"FAILED" if found else "ok"} in {time.perf_counter() - started:.1f}s')
+            errors += found
+    finally:
+        sys.setswitchinterval(interval)
+    return errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Plays thousands of fights in many threads at the same time '
+                                                 'and checks that no state leaks between them.')
+    parser.add_argument('--fights', type=int, default=5000, help='seeded fights played directly on arenas')
+    parser.add_argument('--sessions', type=int, default=1000, help='games of different visitors')
+    parser.add_argument('--moves', type=int, default=2000, help='concurrent moves of one visitor')
+    parser.add_argument('-t', '--threads', type=int, default=32)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    errors = run(args.fights, args.sessions, args.moves, args.threads, args.seed)
+    if errors:
+        for error in errors[:50]:
+            print(error, file=sys.stderr)
+        sys.exit(f'{len(errors)} failures')
+
+
+if __name__ == '__main__':
+    main()
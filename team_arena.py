@@ -0,0 +1,198 @@
+from heapq import heapify, heappop, heappush
+from random import Random, getrandbits
+from typing import Iterator, Optional
+
+from base import Arena
+from battle_log import TurnLog, ACTOR_PLAYER, ACTOR_ENEMY, ACTION_PASS
+from metrics import timed_method
+from policies import PLAYER_POLICIES, POLICY_HIT, MOVE_SKILL, MOVE_PASS
+from unit import BaseUnit, EnemyUnit
+
+
+MAX_ACTIONS: int = 100_000
+
+TEAMS: tuple[int, int] = (ACTOR_PLAYER, ACTOR_ENEMY)
+
+
+def initiative_interval(unit: BaseUnit) -> float:
+    """
+    The initiative_interval function returns the time between two actions of the character: a heavy weapon
+    makes the actions rarer, the stamina of the class makes them more frequent. The characters with equal
+    intervals act in the order they were added to the team.
+    """
+    return unit.weapon.stamina_per_hit / unit.unit_class.stamina
+
+
+class TeamArena:
+    """
+    The TeamArena class implements the battle of two teams of any number of characters. The characters act
+    in the order of their initiative: the scheduler is a heap of the times of the next actions, so choosing
+    the character to act costs O(log N). Every character attacks the living opponent with the lowest health,
+    kept in a heap of every team with lazily discarded outdated entries, and the living characters of every team
+    are counted, so one action costs O(log N) regardless of the size of the teams. The characters of the player's
+    team choose their moves by the policy, the enemies act by their hit method. When initializing the class object,
+    it optionally accepts the seed of the first battle and whether the arena is counted in the metrics.
+    """
+    STAMINA_PER_ROUND: float = Arena.STAMINA_PER_ROUND
+
+    def __init__(self, seed: Optional[int] = None, monitored: bool = False):
+        """
+        The "__init__" method is called when initializing the class object, takes the seed of the random
+        number generator of the first battle, if it is not passed, every battle gets a random seed,
+        and whether the arena is counted in the metrics.
+        """
+        self.monitored: bool = monitored
+        self._next_seed: Optional[int] = seed
+        self.seed: Optional[int] = None
+        self.rng: Random = Random()
+        self.log: TurnLog = TurnLog()
+        self.teams: tuple[list[BaseUnit], list[BaseUnit]] = ([], [])
+        self.alive: list[int] = [0, 0]
+        self.policy: str = POLICY_HIT
+        self.time: float = 0
+        self.game_is_running: bool = False
+        self.battle_resault: Optional[str] = None
+        self._schedule: list[tuple[float, int, int, int]] = []
+        self._targets: tuple[list[tuple[float, int, int]], list[tuple[float, int, int]]] = ([], [])
+        self._versions: tuple[list[int], list[int]] = ([], [])
+
+    def start_game(self, players: list[BaseUnit], enemies: list[BaseUnit], policy: str = POLICY_HIT,
+                   seed: Optional[int] = None):
+        """
+        The start_game function defines a method of the TeamArena class, takes the characters of the player's
+        team and of the enemy team, the policy of the player's team from PLAYER_POLICIES and optionally the seed
+        of the battle. It seeds the random number generator of the arena and gives it to all characters,
+        clears the log and builds the heaps of the scheduler and of the targets in linear time.
+        """
+        if not players or not enemies:
+            raise ValueError('Both teams must have at least one character')
+        if seed is None:
+            seed = self._next_seed if self._next_seed is not None else getrandbits(64)
+        self._next_seed = None
+        self.seed = seed
+        self.rng.seed(seed)
+        self.log.clear()
+        self.teams = (list(players), list(enemies))
+        self.policy = policy
+        self.time = 0
+        self._schedule = []
+        for team, units in zip(TEAMS, self.teams):
+            self._versions[team][:] = [0] * len(units)
+            self._targets[team][:] = [(unit.hp, 0, index) for index, unit in enumerate(units) if unit.hp > 0]
+            heapify(self._targets[team])
+            self.alive[team] = len(self._targets[team])
+            for index, unit in enumerate(units):
+                unit.rng = self.rng
+                if unit.hp > 0:
+                    self._schedule.append((initiative_interval(unit), len(self._schedule), team, index))
+        heapify(self._schedule)
+        self.game_is_running = True
+        self.battle_resault = None
+        self._check_teams()
+
+    def target(self, team: int) -> Optional[BaseUnit]:
+        """
+        The target function defines a method of the TeamArena class, takes the team and returns its living
+        character with the lowest health, or None if the team has no living characters. The entries of the heap
+        that were made before the last change of the health of their character are discarded here.
+        """
+        targets, versions, units = self._targets[team], self._versions[team], self.teams[team]
+        while targets:
+            hp, version, index = targets[0]
+            if version == versions[index] and units[index].hp > 0:
+                return units[index]
+            heappop(targets)
+        return None
+
+    def _update_target(self, team: int, index: int, unit: BaseUnit, hp_before: float):
+        """
+        The _update_target function defines a protected method of the TeamArena class, it is called after
+        every action with its target and the health of the target before the action. A changed health
+        is pushed into the heap of the team as a new entry, a death decrements the count of the living characters.
+        """
+        if unit.hp == hp_before:
+            return
+        versions = self._versions[team]
+        versions[index] += 1
+        if unit.hp > 0:
+            heappush(self._targets[team], (unit.hp, versions[index], index))
+        elif hp_before > 0:
+            self.alive[team] -= 1
+
+    def _check_teams(self) -> Optional[str]:
+        """
+        The _check_teams function defines a protected method of the TeamArena class, compares the counts
+        of the living characters of the teams with zero and ends the game if a team has none, like the
+        _check_players_hp method of the Arena class.
+        """
+        players_alive, enemies_alive = self.alive
+        if players_alive and enemies_alive:
+            return None
+        if not players_alive and not enemies_alive:
+            self.battle_resault = 'Ничья'
+        elif not players_alive:
+            self.battle_resault = 'Игрок проиграл битву'
+        else:
+            self.battle_resault = 'Игрок выиграл битву'
+        self.game_is_running = False
+        return self.battle_resault
+
+    def _act(self, team: int, unit: BaseUnit, target: BaseUnit) -> str:
+        """
+        The _act function defines a protected method of the TeamArena class, the character regenerates
+        the stamina of one round and makes its move against the target.
+        """
+        unit.stamina = min(unit.stamina + self.STAMINA_PER_ROUND, unit.unit_class.max_stamina)
+        if isinstance(unit, EnemyUnit):
+            return unit.hit(target)
+        move = PLAYER_POLICIES[self.policy](unit, target)
+        if move == MOVE_SKILL:
+            return unit.use_skill(target)
+        if move == MOVE_PASS:
+            unit.last_action = ACTION_PASS
+            return f"{unit.name} пропускает ход."
+        return unit.hit(target)
+
+    @timed_method('arena_method_duration_seconds', 'Time spent in the methods of Arena.', method='team_next_action')
+    def next_action(self) -> Optional[str]:
+        """
+        The next_action function defines a method of the TeamArena class, does not accept arguments when called.
+        It takes the character with the earliest action from the scheduler, skipping the dead ones, makes its
+        action against the weakest living opponent, writes it to the log, schedules the next action
+        of the character and returns the result of the action, or the result of the battle if it has ended.
+        """
+        while self.game_is_running and self._schedule:
+            time, order, team, index = heappop(self._schedule)
+            unit = self.teams[team][index]
+            if unit.hp <= 0:
+                continue
+            self.time = time
+            opponents = 1 - team
+            target = self.target(opponents)
+            target_index = self._targets[opponents][0][2]
+            target_hp = target.hp
+            result = self._act(team, unit, target)
+            player, enemy = (unit, target) if team == ACTOR_PLAYER else (target, unit)
+            self.log.record(team, unit.last_action, target_hp - target.hp, player, enemy)
+            self._update_target(opponents, target_index, target, target_hp)
+            heappush(self._schedule, (time + initiative_interval(unit), order, team, index))
+            end = self._check_teams()
+            return end if end is not None else result
+        return None
+
+    def play(self, max_actions: int = MAX_ACTIONS) -> Iterator[str]:
+        """
+        The play function defines a generator method of the TeamArena class, takes the maximum number
+        of actions and yields the result of every action until one of the teams is defeated or the actions run out.
+        """
+        actions = 0
+        while self.game_is_running and actions < max_actions:
+            actions += 1
+            yield self.next_action()
+
+    def auto_battle(self, max_actions: int = MAX_ACTIONS) -> int:
+        """
+        The auto_battle function defines a method of the TeamArena class, takes the maximum number of actions,
+        makes all actions of the play generator and returns their number.
+        """
+        return sum(1 for _ in self.play(max_actions))
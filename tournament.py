@@ -0,0 +1,113 @@
+from itertools import product
+from multiprocessing import Pool
+from typing import Optional
+import argparse
+import csv
+import os
+import time
+
+import numpy as np
+
+from classes import unit_classes
+from equipment import Equipment
+from simulator import POLICIES, POLICY_HIT, MAX_TURNS, simulate_arena
+
+
+Setup = tuple[str, str, str]
+
+
+def get_setups() -> list[Setup]:
+    """
+    The get_setups function returns all combinations of a character class, a weapon and an armor
+    in the form of tuples of their names.
+    """
+    equipment = Equipment()
+    return list(product(unit_classes, equipment.get_weapons_names(), equipment.get_armors_names()))
+
+
+def matchup_seed(seed: int, player_index: int, enemy_index: int) -> int:
+    """
+    The matchup_seed function derives the seed of one matchup from the seed of the tournament, so the result
+    of a matchup does not depend on the worker and on the order in which the matchups are run.
+    """
+    return int(np.random.SeedSequence(seed, spawn_key=(player_index, enemy_index)).generate_state(1)[0])
+
+
+def run_matchup(task: tuple) -> tuple:
+    """
+    The run_matchup function is executed in a worker process. It takes the indexes and the setups
+    of the player and the enemy, the number of fights, the policy of the player and the seed, and fights
+    the matchup through PlayerUnit, EnemyUnit and Arena, the seeds of the arenas are drawn from the seed.
+    """
+    player_index, enemy_index, player_setup, enemy_setup, fights, policy, seed = task
+    equipment = Equipment()
+    result = simulate_arena(
+        unit_classes[player_setup[0]], equipment.get_weapon(player_setup[1]), equipment.get_armor(player_setup[2]),
+        unit_classes[enemy_setup[0]], equipment.get_weapon(enemy_setup[1]), equipment.get_armor(enemy_setup[2]),
+        n_battles=fights, policy=policy, max_turns=MAX_TURNS, seed=seed)
+    return player_index, enemy_index, result.wins, result.draws, result.losses, result.unfinished, result.mean_turns
+
+
+def run_tournament(fights: int, processes: Optional[int] = None, policy: str = POLICY_HIT,
+                   seed: int = 0) -> dict[str, np.ndarray]:
+    """
+    The run_tournament function fights every setup against every setup in a pool of worker processes
+    and returns the results as a dictionary of arrays: the labels of the setups and matrices of the counts
+    of wins, draws, losses and unfinished fights, the win rate and the mean number of turns, where the row
+    is the setup of the player and the column is the setup of the enemy.
+    """
+    setups = get_setups()
+    size = len(setups)
+    tasks = [(i, j, setups[i], setups[j], fights, policy, matchup_seed(seed, i, j))
+             for i in range(size) for j in range(size)]
+    results = {name: np.zeros((size, size), dtype=np.int64) for name in ('wins', 'draws', 'losses', 'unfinished')}
+    mean_turns = np.zeros((size, size), dtype=np.float64)
+    with Pool(processes) as pool:
+        for i, j, wins, draws, losses, unfinished, turns in pool.imap_unordered(run_matchup, tasks, chunksize=4):
+            results['wins'][i, j] = wins
+            results['draws'][i, j] = draws
+            results['losses'][i, j] = losses
+            results['unfinished'][i, j] = unfinished
+            mean_turns[i, j] = turns
+    results['win_rate'] = results['wins'] / fights
+    results['mean_turns'] = mean_turns
+    results['setups'] = np.array(['/'.join(setup) for setup in setups])
+    return results
+
+
+def save_results(results: dict[str, np.ndarray], path: str):
+    """
+    The save_results function writes the results of the tournament to a file, the .npz format keeps
+    the matrices as they are, the .csv format writes one row per matchup.
+    """
+    if path.endswith('.npz'):
+        np.savez_compressed(path, **results)
+        return
+    setups = results['setups']
+    with open(path, 'w', encoding='utf-8', newline='') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(['player', 'enemy', 'wins', 'draws', 'losses', 'unfinished', 'win_rate', 'mean_turns'])
+        for i, j in product(range(len(setups)), repeat=2):
+            writer.writerow([setups[i], setups[j], results['wins'][i, j], results['draws'][i, j],
+                             results['losses'][i, j], results['unfinished'][i, j],
+                             f"{results['win_rate'][i, j]:.4f}", f"{results['mean_turns'][i, j]:.2f}"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fights every class, weapon and armor against each other.')
+    parser.add_argument('-n', '--fights', type=int, default=1000, help='fights per matchup')
+    parser.add_argument('-j', '--processes', type=int, default=os.cpu_count())
+    parser.add_argument('--policy', choices=POLICIES, default=POLICY_HIT)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-o', '--output', default='tournament.npz', help='.npz or .csv file')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    results = run_tournament(args.fights, processes=args.processes, policy=args.policy, seed=args.seed)
+    save_results(results, args.output)
+    print(f"{len(results['setups']) ** 2} matchups, {args.fights} fights each, "
+          f"{time.perf_counter() - started:.1f}s, saved to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
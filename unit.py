@@ -1,16 +1,24 @@
 from __future__ import annotations
 from abc import ABC, abstractmethod
+from battle_log import ACTION_HIT, ACTION_BLOCKED, ACTION_NO_STAMINA, ACTION_SKILL, ACTION_SKILL_REPEATED
 from equipment import Weapon, Armor
 from classes import UnitClass
-from random import randint
+from random import Random
 from typing import Optional, Union
 
 
+# the enemy uses its skill when randint(1, 100) is below the roll, with the chance of 9%
+ENEMY_SKILL_ROLL: int = 10
+
+
 class BaseUnit(ABC):
     """
     The BaseUnit class is an abstract class defining the fields and methods of the game character,
-    inherited from the ABC class of the abc library.
+    inherited from the ABC class of the abc library. The random number generator of the character is replaced
+    by the generator of the arena when the battle starts.
     """
+    rng: Random = Random()
+
     def __init__(self, name: str, unit_class: UnitClass):
         """
         The __init__ function defines the method of the Unit class and generates the initial values of the fields
@@ -24,6 +32,7 @@ class BaseUnit(ABC):
         self.weapon: Weapon = ...
         self.armor: Armor = ...
         self._is_skill_used: bool = False
+        self.last_action: Optional[int] = None
 
     @property
     def health_points(self) -> float:
@@ -69,7 +78,7 @@ class BaseUnit(ABC):
         in the defender's stamina when using armor. Returns the value of the damage done as a float.
         """
         self.stamina -= self.weapon.stamina_per_hit
-        damage = self.weapon.damage * self.unit_class.attack
+        damage = self.weapon.roll_damage(self.rng) * self.unit_class.attack
         if target.stamina >= target.armor.stamina_per_turn * target.unit_class.stamina:
             target.stamina -= target.armor.stamina_per_turn * target.unit_class.stamina
             damage -= target.armor.defence * target.unit_class.armor
@@ -98,12 +107,19 @@ class BaseUnit(ABC):
         As an additional argument, it takes the opponent's object on which the skill is applied. If the skill
         was used earlier, it returns a message in the form of a string, otherwise it calls the use function
         of applying the skill and returns a string characterizing the performance
-        of the skill returned by this function.
+        of the skill returned by this function. The skill is only spent when it is applied: if the stamina
+        is not sufficient, the character may use it on a later move.
         """
         if self._is_skill_used:
+            self.last_action = ACTION_SKILL_REPEATED
             return 'Навык уже был использован'
-        res = self.unit_class.skill.use(user=self, target=target)
+        skill = self.unit_class.skill
+        if not skill.is_stamina_enough(self):
+            self.last_action = ACTION_NO_STAMINA
+            return f"{self.name} попытался использовать {skill.name} но у него не хватило выносливости."
+        res = skill.use(user=self, target=target)
         self._is_skill_used = True
+        self.last_action = ACTION_SKILL
         return res
 
 
@@ -121,8 +137,10 @@ class PlayerUnit(BaseUnit):
         of the function execution as a string.
         """
         if self.stamina < self.weapon.stamina_per_hit:
+            self.last_action = ACTION_NO_STAMINA
             return f"{self.name} попытался использовать {self.weapon.name}, но у него не хватило выносливости."
         damage = self._count_damage(target)
+        self.last_action = ACTION_HIT if damage > 0 else ACTION_BLOCKED
         if damage > 0:
             return f"{self.name} используя {self.weapon.name} пробивает " \
                    f"{target.armor.name} соперника и наносит {damage} урона."
@@ -144,12 +162,22 @@ class EnemyUnit(BaseUnit):
         stamina to strike, calls the damage calculation function. Returns the result of the function execution
         as a string.
         """
-        if not self._is_skill_used and self.stamina >= self.unit_class.skill.stamina and randint(1, 100) < 10:
+        if (not self._is_skill_used and self.unit_class.skill.is_stamina_enough(self)
+                and self.rng.randint(1, 100) < ENEMY_SKILL_ROLL):
             return self.use_skill(target)
+        return self._strike(target)
 
+    def _strike(self, target: BaseUnit) -> str:
+        """
+        The _strike function defines a protected method of the EnemyUnit class, takes the player's object
+        as an argument and hits it with the weapon, if the stamina of the enemy is sufficient. Returns the result
+        of the function execution as a string.
+        """
         if self.stamina < self.weapon.stamina_per_hit:
+            self.last_action = ACTION_NO_STAMINA
             return f"{self.name} попытался использовать {self.weapon.name}, но у него не хватило выносливости."
         damage = self._count_damage(target)
+        self.last_action = ACTION_HIT if damage > 0 else ACTION_BLOCKED
         if damage > 0:
             return f"{self.name} используя {self.weapon.name} пробивает " \
                    f"ваш(у) {target.armor.name} и наносит {damage} урона."
@@ -0,0 +1,249 @@
+from __future__ import annotations
+from array import array
+from typing import Optional
+
+from classes import UnitClass, unit_classes
+from equipment import Weapon, Armor, get_catalog
+from unit import BaseUnit, PlayerUnit, EnemyUnit
+
+
+NO_ACTION: int = -1
+
+
+class UnitStore:
+    """
+    The UnitStore class keeps the state of many characters in packed typed arrays instead of separate objects:
+    health and stamina as doubles, indexes of the class, the weapon and the armor as unsigned ints, the skill
+    flag and the last action as bytes. A character takes a slot of the arrays, released slots are reused.
+    The characters are accessed through thin PlayerHandle and EnemyHandle objects.
+    """
+    def __init__(self):
+        """
+        The "__init__" method is called when initializing the class object, takes the tables of classes
+        and equipment from unit_classes and the equipment catalog and creates empty arrays. The items
+        of a SQLite catalog are added to the tables only when the characters are equipped with them.
+        """
+        catalog = get_catalog()
+        self.classes: list[UnitClass] = list(unit_classes.values())
+        self.weapons: list[Weapon] = list(catalog.data.weapons) if catalog.data else []
+        self.armors: list[Armor] = list(catalog.data.armors) if catalog.data else []
+        self._class_indexes: dict[str, int] = {unit_class.name: i for i, unit_class in enumerate(self.classes)}
+        self._weapon_indexes: dict[int, int] = {weapon.id: i for i, weapon in enumerate(self.weapons)}
+        self._armor_indexes: dict[int, int] = {armor.id: i for i, armor in enumerate(self.armors)}
+        self.names: list[Optional[str]] = []
+        self.hp: array = array('d')
+        self.stamina: array = array('d')
+        self.class_index: array = array('I')
+        self.weapon_index: array = array('I')
+        self.armor_index: array = array('I')
+        self.skill_used: array = array('B')
+        self.last_action: array = array('b')
+        self._free: list[int] = []
+
+    def __len__(self) -> int:
+        return len(self.names) - len(self._free)
+
+    @property
+    def nbytes(self) -> int:
+        """
+        The nbytes function defines the property method of the UnitStore class and returns the size
+        of the arrays of the store in bytes, without the names of the characters.
+        """
+        return sum(values.itemsize * len(values) for values in (
+            self.hp, self.stamina, self.class_index, self.weapon_index, self.armor_index,
+            self.skill_used, self.last_action))
+
+    def get_weapon_index(self, weapon: Weapon) -> int:
+        """
+        The get_weapon_index function defines a method of the UnitStore class, takes a weapon and returns
+        its index in the table of weapons of the store, adding it to the table if necessary.
+        """
+        index = self._weapon_indexes.get(weapon.id)
+        if index is None or self.weapons[index] != weapon:
+            index = len(self.weapons)
+            self.weapons.append(weapon)
+            self._weapon_indexes[weapon.id] = index
+        return index
+
+    def get_armor_index(self, armor: Armor) -> int:
+        """
+        The get_armor_index function defines a method of the UnitStore class, takes an armor and returns
+        its index in the table of armors of the store, adding it to the table if necessary.
+        """
+        index = self._armor_indexes.get(armor.id)
+        if index is None or self.armors[index] != armor:
+            index = len(self.armors)
+            self.armors.append(armor)
+            self._armor_indexes[armor.id] = index
+        return index
+
+    def get_class_index(self, unit_class: UnitClass) -> int:
+        """
+        The get_class_index function defines a method of the UnitStore class, takes a character class
+        and returns its index in the table of classes of the store, adding it to the table if necessary.
+        """
+        index = self._class_indexes.get(unit_class.name)
+        if index is None or self.classes[index] is not unit_class:
+            index = len(self.classes)
+            self.classes.append(unit_class)
+            self._class_indexes[unit_class.name] = index
+        return index
+
+    def _add(self, name: str, unit_class: UnitClass, weapon: Weapon, armor: Armor) -> int:
+        """
+        The _add function defines a protected method of the UnitStore class, takes the name, the class
+        and the equipment of a character, fills a free slot with its initial state and returns the slot.
+        """
+        class_index = self.get_class_index(unit_class)
+        weapon_index = self.get_weapon_index(weapon)
+        armor_index = self.get_armor_index(armor)
+        if self._free:
+            slot = self._free.pop()
+            self.names[slot] = name
+            self.hp[slot] = unit_class.max_health
+            self.stamina[slot] = unit_class.max_stamina
+            self.class_index[slot] = class_index
+            self.weapon_index[slot] = weapon_index
+            self.armor_index[slot] = armor_index
+            self.skill_used[slot] = 0
+            self.last_action[slot] = NO_ACTION
+            return slot
+        self.names.append(name)
+        self.hp.append(unit_class.max_health)
+        self.stamina.append(unit_class.max_stamina)
+        self.class_index.append(class_index)
+        self.weapon_index.append(weapon_index)
+        self.armor_index.append(armor_index)
+        self.skill_used.append(0)
+        self.last_action.append(NO_ACTION)
+        return len(self.names) - 1
+
+    def add_player(self, name: str, unit_class: UnitClass, weapon: Weapon, armor: Armor) -> PlayerHandle:
+        """
+        The add_player function defines a method of the UnitStore class, takes the name, the class
+        and the equipment of the player and returns the handle of the player.
+        """
+        return PlayerHandle(self, self._add(name, unit_class, weapon, armor))
+
+    def add_enemy(self, name: str, unit_class: UnitClass, weapon: Weapon, armor: Armor) -> EnemyHandle:
+        """
+        The add_enemy function defines a method of the UnitStore class, takes the name, the class
+        and the equipment of the enemy and returns the handle of the enemy.
+        """
+        return EnemyHandle(self, self._add(name, unit_class, weapon, armor))
+
+    def remove(self, handle: UnitHandle):
+        """
+        The remove function defines a method of the UnitStore class, takes the handle of a character
+        and releases its slot. The handle must not be used after that.
+        """
+        self.names[handle.slot] = None
+        self._free.append(handle.slot)
+
+
+class UnitHandle:
+    """
+    The UnitHandle class is a view of one slot of UnitStore with the same interface as BaseUnit.
+    The game logic of BaseUnit is reused as is, the attributes it reads and writes are redirected
+    to the arrays of the store.
+    """
+    __slots__ = ('store', 'slot', 'rng')
+
+    def __init__(self, store: UnitStore, slot: int):
+        """
+        The "__init__" method is called when initializing the class object, takes the store and the slot
+        of the character.
+        """
+        self.store: UnitStore = store
+        self.slot: int = slot
+        self.rng = BaseUnit.rng
+
+    @property
+    def name(self) -> str:
+        return self.store.names[self.slot]
+
+    @property
+    def hp(self) -> float:
+        return self.store.hp[self.slot]
+
+    @hp.setter
+    def hp(self, value: float):
+        self.store.hp[self.slot] = value
+
+    @property
+    def stamina(self) -> float:
+        return self.store.stamina[self.slot]
+
+    @stamina.setter
+    def stamina(self, value: float):
+        self.store.stamina[self.slot] = value
+
+    @property
+    def unit_class(self) -> UnitClass:
+        return self.store.classes[self.store.class_index[self.slot]]
+
+    @property
+    def weapon(self) -> Weapon:
+        return self.store.weapons[self.store.weapon_index[self.slot]]
+
+    @property
+    def armor(self) -> Armor:
+        return self.store.armors[self.store.armor_index[self.slot]]
+
+    @property
+    def _is_skill_used(self) -> bool:
+        return bool(self.store.skill_used[self.slot])
+
+    @_is_skill_used.setter
+    def _is_skill_used(self, value: bool):
+        self.store.skill_used[self.slot] = value
+
+    @property
+    def last_action(self) -> Optional[int]:
+        action = self.store.last_action[self.slot]
+        return None if action == NO_ACTION else action
+
+    @last_action.setter
+    def last_action(self, value: Optional[int]):
+        self.store.last_action[self.slot] = NO_ACTION if value is None else value
+
+    def equip_weapon(self, weapon: Weapon) -> str:
+        """
+        The equip_weapon function defines a method of the UnitHandle class, takes a weapon, stores its index
+        in the slot of the character and returns the result as a string.
+        """
+        self.store.weapon_index[self.slot] = self.store.get_weapon_index(weapon)
+        return f"{self.name} экипирован оружием {weapon.name}"
+
+    def equip_armor(self, armor: Armor) -> str:
+        """
+        The equip_armor function defines a method of the UnitHandle class, takes an armor, stores its index
+        in the slot of the character and returns the result as a string.
+        """
+        self.store.armor_index[self.slot] = self.store.get_armor_index(armor)
+        return f"{self.name} экипирован броней {armor.name}"
+
+    health_points = BaseUnit.health_points
+    stamina_points = BaseUnit.stamina_points
+    _count_damage = BaseUnit._count_damage
+    get_damage = BaseUnit.get_damage
+    use_skill = BaseUnit.use_skill
+
+
+class PlayerHandle(UnitHandle):
+    """
+    The PlayerHandle class is a handle of the player in UnitStore, it hits as PlayerUnit.
+    """
+    __slots__ = ()
+
+    hit = PlayerUnit.hit
+
+
+class EnemyHandle(UnitHandle):
+    """
+    The EnemyHandle class is a handle of the enemy in UnitStore, it hits as EnemyUnit.
+    """
+    __slots__ = ()
+
+    hit = EnemyUnit.hit
+    _strike = EnemyUnit._strike
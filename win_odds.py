@@ -0,0 +1,437 @@
+from collections import OrderedDict
+from time import perf_counter
+from typing import NamedTuple, Optional
+import math
+import threading
+
+import numpy as np
+
+from base import Arena, MAX_AUTO_TURNS
+from metrics import registry as metrics_registry
+from policies import POLICY_HIT, POLICY_SKILL_FIRST, POLICY_SKILL_WHEN_KILLS
+from simulator import FighterParams
+from unit import BaseUnit, EnemyUnit, ENEMY_SKILL_ROLL
+
+
+# EnemyUnit uses the skill when randint(1, 100) is below ENEMY_SKILL_ROLL
+ENEMY_SKILL_CHANCE: float = (ENEMY_SKILL_ROLL - 1) / 100
+MAX_SOLVERS: int = 256
+MAX_STATES: int = 100_000
+MAX_PENDING: int = 64
+MAX_BATTLES: int = 10_000
+EPSILON: float = 1e-12
+
+odds_duration = metrics_registry.histogram('win_odds_solve_duration_seconds',
+                                           'Time spent computing the odds of a battle state.')
+odds_cache_hits = metrics_registry.counter('win_odds_cache_hits_total', 'Odds served from the cache.')
+odds_cache_misses = metrics_registry.counter('win_odds_cache_misses_total', 'Odds computed by the solver.')
+odds_dropped = metrics_registry.counter('win_odds_dropped_total',
+                                       'States forgotten by the background solver before it got to them.')
+
+
+class Odds(NamedTuple):
+    """
+    The Odds class is a named tuple with the probabilities of a win, a draw and a loss of the player.
+    The battles that would last longer than MAX_AUTO_TURNS moves are counted as draws.
+    """
+    win: float
+    draw: float
+    loss: float
+
+
+class LiveOdds(NamedTuple):
+    """
+    The LiveOdds class is a named tuple with the odds of a running battle, the number of the moves made
+    in the battle before the state the odds were computed for, and whether the battle has moved on since.
+    """
+    win: float
+    draw: float
+    loss: float
+    turn: int
+    stale: bool
+
+
+class BattleState(NamedTuple):
+    """
+    The BattleState class is a named tuple with the state of a battle before the move of the player:
+    the health of both characters in tenths, their stamina and their skill flags. The game rounds the damage
+    to tenths, so the health is discretized without a loss. The stamina is kept as it is, because the game
+    compares the stamina with the costs after a chain of subtractions of floats, and a value like 1.7999999
+    is not enough for a hit costing 1.8.
+    """
+    player_hp: int
+    player_stamina: float
+    player_skill_used: bool
+    enemy_hp: int
+    enemy_stamina: float
+    enemy_skill_used: bool
+
+    @classmethod
+    def from_units(cls, player: BaseUnit, enemy: BaseUnit) -> 'BattleState':
+        return cls(round(player.hp * 10), player.stamina, player._is_skill_used,
+                   round(enemy.hp * 10), enemy.stamina, enemy._is_skill_used)
+
+
+def damage_distribution(attacker: FighterParams, defender: FighterParams, armor: bool) -> list[tuple[int, float]]:
+    """
+    The damage_distribution function returns the exact distribution of the damage of one hit in tenths
+    of health as a list of pairs of the damage and its probability. The roll of the weapon is uniform and rounded
+    to tenths like Weapon.roll_damage, so the probability of a rounded value is the share of the range that
+    rounds to it, and the damage is computed from the value with the same operations as BaseUnit._count_damage.
+    """
+    low, high = attacker.min_damage, attacker.max_damage
+    rolls = []
+    if high <= low:
+        rolls.append((round(low, 1), 1.0))
+    else:
+        for tenths in range(math.floor(low * 10), math.ceil(high * 10) + 1):
+            share = min(high, tenths / 10 + 0.05) - max(low, tenths / 10 - 0.05)
+            if share > 0:
+                rolls.append((round(tenths / 10, 1), share / (high - low)))
+    damages: dict[int, float] = {}
+    for roll, probability in rolls:
+        damage = roll * attacker.attack
+        if armor:
+            damage -= defender.defence
+        damage = round(damage, 1)
+        tenths = round(damage * 10) if damage > 0 else 0
+        damages[tenths] = damages.get(tenths, 0.0) + probability
+    return sorted(damages.items())
+
+
+def _hit(health: np.ndarray, distribution: list[tuple[int, float]]) -> np.ndarray:
+    """
+    The _hit function applies the distribution of the damage to the rows of distributions of health,
+    where the column is the health in tenths, and returns the probability of the death of every row.
+    The health of a dead character is not kept, so the rows lose the mass of the death.
+    """
+    size = health.shape[1]
+    result = np.zeros_like(health)
+    below = np.cumsum(health, axis=1)
+    killed = np.zeros(health.shape[0])
+    for damage, probability in distribution:
+        if damage == 0:
+            result += probability * health
+            continue
+        if damage < size:
+            result[:, 1:size - damage] += probability * health[:, 1 + damage:]
+        killed += probability * below[:, min(damage, size - 1)]
+    health[:] = result
+    return killed
+
+
+def _strike(health: np.ndarray, damage: int) -> np.ndarray:
+    """
+    The _strike function applies the fixed damage of a skill to the rows of distributions of health
+    and returns the probability of the death of every row.
+    """
+    killed = health[:, 1:damage + 1].sum(axis=1)
+    rest = health[:, 1 + damage:].copy()
+    health[:, 1:] = 0
+    health[:, 1:1 + rest.shape[1]] = rest
+    return killed
+
+
+def _top(health: np.ndarray) -> int:
+    """
+    The _top function returns the number of the columns of the distributions of health up to the highest
+    health any row still has.
+    """
+    columns = np.flatnonzero(health.any(axis=0))
+    return int(columns[-1]) + 1 if len(columns) else 1
+
+
+class OddsSolver:
+    """
+    The OddsSolver class computes the exact odds of the battles of one matchup: the classes and the equipment
+    of the player and the enemy and the policy the player is assumed to follow. The enemy is the EnemyUnit,
+    which uses its skill with the chance ENEMY_SKILL_CHANCE. The solver uses the fact that, given the turns
+    on which the skills are used, the stamina of both characters changes deterministically and the health
+    of each character only depends on the rolls of the other one. The battle is followed forward by turns
+    as a set of branches, one for every turn the enemy may have used its skill on, each with the independent
+    distributions of the health of both characters, so a turn costs one shift of the distributions by every
+    possible damage instead of a pass over every pair of health values.
+    """
+    def __init__(self, player: FighterParams, enemy: FighterParams, policy: str = POLICY_HIT,
+                 regeneration: float = Arena.STAMINA_PER_ROUND, max_turns: int = MAX_AUTO_TURNS):
+        """
+        The "__init__" method is called when initializing the class object, takes the numbers of the player
+        and the enemy, the policy of the player, the stamina regenerated per round and the maximum number of turns.
+        """
+        self.policy: str = policy
+        self.max_turns: int = max_turns
+        self.regeneration: float = regeneration
+        self.player_damage = [damage_distribution(player, enemy, False), damage_distribution(player, enemy, True)]
+        self.enemy_damage = [damage_distribution(enemy, player, False), damage_distribution(enemy, player, True)]
+        self.player_cost, self.enemy_cost = player.stamina_per_hit, enemy.stamina_per_hit
+        self.player_armor, self.enemy_armor = player.armor_stamina, enemy.armor_stamina
+        self.player_max, self.enemy_max = player.max_stamina, enemy.max_stamina
+        self.player_skill_cost, self.enemy_skill_cost = player.skill_stamina, enemy.skill_stamina
+        self.player_skill_damage = round(player.skill_damage * 10)
+        self.enemy_skill_damage = round(enemy.skill_damage * 10)
+
+    def solve(self, state: BattleState) -> Odds:
+        """
+        The solve function defines a method of the OddsSolver class, takes the state of the battle before
+        the move of the player and returns the odds of the battle. The branches are followed until the chance
+        of the battle going on is below EPSILON or the turns run out.
+        """
+        if state.enemy_hp <= 0 or state.player_hp <= 0:
+            if state.enemy_hp <= 0:
+                return Odds(0.0, 1.0, 0.0) if state.player_hp <= 0 else Odds(1.0, 0.0, 0.0)
+            return Odds(0.0, 0.0, 1.0)
+        player_health = np.zeros((1, state.player_hp + 1))
+        player_health[0, state.player_hp] = 1.0
+        enemy_health = np.zeros((1, state.enemy_hp + 1))
+        enemy_health[0, state.enemy_hp] = 1.0
+        weight = np.ones(1)
+        player_stamina = np.array([state.player_stamina], dtype=np.float64)
+        enemy_stamina = np.array([state.enemy_stamina], dtype=np.float64)
+        player_skill = np.array([state.player_skill_used])
+        enemy_skill = np.array([state.enemy_skill_used])
+        win = loss = 0.0
+        for _ in range(self.max_turns):
+            killed = np.zeros(len(weight))
+            # the move of the player
+            if self.policy == POLICY_SKILL_FIRST:
+                skill = ~player_skill
+            elif self.policy == POLICY_SKILL_WHEN_KILLS:
+                skill = ~player_skill & (player_stamina > self.player_skill_cost)
+                if skill.any():
+                    low = min(self.player_skill_damage, enemy_health.shape[1] - 1) + 1
+                    killed[skill] += enemy_health[skill, 1:low].sum(axis=1)
+                    enemy_health[skill, 1:low] = 0
+                skill = np.zeros(len(weight), dtype=bool)
+            else:
+                skill = np.zeros(len(weight), dtype=bool)
+            if skill.any():
+                works = skill & (player_stamina > self.player_skill_cost)
+                player_skill = player_skill | works
+                if works.any():
+                    player_stamina = np.where(works, player_stamina - self.player_skill_cost, player_stamina)
+                    rows = enemy_health[works]
+                    killed[works] += _strike(rows, self.player_skill_damage)
+                    enemy_health[works] = rows
+            hit = ~skill & (player_stamina >= self.player_cost)
+            armor = hit & (enemy_stamina >= self.enemy_armor)
+            for mask, distribution in ((hit & ~armor, self.player_damage[0]), (armor, self.player_damage[1])):
+                if mask.any():
+                    rows = enemy_health[mask]
+                    killed[mask] += _hit(rows, distribution)
+                    enemy_health[mask] = rows
+            player_stamina = np.where(hit, player_stamina - self.player_cost, player_stamina)
+            enemy_stamina = np.where(armor, enemy_stamina - self.enemy_armor, enemy_stamina)
+            player_alive = player_health.sum(axis=1)
+            win += float(np.dot(weight * killed, player_alive))
+
+            # the regeneration and the move of the enemy
+            player_stamina = np.minimum(player_stamina + self.regeneration, self.player_max)
+            enemy_stamina = np.minimum(enemy_stamina + self.regeneration, self.enemy_max)
+            killed = np.zeros(len(weight))
+            roll = ~enemy_skill & (enemy_stamina > self.enemy_skill_cost)
+            if roll.any():
+                new = np.flatnonzero(roll)
+                weight = np.concatenate([np.where(roll, weight * (1 - ENEMY_SKILL_CHANCE), weight),
+                                         weight[new] * ENEMY_SKILL_CHANCE])
+                player_health = np.concatenate([player_health, player_health[new]])
+                enemy_health = np.concatenate([enemy_health, enemy_health[new]])
+                player_stamina = np.concatenate([player_stamina, player_stamina[new]])
+                enemy_stamina = np.concatenate([enemy_stamina, enemy_stamina[new]])
+                player_skill = np.concatenate([player_skill, player_skill[new]])
+                enemy_skill = np.concatenate([enemy_skill, np.ones(len(new), dtype=bool)])
+                killed = np.zeros(len(weight))
+                skill = np.zeros(len(weight), dtype=bool)
+                skill[-len(new):] = True
+                enemy_stamina = np.where(skill, enemy_stamina - self.enemy_skill_cost, enemy_stamina)
+                rows = player_health[skill]
+                killed[skill] += _strike(rows, self.enemy_skill_damage)
+                player_health[skill] = rows
+            else:
+                skill = np.zeros(len(weight), dtype=bool)
+            hit = ~skill & (enemy_stamina >= self.enemy_cost)
+            armor = hit & (player_stamina >= self.player_armor)
+            for mask, distribution in ((hit & ~armor, self.enemy_damage[0]), (armor, self.enemy_damage[1])):
+                if mask.any():
+                    rows = player_health[mask]
+                    killed[mask] += _hit(rows, distribution)
+                    player_health[mask] = rows
+            enemy_stamina = np.where(hit, enemy_stamina - self.enemy_cost, enemy_stamina)
+            player_stamina = np.where(armor, player_stamina - self.player_armor, player_stamina)
+            enemy_alive = enemy_health.sum(axis=1)
+            loss += float(np.dot(weight * killed, enemy_alive))
+
+            going_on = weight * enemy_alive * player_health.sum(axis=1)
+            if going_on.sum() < EPSILON:
+                break
+            # the branches that are over and the health nobody has any more are dropped
+            keep = going_on >= EPSILON * EPSILON
+            if not keep.all():
+                weight, player_stamina, enemy_stamina = weight[keep], player_stamina[keep], enemy_stamina[keep]
+                player_skill, enemy_skill = player_skill[keep], enemy_skill[keep]
+                player_health, enemy_health = player_health[keep], enemy_health[keep]
+            player_health = player_health[:, :_top(player_health)]
+            enemy_health = enemy_health[:, :_top(enemy_health)]
+        return Odds(win, max(0.0, 1.0 - win - loss), loss)
+
+
+class OddsCache:
+    """
+    The OddsCache class keeps the solvers of the matchups and the computed odds of the states shared by all
+    sessions. The number of the solvers and of the states are limited, the least recently used ones are evicted.
+    The requests do not wait for the solver: peek returns only the computed odds and leaves a missing state
+    to a background thread, which solves the most recently requested states first and forgets the oldest ones
+    when more than max_pending of them wait, because the battles have moved past them anyway. For every battle
+    the odds of its latest solved move are kept, to be shown until its current state is solved.
+    """
+    def __init__(self, max_solvers: int = MAX_SOLVERS, max_states: int = MAX_STATES,
+                 max_pending: int = MAX_PENDING, max_battles: int = MAX_BATTLES):
+        self.max_solvers: int = max_solvers
+        self.max_states: int = max_states
+        self.max_pending: int = max_pending
+        self.max_battles: int = max_battles
+        self._solvers: OrderedDict[tuple, OddsSolver] = OrderedDict()
+        self._odds: OrderedDict[tuple, Odds] = OrderedDict()
+        self._pending: OrderedDict[tuple, tuple[BaseUnit, BaseUnit, Optional[tuple], int]] = OrderedDict()
+        self._latest: OrderedDict[tuple, tuple[int, Odds]] = OrderedDict()
+        self._lock: threading.Lock = threading.Lock()
+        self._wake: threading.Condition = threading.Condition(self._lock)
+        self._thread: Optional[threading.Thread] = None
+
+    def __len__(self) -> int:
+        return len(self._odds)
+
+    def _solver(self, key: tuple, player: BaseUnit, enemy: BaseUnit, policy: str) -> OddsSolver:
+        with self._lock:
+            solver = self._solvers.get(key)
+            if solver is not None:
+                self._solvers.move_to_end(key)
+                return solver
+        solver = OddsSolver(FighterParams.from_equipment(player.unit_class, player.weapon, player.armor),
+                            FighterParams.from_equipment(enemy.unit_class, enemy.weapon, enemy.armor), policy)
+        with self._lock:
+            self._solvers[key] = solver
+            while len(self._solvers) > self.max_solvers:
+                self._solvers.popitem(last=False)
+        return solver
+
+    @staticmethod
+    def _key(player: BaseUnit, enemy: BaseUnit, policy: str) -> tuple[tuple, BattleState]:
+        matchup = (player.unit_class.name, player.weapon.name, player.armor.name,
+                   enemy.unit_class.name, enemy.weapon.name, enemy.armor.name, policy)
+        return matchup, BattleState.from_units(player, enemy)
+
+    def _cached(self, key: tuple[tuple, BattleState]) -> Optional[Odds]:
+        with self._lock:
+            odds = self._odds.get(key)
+            if odds is not None:
+                self._odds.move_to_end(key)
+        if odds is not None:
+            odds_cache_hits.inc()
+        return odds
+
+    def _solve(self, key: tuple[tuple, BattleState], player: BaseUnit, enemy: BaseUnit) -> Odds:
+        odds_cache_misses.inc()
+        started = perf_counter()
+        odds = self._solver(key[0], player, enemy, key[0][-1]).solve(key[1])
+        odds_duration.observe(perf_counter() - started)
+        with self._lock:
+            self._odds[key] = odds
+            while len(self._odds) > self.max_states:
+                self._odds.popitem(last=False)
+        return odds
+
+    def get(self, player: BaseUnit, enemy: BaseUnit, policy: str = POLICY_SKILL_WHEN_KILLS) -> Odds:
+        """
+        The get function defines a method of the OddsCache class, takes the player and the enemy of a battle
+        before the move of the player and the policy of the player, and returns the odds of the battle,
+        solving the state in the calling thread if it is not in the cache.
+        """
+        key = self._key(player, enemy, policy)
+        odds = self._cached(key)
+        return odds if odds is not None else self._solve(key, player, enemy)
+
+    def _remember(self, battle: Optional[tuple], turn: int, odds: Odds):
+        """
+        The _remember function defines a protected method of the OddsCache class, keeps the odds of the latest
+        solved move of the battle, the least recently used battles are forgotten above max_battles of them.
+        """
+        if battle is None:
+            return
+        with self._lock:
+            latest = self._latest.get(battle)
+            if latest is None or latest[0] <= turn:
+                self._latest[battle] = (turn, odds)
+            self._latest.move_to_end(battle)
+            while len(self._latest) > self.max_battles:
+                self._latest.popitem(last=False)
+
+    def latest(self, battle: tuple) -> Optional[tuple[int, Odds]]:
+        """
+        The latest function defines a method of the OddsCache class, takes the id of a battle passed to peek
+        and returns the move and the odds of its latest solved state, or None if none is solved yet.
+        """
+        with self._lock:
+            return self._latest.get(battle)
+
+    def peek(self, player: BaseUnit, enemy: BaseUnit, policy: str = POLICY_SKILL_WHEN_KILLS,
+             battle: Optional[tuple] = None, turn: int = 0) -> Optional[Odds]:
+        """
+        The peek function defines a method of the OddsCache class, takes the same arguments as get, optionally
+        the id of the battle and the number of its moves made, and returns the odds of the battle if they are
+        in the cache. Otherwise it returns None at once and queues the state for the background thread, so the odds
+        are in the cache by one of the next requests. The odds of the battle, also the ones solved in the background,
+        are remembered as its latest ones.
+        """
+        key = self._key(player, enemy, policy)
+        odds = self._cached(key)
+        if odds is not None:
+            self._remember(battle, turn, odds)
+            return odds
+        with self._lock:
+            if key not in self._odds:
+                # the characters do not change their classes and equipment, the state is in the key
+                self._pending[key] = (player, enemy, battle, turn)
+                self._pending.move_to_end(key)
+                while len(self._pending) > self.max_pending:
+                    self._pending.popitem(last=False)
+                    odds_dropped.inc()
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='win-odds', daemon=True)
+                    self._thread.start()
+                self._wake.notify()
+        return None
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._pending:
+                    self._wake.wait()
+                key, (player, enemy, battle, turn) = self._pending.popitem()
+            self._remember(battle, turn, self._solve(key, player, enemy))
+
+
+odds_cache: OddsCache = OddsCache()
+
+
+def battle_odds(arena: Arena, policy: str = POLICY_SKILL_WHEN_KILLS) -> Optional[LiveOdds]:
+    """
+    The battle_odds function returns the odds of the running battle of the arena for the player following
+    the policy, or None if no battle is running or the enemy chooses its moves otherwise than EnemyUnit,
+    like SmartEnemyUnit. The request does not wait for the solver: while the odds of the current state
+    are being computed, the odds of the latest solved move of the same battle are returned marked as stale,
+    or None if no move of the battle is solved yet. The battle is identified by its seed and the matchup,
+    so the odds are found also when every request loads the game from SQLite.
+    """
+    if not arena.game_is_running or type(arena.enemy) is not EnemyUnit:
+        return None
+    player, enemy = arena.player, arena.enemy
+    turn = len(arena.log) // 2
+    battle = (OddsCache._key(player, enemy, policy)[0], arena.seed)
+    odds = odds_cache.peek(player, enemy, policy, battle, turn)
+    if odds is not None:
+        return LiveOdds(*odds, turn=turn, stale=False)
+    latest = odds_cache.latest(battle)
+    if latest is None:
+        return None
+    latest_turn, odds = latest
+    return LiveOdds(*odds, turn=latest_turn, stale=latest_turn != turn)